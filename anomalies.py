@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+from database import VARIAVEIS
+from forecasting import rolling_mean
+from resampling import runs
+
+# Janela (dias) da média móvel circular que suaviza a climatologia
+JANELA_CLIMATOLOGIA = 31
+
+# Janela (dias) do z-score móvel
+JANELA_ZSCORE = 7
+
+# Limiar das ondas de calor/frio: ~percentil 90/10 de uma normal
+Z_ONDA = 1.2816
+DURACAO_MINIMA_ONDA = 3
+
+# Veranico: dias seguidos com menos de LIMIAR_DIA_SECO mm de chuva
+LIMIAR_DIA_SECO = 1.0
+DURACAO_MINIMA_SECA = 15
+
+
+def day_of_year_365(datas):
+    """Dia do ano de 0 a 364; em anos bissextos 29/02 divide o índice com 28/02"""
+    datas = pd.DatetimeIndex(datas)
+    dia = datas.dayofyear.to_numpy() - 1
+    return dia - (datas.is_leap_year & (dia >= 59)).astype(int)
+
+
+def circular_window_sum(valores, janela):
+    """Soma móvel centrada que dá a volta no fim do ano"""
+    meia = janela // 2
+    estendido = np.concatenate([valores[-meia:], valores, valores[:meia]])
+    return np.convolve(estendido, np.ones(janela), mode='valid')
+
+
+def daily_climatology(datas, valores, janela=JANELA_CLIMATOLOGIA):
+    """
+    Normal climatológica suavizada por dia do ano: média e desvio padrão
+    agregando todas as observações na janela centrada em cada dia.
+    """
+    valores = np.asarray(valores, dtype='float64')
+    dia = day_of_year_365(datas)
+    valido = np.isfinite(valores)
+    x = valores[valido]
+
+    n = np.bincount(dia[valido], minlength=365).astype('float64')
+    soma = np.bincount(dia[valido], weights=x, minlength=365)
+    soma2 = np.bincount(dia[valido], weights=x * x, minlength=365)
+    n, soma, soma2 = (circular_window_sum(a, janela) for a in (n, soma, soma2))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = soma / n
+        variancia = (soma2 / n - media ** 2) * n / (n - 1)
+        desvio = np.sqrt(np.maximum(variancia, 0.0))
+    desvio[desvio == 0] = np.nan
+    return media, desvio
+
+
+def _eventos(tipo, mascara, excesso, calendario, duracao_minima):
+    """Sequências com a duração mínima, com intensidade média e marcação diária"""
+    inicios, fins = runs(mascara)
+    duracao = fins - inicios
+    manter = duracao >= duracao_minima
+    inicios, fins, duracao = inicios[manter], fins[manter], duracao[manter]
+
+    acumulado = np.concatenate([[0.0], np.cumsum(np.nan_to_num(excesso))])
+    intensidade = (acumulado[fins] - acumulado[inicios]) / np.maximum(duracao, 1)
+
+    marca = np.zeros(len(mascara) + 1)
+    np.add.at(marca, inicios, 1)
+    np.add.at(marca, fins, -1)
+    em_evento = np.cumsum(marca)[:len(mascara)] > 0
+
+    eventos = pd.DataFrame({
+        'tipo': tipo,
+        'inicio': calendario[inicios],
+        'fim': calendario[fins - 1],
+        'duracao': duracao,
+        'intensidade': np.round(intensidade, 2)
+    })
+    return eventos, em_evento
+
+
+def compute_anomalies(df, variaveis=VARIAVEIS):
+    """
+    Pontua todo o histórico contra a normal por dia do ano e detecta ondas
+    de calor/frio e veranicos. Tudo em operações vetoriais sobre um
+    calendário diário contínuo.
+
+    Retorna um dicionário com 'climatologia' (365 dias), 'scores' (por data)
+    e 'eventos' (uma linha por evento). A intensidade das ondas é o excesso
+    médio além do limiar (°C); a dos veranicos, a chuva média diária (mm).
+    """
+    df = df.dropna(subset=['DATA'])
+    variaveis = [v for v in variaveis if v in df.columns]
+    calendario = pd.date_range(df['DATA'].min(), df['DATA'].max(), freq='D')
+    diario = df.groupby('DATA')[variaveis].mean().reindex(calendario)
+    dia = day_of_year_365(calendario)
+
+    climatologia = pd.DataFrame(index=pd.RangeIndex(365, name='DIA_DO_ANO'))
+    scores = pd.DataFrame({'DATA': calendario})
+    limites = {}
+    for var in variaveis:
+        x = diario[var].to_numpy(dtype='float64')
+        media, desvio = daily_climatology(calendario, x)
+        climatologia[f'{var}_MEDIA'] = media
+        climatologia[f'{var}_DESVIO'] = desvio
+
+        z = (x - media[dia]) / desvio[dia]
+        scores[var] = x
+        scores[f'{var}_ANOMALIA'] = x - media[dia]
+        scores[f'{var}_Z'] = z
+        scores[f'{var}_Z_MOVEL'] = rolling_mean(z, JANELA_ZSCORE)
+        limites[var] = (x, media[dia], desvio[dia])
+
+    eventos = []
+    if 'TEMPERATURA_MAXIMA' in limites:
+        x, media, desvio = limites['TEMPERATURA_MAXIMA']
+        limiar = media + Z_ONDA * desvio
+        with np.errstate(invalid='ignore'):
+            mascara = x > limiar
+        ev, scores['ONDA_DE_CALOR'] = _eventos('Onda de calor', mascara, x - limiar,
+                                               calendario, DURACAO_MINIMA_ONDA)
+        eventos.append(ev)
+
+    if 'TEMPERATURA_MINIMA' in limites:
+        x, media, desvio = limites['TEMPERATURA_MINIMA']
+        limiar = media - Z_ONDA * desvio
+        with np.errstate(invalid='ignore'):
+            mascara = x < limiar
+        ev, scores['ONDA_DE_FRIO'] = _eventos('Onda de frio', mascara, limiar - x,
+                                              calendario, DURACAO_MINIMA_ONDA)
+        eventos.append(ev)
+
+    if 'PRECIPITACAO' in limites:
+        x = limites['PRECIPITACAO'][0]
+        with np.errstate(invalid='ignore'):
+            mascara = x < LIMIAR_DIA_SECO
+        ev, scores['VERANICO'] = _eventos('Veranico', mascara, x,
+                                          calendario, DURACAO_MINIMA_SECA)
+        eventos.append(ev)
+
+    eventos = pd.concat(eventos, ignore_index=True) if eventos else pd.DataFrame(
+        columns=['tipo', 'inicio', 'fim', 'duracao', 'intensidade'])
+    eventos = eventos.sort_values('inicio', ascending=False, ignore_index=True)
+
+    return {
+        'climatologia': climatologia,
+        'scores': scores,
+        'eventos': eventos
+    }
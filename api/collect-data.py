@@ -1,18 +1,166 @@
+import io
 import os
+import sys
+import time
+import resource
 import requests
 import pandas as pd
 import psycopg2
 from psycopg2.extras import execute_values
 import zipfile
 import tempfile
-import glob
 from datetime import datetime
+from contextlib import contextmanager
 import json
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import bump_data_watermark, is_sqlite, record_collector_run
+from online_model import stored_values, update_online_models
+from perf import span
+from resampling import refresh_gap_report
+from stations import attach_station, configured_stations, is_configured, parse_station_header, upsert_stations
+from year_matrix import refresh_year_matrices
+
+# Linhas do CSV lidas, convertidas e gravadas por lote: a memória da ingestão
+# fica limitada ao lote, qualquer que seja o tamanho do arquivo
+TAMANHO_LOTE = int(os.environ.get('COLETOR_TAMANHO_LOTE', '5000'))
+
+# Ordem dos campos em cada registro inserido
+COLUNAS_REGISTRO = [
+    'DATA', 'HORA', 'ESTACAO', 'NOME_DA_ESTACAO', 'UF', 'REGIAO',
+    'LATITUDE', 'LONGITUDE', 'ALTITUDE', 'TEMPERATURA_MAXIMA',
+    'TEMPERATURA_MINIMA', 'TEMPERATURA_MEDIA', 'UMIDADE_RELATIVA',
+    'PRECIPITACAO', 'VELOCIDADE_VENTO', 'PRESSAO_ATMOSFERICA'
+]
+
+INSERT_QUERY = """
+INSERT INTO dados_meteorologicos (
+    data, hora, estacao, nome_estacao, uf, regiao,
+    latitude, longitude, altitude, temperatura_maxima,
+    temperatura_minima, temperatura_media, umidade_relativa,
+    precipitacao, velocidade_vento, pressao_atmosferica
+) VALUES %s
+ON CONFLICT (data, estacao) DO UPDATE SET
+    hora = EXCLUDED.hora,
+    temperatura_maxima = EXCLUDED.temperatura_maxima,
+    temperatura_minima = EXCLUDED.temperatura_minima,
+    temperatura_media = EXCLUDED.temperatura_media,
+    umidade_relativa = EXCLUDED.umidade_relativa,
+    precipitacao = EXCLUDED.precipitacao,
+    velocidade_vento = EXCLUDED.velocidade_vento,
+    pressao_atmosferica = EXCLUDED.pressao_atmosferica
+"""
+
+def build_records(df_sjc):
+    """Converte as linhas do CSV do INMET em tuplas prontas para inserção"""
+    records = []
+    for _, row in df_sjc.iterrows():
+        try:
+            # Converter data
+            data_str = str(row.get('DATA', ''))
+            if data_str and data_str != 'nan':
+                data = pd.to_datetime(data_str, format='%Y-%m-%d', errors='coerce')
+                if pd.isna(data):
+                    continue
+            else:
+                continue
+            
+            record = (
+                data.date(),
+                row.get('HORA', '12:00'),
+                row.get('ESTACAO', ''),
+                row.get('NOME_DA_ESTACAO', ''),
+                row.get('UF', ''),
+                row.get('REGIAO', ''),
+                float(row.get('LATITUDE', 0)) if pd.notna(row.get('LATITUDE')) else None,
+                float(row.get('LONGITUDE', 0)) if pd.notna(row.get('LONGITUDE')) else None,
+                float(row.get('ALTITUDE', 0)) if pd.notna(row.get('ALTITUDE')) else None,
+                float(row.get('TEMPERATURA_MAXIMA', 0)) if pd.notna(row.get('TEMPERATURA_MAXIMA')) else None,
+                float(row.get('TEMPERATURA_MINIMA', 0)) if pd.notna(row.get('TEMPERATURA_MINIMA')) else None,
+                float(row.get('TEMPERATURA_MEDIA', 0)) if pd.notna(row.get('TEMPERATURA_MEDIA')) else None,
+                float(row.get('UMIDADE_RELATIVA', 0)) if pd.notna(row.get('UMIDADE_RELATIVA')) else None,
+                float(row.get('PRECIPITACAO', 0)) if pd.notna(row.get('PRECIPITACAO')) else None,
+                float(row.get('VELOCIDADE_VENTO', 0)) if pd.notna(row.get('VELOCIDADE_VENTO')) else None,
+                float(row.get('PRESSAO_ATMOSFERICA', 0)) if pd.notna(row.get('PRESSAO_ATMOSFERICA')) else None
+            )
+            records.append(record)
+        except Exception as e:
+            continue
+    return records
+
+def upsert_records(conn, cur, records):
+    """Insere ou atualiza os registros (ON CONFLICT evita duplicatas)"""
+    if is_sqlite(conn):
+        marcadores = '(' + ', '.join('?' * len(COLUNAS_REGISTRO)) + ')'
+        cur.executemany(INSERT_QUERY.replace('%s', marcadores), records)
+    else:
+        execute_values(cur, INSERT_QUERY, records)
+
+def read_batches(arquivo, estacao, tamanho_lote=TAMANHO_LOTE):
+    """
+    Lê o CSV de uma estação em lotes de tamanho fixo, com as colunas limpas
+    e a identificação da estação. O arquivo deve estar posicionado depois
+    do cabeçalho (ver parse_station_header).
+    """
+    for lote in pd.read_csv(arquivo, sep=';', decimal=',', chunksize=tamanho_lote):
+        lote.columns = [col.strip().replace(' ', '_').replace('.', '') for col in lote.columns]
+        lote = attach_station(lote, estacao)
+        yield lote[lote['NOME_DA_ESTACAO'].str.upper() == estacao['nome_estacao']]
+
+def peak_memory_mb():
+    """Pico de memória residente (RSS) do processo, em MB"""
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / 1024 ** 2 if sys.platform == 'darwin' else pico / 1024  # bytes no macOS, KB no Linux
+
+def new_run(ano):
+    """Telemetria vazia de uma execução do coletor"""
+    return {
+        'iniciado_em': datetime.now().isoformat(),
+        'status': 'ok',
+        'ano': ano,
+        'arquivos': 0,
+        'bytes_baixados': 0,
+        'tempos': {etapa: 0.0 for etapa in ('download', 'descompressao', 'parse', 'conversao', 'upsert')},
+        'tempo_total': 0.0,
+        'linhas_lidas': 0,
+        'linhas_rejeitadas': 0,
+        'linhas_gravadas': 0,
+        'linhas_por_segundo': 0.0,
+        'tamanho_lote': TAMANHO_LOTE,
+        'lotes': 0,
+        'pico_memoria_mb': 0.0,
+        'pico_memoria_ingestao_mb': 0.0,
+        'erros': []
+    }
+
+@contextmanager
+def stage(execucao, etapa):
+    """Acumula a duração (s) da etapa na telemetria da execução"""
+    inicio = time.perf_counter()
+    try:
+        with span(f'coletor.{etapa}'):
+            yield
+    finally:
+        execucao['tempos'][etapa] += time.perf_counter() - inicio
+
+def finish_run(execucao, inicio):
+    """Fecha a telemetria com a duração total e a vazão (linhas gravadas por segundo)"""
+    execucao['tempo_total'] = time.perf_counter() - inicio
+    execucao['pico_memoria_mb'] = peak_memory_mb()
+    if execucao['tempo_total'] > 0:
+        execucao['linhas_por_segundo'] = execucao['linhas_gravadas'] / execucao['tempo_total']
+    if execucao['erros'] and execucao['status'] == 'ok':
+        execucao['status'] = 'parcial'
+    return execucao
+
 def handler(request):
     """
     Vercel Serverless Function para coletar dados do INMET e salvar no Neon
     """
+    inicio = time.perf_counter()
+    execucao = new_run(datetime.now().year)
+    conn = None
     try:
         # Obter string de conexão das variáveis de ambiente
         database_url = os.environ.get('DATABASE_URL')
@@ -54,104 +202,148 @@ def handler(request):
         conn.commit()
         
         # Coletar dados do ano atual
-        current_year = datetime.now().year
+        current_year = execucao['ano']
         dados_coletados = 0
         
         # Baixar dados do INMET
         url = f"https://portal.inmet.gov.br/uploads/dadoshistoricos/{current_year}.zip"
         
         with tempfile.TemporaryDirectory() as temp_dir:
-            # Download do arquivo ZIP
-            response = requests.get(url, timeout=300)
-            response.raise_for_status()
-            
+            # Download do arquivo ZIP direto para o disco, em pedaços
             zip_path = os.path.join(temp_dir, f"{current_year}.zip")
-            with open(zip_path, 'wb') as f:
-                f.write(response.content)
+            with stage(execucao, 'download'):
+                response = requests.get(url, timeout=300, stream=True)
+                response.raise_for_status()
+                
+                with open(zip_path, 'wb') as f:
+                    for pedaco in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(pedaco)
+                        execucao['bytes_baixados'] += len(pedaco)
             
-            # Extrair ZIP
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            # Ler o cabeçalho de cada CSV dentro do ZIP (sem extrair os arquivos)
+            with stage(execucao, 'descompressao'):
+                with zipfile.ZipFile(zip_path) as zip_ref:
+                    membros = [m for m in zip_ref.namelist() if m.upper().endswith('.CSV')]
+                    cabecalhos = {}
+                    for membro in membros:
+                        with zip_ref.open(membro) as bruto:
+                            cabecalhos[membro] = parse_station_header(io.TextIOWrapper(bruto, encoding='latin1'))
             
-            # Procurar arquivos CSV de São Luiz do Paraitinga
-            csv_files = glob.glob(os.path.join(temp_dir, "*SAO LUIZ DO PARAITINGA*.CSV"))
+            # Cadastrar todas as estações do arquivo e manter só as configuradas;
+            # cabeçalhos sem código ou sem nome não entram no cadastro
+            try:
+                upsert_stations(conn, [e for e in cabecalhos.values() if e.get('estacao') and e.get('nome_estacao')])
+            except Exception as e:
+                conn.rollback()
+                execucao['erros'].append({'arquivo': None, 'erro': f"cadastro de estações: {e}"})
+                print(f"Erro ao cadastrar estações: {e}")
+            selecionadas = configured_stations()
+            membros = [m for m in membros if is_configured(cabecalhos[m], selecionadas)]
+            execucao['arquivos'] = len(membros)
+            estacoes_gravadas = {}  # estação -> primeiro dia gravado nesta execução
             
-            for csv_file in csv_files:
+            for membro in membros:
+                estacao = cabecalhos[membro]
                 try:
-                    # Ler CSV
-                    df = pd.read_csv(csv_file, encoding='latin1', sep=';', skiprows=8, decimal=',')
-                    
-                    # Limpar nomes das colunas
-                    df.columns = [col.strip().replace(' ', '_').replace('.', '') for col in df.columns]
-                    
-                    # Filtrar apenas São Luiz do Paraitinga
-                    df_sjc = df[df.get('NOME_DA_ESTACAO', '').str.upper() == 'SAO LUIZ DO PARAITINGA']
-                    
-                    if df_sjc.empty:
-                        continue
-                    
-                    # Preparar dados para inserção
-                    records = []
-                    for _, row in df_sjc.iterrows():
-                        try:
-                            # Converter data
-                            data_str = str(row.get('DATA', ''))
-                            if data_str and data_str != 'nan':
-                                data = pd.to_datetime(data_str, format='%Y-%m-%d', errors='coerce')
-                                if pd.isna(data):
-                                    continue
-                            else:
+                    with zipfile.ZipFile(zip_path) as zip_ref, zip_ref.open(membro) as bruto:
+                        arquivo = io.TextIOWrapper(bruto, encoding='latin1')
+                        parse_station_header(arquivo)
+                        lotes = read_batches(arquivo, estacao)
+                        
+                        # Cada lote é lido, convertido, gravado e confirmado antes do próximo
+                        while True:
+                            with stage(execucao, 'parse'):
+                                df_lote = next(lotes, None)
+                            if df_lote is None:
+                                break
+                            if df_lote.empty:
                                 continue
+                            execucao['lotes'] += 1
                             
-                            record = (
-                                data.date(),
-                                row.get('HORA', '12:00'),
-                                row.get('ESTACAO', ''),
-                                row.get('NOME_DA_ESTACAO', ''),
-                                row.get('UF', ''),
-                                row.get('REGIAO', ''),
-                                float(row.get('LATITUDE', 0)) if pd.notna(row.get('LATITUDE')) else None,
-                                float(row.get('LONGITUDE', 0)) if pd.notna(row.get('LONGITUDE')) else None,
-                                float(row.get('ALTITUDE', 0)) if pd.notna(row.get('ALTITUDE')) else None,
-                                float(row.get('TEMPERATURA_MAXIMA', 0)) if pd.notna(row.get('TEMPERATURA_MAXIMA')) else None,
-                                float(row.get('TEMPERATURA_MINIMA', 0)) if pd.notna(row.get('TEMPERATURA_MINIMA')) else None,
-                                float(row.get('TEMPERATURA_MEDIA', 0)) if pd.notna(row.get('TEMPERATURA_MEDIA')) else None,
-                                float(row.get('UMIDADE_RELATIVA', 0)) if pd.notna(row.get('UMIDADE_RELATIVA')) else None,
-                                float(row.get('PRECIPITACAO', 0)) if pd.notna(row.get('PRECIPITACAO')) else None,
-                                float(row.get('VELOCIDADE_VENTO', 0)) if pd.notna(row.get('VELOCIDADE_VENTO')) else None,
-                                float(row.get('PRESSAO_ATMOSFERICA', 0)) if pd.notna(row.get('PRESSAO_ATMOSFERICA')) else None
-                            )
-                            records.append(record)
-                        except Exception as e:
-                            continue
-                    
-                    # Inserir dados no banco (com ON CONFLICT para evitar duplicatas)
-                    if records:
-                        insert_query = """
-                        INSERT INTO dados_meteorologicos (
-                            data, hora, estacao, nome_estacao, uf, regiao,
-                            latitude, longitude, altitude, temperatura_maxima,
-                            temperatura_minima, temperatura_media, umidade_relativa,
-                            precipitacao, velocidade_vento, pressao_atmosferica
-                        ) VALUES %s
-                        ON CONFLICT (data, estacao) DO UPDATE SET
-                            hora = EXCLUDED.hora,
-                            temperatura_maxima = EXCLUDED.temperatura_maxima,
-                            temperatura_minima = EXCLUDED.temperatura_minima,
-                            temperatura_media = EXCLUDED.temperatura_media,
-                            umidade_relativa = EXCLUDED.umidade_relativa,
-                            precipitacao = EXCLUDED.precipitacao,
-                            velocidade_vento = EXCLUDED.velocidade_vento,
-                            pressao_atmosferica = EXCLUDED.pressao_atmosferica
-                        """
-                        
-                        execute_values(cur, insert_query, records)
-                        conn.commit()
-                        dados_coletados += len(records)
+                            # Preparar dados para inserção; linhas sem data válida são rejeitadas
+                            with stage(execucao, 'conversao'):
+                                records = build_records(df_lote)
+                            execucao['linhas_lidas'] += len(df_lote)
+                            execucao['linhas_rejeitadas'] += len(df_lote) - len(records)
+                            
+                            if not records:
+                                continue
+                            
+                            # Valores já gravados nas datas do lote: dias revisados pelo upsert
+                            # trocam a contribuição antiga pela nova no modelo incremental
+                            df_registros = pd.DataFrame(records, columns=COLUNAS_REGISTRO)
+                            try:
+                                anteriores = stored_values(conn, df_registros['DATA'],
+                                                           nome_estacao=estacao['nome_estacao'])
+                            except Exception as e:
+                                conn.rollback()
+                                anteriores = None
+                                print(f"Erro ao ler valores gravados: {e}")
+                            
+                            # Inserir dados no banco (com ON CONFLICT para evitar duplicatas) e
+                            # atualizar o modelo incremental com as linhas do lote na mesma
+                            # transação: um único commit, e uma falha desfaz os dois
+                            with stage(execucao, 'upsert'):
+                                upsert_records(conn, cur, records)
+                                update_online_models(conn, df_registros, nome_estacao=estacao['nome_estacao'],
+                                                     anteriores=anteriores, commit=False)
+                                conn.commit()
+                            dados_coletados += len(records)
+                            execucao['linhas_gravadas'] = dados_coletados
+                            primeiro_dia = df_registros['DATA'].min()
+                            nome = estacao['nome_estacao']
+                            estacoes_gravadas[nome] = min(estacoes_gravadas.get(nome, primeiro_dia), primeiro_dia)
                 
                 except Exception as e:
+                    conn.rollback()
+                    execucao['erros'].append({'arquivo': os.path.basename(membro), 'erro': str(e)})
+                    print(f"Erro ao processar {membro}: {e}")
                     continue
         
+        # Pico de memória da ingestão (download e lotes), antes das tabelas derivadas
+        execucao['pico_memoria_ingestao_mb'] = peak_memory_mb()
+        
+        # Tabelas derivadas das estações que receberam dados, recalculadas só a
+        # partir de 1º de janeiro do primeiro ano gravado, um ano de dados por vez
+        if dados_coletados > 0:
+            execucao['lacunas'] = {}
+            for nome_estacao, primeiro_dia in sorted(estacoes_gravadas.items()):
+                desde = pd.Timestamp(pd.Timestamp(primeiro_dia).year, 1, 1)
+                
+                # Relatório de lacunas (calendário contínuo)
+                try:
+                    lacunas = refresh_gap_report(conn, nome_estacao, desde)
+                    execucao['lacunas'][nome_estacao] = int(lacunas['duracao'].sum())
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Erro ao gerar relatório de lacunas de {nome_estacao}: {e}")
+                
+                # Matrizes ano × dia do ano para a comparação com outros anos
+                try:
+                    refresh_year_matrices(conn, nome_estacao, desde)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Erro ao gravar matrizes anuais de {nome_estacao}: {e}")
+            
+            # A previsão do dashboard vem do modelo incremental, já atualizado
+            # lote a lote; o retreino completo (train_fleet.py e model_registry.py)
+            # é um passo seguinte do workflow, fora do coletor
+            
+            # Invalidar os caches de leitura (api/series.py e dashboard) só depois
+            # de gravar as tabelas derivadas: quem ler a nova marca d'água já
+            # encontra o modelo, as lacunas e as matrizes correspondentes
+            bump_data_watermark(conn)
+        
+        # Registrar a telemetria da execução
+        finish_run(execucao, inicio)
+        if execucao['linhas_rejeitadas'] > 0:
+            print(f"Atenção: {execucao['linhas_rejeitadas']} linhas rejeitadas na conversão")
+        try:
+            record_collector_run(conn, execucao)
+        except Exception as e:
+            conn.rollback()
+            print(f"Erro ao registrar execução do coletor: {e}")
+        
         # Fechar conexão
         cur.close()
         conn.close()
@@ -162,15 +354,27 @@ def handler(request):
                 'message': f'Dados coletados com sucesso! {dados_coletados} registros processados.',
                 'year': current_year,
                 'records': dados_coletados,
+                'telemetry': execucao,
                 'timestamp': datetime.now().isoformat()
             })
         }
         
     except Exception as e:
+        execucao['status'] = 'erro'
+        execucao['erros'].append({'arquivo': None, 'erro': str(e)})
+        finish_run(execucao, inicio)
+        if conn is not None:
+            try:
+                conn.rollback()
+                record_collector_run(conn, execucao)
+                conn.close()
+            except Exception:
+                pass
         return {
             'statusCode': 500,
             'body': json.dumps({
                 'error': str(e),
+                'telemetry': execucao,
                 'timestamp': datetime.now().isoformat()
             })
         }
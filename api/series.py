@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import gzip
+import base64
+import hashlib
+from collections import OrderedDict
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele servimos apenas gzip
+    brotli = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ESTACAO_PADRAO, VARIAVEIS, connect, get_data_watermark, load_weather_data
+
+# Resoluções aceitas no parâmetro 'resolucao' (regra de reamostragem do pandas)
+RESOLUCOES = {
+    'diaria': 'D',
+    'semanal': 'W',
+    'mensal': 'MS',
+    'anual': 'YS'
+}
+
+# Agregação de cada variável ao reduzir a resolução
+AGREGACOES = {
+    'TEMPERATURA_MAXIMA': 'max',
+    'TEMPERATURA_MINIMA': 'min',
+    'PRECIPITACAO': 'sum'
+}
+
+# Cache LRU em processo: (parâmetros) -> corpo JSON já serializado
+CACHE_MAX_ITENS = int(os.environ.get('SERIES_CACHE_SIZE', '128'))
+_cache = OrderedDict()
+_cache_watermark = None
+
+# Respostas menores que isso não compensam a compressão
+TAMANHO_MINIMO_COMPRESSAO = 1024
+
+
+def _extrair_requisicao(request):
+    """Obtém parâmetros de consulta e cabeçalhos (em minúsculas) da requisição"""
+    if isinstance(request, dict):
+        query = request.get('queryStringParameters') or request.get('query') or {}
+        headers = request.get('headers') or {}
+    else:
+        query = getattr(request, 'args', None) or getattr(request, 'query', None) or {}
+        headers = getattr(request, 'headers', None) or {}
+
+    params = {}
+    for chave, valor in dict(query).items():
+        params[chave] = valor[0] if isinstance(valor, (list, tuple)) else valor
+    headers = {str(k).lower(): v for k, v in dict(headers).items()}
+    return params, headers
+
+
+def _normalizar_parametros(params):
+    """Valida os parâmetros e devolve uma tupla canônica usada como chave de cache"""
+    resolucao = params.get('resolucao', 'diaria')
+    if resolucao not in RESOLUCOES:
+        raise ValueError(f"resolucao inválida: {resolucao} (use {', '.join(RESOLUCOES)})")
+
+    inicio = params.get('inicio')
+    fim = params.get('fim')
+    inicio = pd.to_datetime(inicio).date().isoformat() if inicio else None
+    fim = pd.to_datetime(fim).date().isoformat() if fim else None
+
+    variaveis = params.get('variaveis')
+    variaveis = [v.strip().upper() for v in variaveis.split(',')] if variaveis else list(VARIAVEIS)
+    invalidas = [v for v in variaveis if v not in VARIAVEIS]
+    if invalidas:
+        raise ValueError(f"variáveis inválidas: {', '.join(invalidas)}")
+
+    estacao = params.get('estacao', ESTACAO_PADRAO).upper()
+    return (estacao, inicio, fim, resolucao, tuple(variaveis))
+
+
+def _calcular_etag(watermark, chave):
+    """
+    ETag fraco derivado da marca d'água e dos parâmetros normalizados
+
+    O mesmo tag vale para os corpos identity, gzip e br: eles são
+    semanticamente equivalentes, mas não idênticos byte a byte.
+    """
+    digest = hashlib.sha1(json.dumps([watermark, chave]).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _montar_payload(conn, watermark, chave):
+    """Consulta apenas o período pedido e agrega na resolução solicitada"""
+    estacao, inicio, fim, resolucao, variaveis = chave
+    df = load_weather_data(conn, nome_estacao=estacao, inicio=inicio, fim=fim, colunas=list(variaveis))
+    df = df.set_index('DATA').sort_index()
+
+    estatisticas = {}
+    for var in variaveis:
+        serie = df[var].dropna()
+        estatisticas[var] = {
+            'count': int(serie.count()),
+            'mean': float(serie.mean()) if not serie.empty else None,
+            'std': float(serie.std()) if len(serie) > 1 else None,
+            'min': float(serie.min()) if not serie.empty else None,
+            'p25': float(serie.quantile(0.25)) if not serie.empty else None,
+            'p50': float(serie.quantile(0.50)) if not serie.empty else None,
+            'p75': float(serie.quantile(0.75)) if not serie.empty else None,
+            'max': float(serie.max()) if not serie.empty else None
+        }
+
+    if resolucao != 'diaria' and not df.empty:
+        df = df.resample(RESOLUCOES[resolucao]).agg({v: AGREGACOES.get(v, 'mean') for v in variaveis})
+
+    series = {'DATA': [d.strftime('%Y-%m-%d') for d in df.index]}
+    for var in variaveis:
+        valores = df[var].round(2)
+        series[var] = [None if pd.isna(v) else float(v) for v in valores]
+
+    payload = {
+        'estacao': estacao,
+        'inicio': inicio,
+        'fim': fim,
+        'resolucao': resolucao,
+        'watermark': watermark,
+        'series': series,
+        'estatisticas': estatisticas
+    }
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def _obter_do_cache(conn, watermark, chave):
+    """Consulta o cache LRU, descartando-o inteiro quando a marca d'água muda"""
+    global _cache_watermark
+
+    if watermark != _cache_watermark:
+        _cache.clear()
+        _cache_watermark = watermark
+
+    if chave in _cache:
+        _cache.move_to_end(chave)
+        return _cache[chave]
+
+    entrada = {'identity': _montar_payload(conn, watermark, chave)}
+    _cache[chave] = entrada
+    while len(_cache) > CACHE_MAX_ITENS:
+        _cache.popitem(last=False)
+    return entrada
+
+
+def _escolher_codificacao(accept_encoding):
+    """Escolhe a melhor codificação suportada pelo cliente (br > gzip)"""
+    aceitas = [parte.split(';')[0].strip().lower() for parte in (accept_encoding or '').split(',')]
+    if brotli is not None and 'br' in aceitas:
+        return 'br'
+    if 'gzip' in aceitas:
+        return 'gzip'
+    return 'identity'
+
+
+def _comprimir(entrada, codificacao):
+    """Comprime o corpo sob demanda e guarda o resultado junto da entrada do cache"""
+    if codificacao not in entrada:
+        corpo = entrada['identity']
+        if codificacao == 'br':
+            entrada['br'] = brotli.compress(corpo, quality=5)
+        else:
+            entrada['gzip'] = gzip.compress(corpo, compresslevel=6)
+    return entrada[codificacao]
+
+
+def handler(request):
+    """
+    Vercel Serverless Function de leitura das séries agregadas
+
+    Parâmetros: estacao, inicio, fim (AAAA-MM-DD), resolucao
+    (diaria|semanal|mensal|anual) e variaveis (separadas por vírgula).
+    """
+    try:
+        params, headers = _extrair_requisicao(request)
+
+        try:
+            chave = _normalizar_parametros(params)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': str(e)})
+            }
+
+        database_url = os.environ.get('DATABASE_URL')
+        if not database_url:
+            return {
+                'statusCode': 500,
+                'body': json.dumps({'error': 'DATABASE_URL não configurada'})
+            }
+
+        conn = connect(database_url)
+        try:
+            watermark = get_data_watermark(conn)
+            etag = _calcular_etag(watermark, chave)
+            cabecalhos = {
+                'Content-Type': 'application/json; charset=utf-8',
+                'Cache-Control': 'public, max-age=0, must-revalidate',
+                'ETag': etag,
+                'Vary': 'Accept-Encoding'
+            }
+
+            # GET condicional (comparação fraca): o cliente já tem esta versão
+            if_none_match = headers.get('if-none-match', '')
+            tags = [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+            if etag.removeprefix('W/') in tags or if_none_match.strip() == '*':
+                return {'statusCode': 304, 'headers': cabecalhos, 'body': ''}
+
+            entrada = _obter_do_cache(conn, watermark, chave)
+        finally:
+            conn.close()
+
+        codificacao = _escolher_codificacao(headers.get('accept-encoding'))
+        if codificacao == 'identity' or len(entrada['identity']) < TAMANHO_MINIMO_COMPRESSAO:
+            return {
+                'statusCode': 200,
+                'headers': cabecalhos,
+                'body': entrada['identity'].decode('utf-8')
+            }
+
+        cabecalhos['Content-Encoding'] = codificacao
+        return {
+            'statusCode': 200,
+            'headers': cabecalhos,
+            'isBase64Encoded': True,
+            'body': base64.b64encode(_comprimir(entrada, codificacao)).decode('ascii')
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            })
+        }
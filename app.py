@@ -3,145 +3,755 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
-import plotly.graph_objects as go
+import plotly.io as pio
 from datetime import datetime, timedelta
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_squared_error, r2_score
-import psycopg2
 import os
+import threading
+
+from anomalies import compute_anomalies
+from charts import (build_envelope_figure, build_field_animation, build_histogram_figure, build_humidity_figure,
+                    build_ml_figure, build_precipitation_figure, build_temperature_figure, filter_by_date)
+from comparison import compare_stations, load_station_matrix
+from database import ESTACAO_PADRAO, connect, data_signature, get_data_watermark, load_weather_data
+from figure_cache import cached_figure_json, clear as clear_figure_cache, stats as figure_cache_stats
+from indices import (JANELAS_MEDIA, build_state, compute_indices, extend_state,
+                     truncate_state, window_mean)
+from interpolation import idw_weights, make_grid, regional_fields, stations_in_region
+from model_registry import load_latest_artifact
+from online_model import online_forecast
+from perf import cache_calls, cache_misses, snapshot, span, start_metrics_server
+from resampling import MAX_LACUNA_PREENCHIDA, gap_summary, load_gap_report, resample_station_data
+from stations import build_station_index, load_stations, neighbors_of
+from year_matrix import climatology_envelope, load_year_matrix, year_day_matrix
 
 # Configuração da página
 st.set_page_config(
-    page_title="Dashboard Meteorológico - São Luiz do Paraitinga",
+    page_title="Dashboard Meteorológico",
     page_icon="🌤️",
     layout="wide",
     initial_sidebar_state="expanded"
 )
 
-# Título principal
-st.title("🌤️ Dashboard Meteorológico - São Luiz do Paraitinga-SP")
-st.markdown("---")
+# Endpoint Prometheus opcional (GET /metrics na porta METRICS_PORT)
+@st.cache_resource
+def start_metrics_endpoint():
+    """Sobe o servidor de métricas uma única vez por processo"""
+    porta = os.environ.get('METRICS_PORT')
+    if not porta:
+        return None
+    try:
+        return start_metrics_server(porta)
+    except OSError as e:
+        print(f"Não foi possível iniciar o endpoint de métricas: {e}")
+        return None
+
+start_metrics_endpoint()
 
 # Função para conectar ao banco de dados
+@cache_calls('conexao')
 @st.cache_resource
+@cache_misses('conexao')
 def get_database_connection():
     """Cria conexão com o banco de dados Neon"""
     try:
         database_url = st.secrets["DATABASE_URL"]
-        conn = psycopg2.connect(database_url)
+        conn = connect(database_url)
         return conn
     except Exception as e:
         st.error(f"Erro ao conectar com o banco de dados: {e}")
         return None
 
+# Função para obter a marca d'água da última ingestão
+@cache_calls('watermark')
+@st.cache_data(ttl=300)  # Verifica novas ingestões a cada 5 minutos
+@cache_misses('watermark')
+def get_current_watermark():
+    """Marca d'água dos dados, usada como chave dos caches abaixo"""
+    conn = get_database_connection()
+    if conn is None:
+        return None
+    
+    try:
+        return get_data_watermark(conn)
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Erro ao ler a marca d'água dos dados: {e}")
+        return None
+
 # Função para carregar dados do banco
-@st.cache_data(ttl=3600)  # Cache por 1 hora
-def load_data_from_database():
-    """Carrega os dados meteorológicos do banco de dados Neon"""
+@cache_calls('dados')
+@st.cache_data(ttl=3600, max_entries=2)  # Cache por 1 hora ou até nova ingestão
+@cache_misses('dados')
+def load_data_from_database(watermark, nome_estacao=ESTACAO_PADRAO):
+    """
+    Carrega os dados meteorológicos do banco de dados Neon em um calendário
+    diário contínuo: dias sem registro ficam NaN (os gráficos mostram a
+    interrupção) e lacunas curtas são interpoladas e marcadas
+    """
     conn = get_database_connection()
     if conn is None:
         return None
     
     try:
-        query = """
-        SELECT 
-            data,
-            hora,
-            estacao,
-            nome_estacao,
-            uf,
-            regiao,
-            latitude,
-            longitude,
-            altitude,
-            temperatura_maxima,
-            temperatura_minima,
-            temperatura_media,
-            umidade_relativa,
-            precipitacao,
-            velocidade_vento,
-            pressao_atmosferica,
-            created_at
-        FROM dados_meteorologicos 
-        WHERE nome_estacao = 'SAO LUIZ DO PARAITINGA'
-        ORDER BY data DESC
-        """
+        df = load_weather_data(conn, nome_estacao=nome_estacao)
+        if df.empty:
+            return df
+        with span('calendario_regular', linhas=len(df)):
+            return resample_station_data(df)['dados']
         
-        df = pd.read_sql_query(query, conn)
-        
-        # Converter coluna de data
-        df['data'] = pd.to_datetime(df['data'])
+    except Exception as e:
+        st.error(f"Erro ao carregar dados: {e}")
+        conn.rollback()
+        return None
+
+# Função para carregar o modelo de machine learning já treinado
+@cache_calls('modelo')
+@st.cache_data(ttl=3600, max_entries=2)  # Cache por 1 hora ou até nova ingestão
+@cache_misses('modelo')
+def load_ml_artifact(watermark, nome_estacao=ESTACAO_PADRAO):
+    """Carrega o artefato do modelo registrado após a ingestão (sem treinar)"""
+    conn = get_database_connection()
+    if conn is None:
+        return None
+    
+    try:
+        return load_latest_artifact(conn, nome_estacao=nome_estacao)
+    except Exception as e:
+        st.error(f"Erro ao carregar modelo: {e}")
+        return None
+
+# Função para carregar o modelo incremental atualizado pelo coletor
+@cache_calls('modelo_online')
+@st.cache_data(ttl=3600, max_entries=2)  # Cache por 1 hora ou até nova ingestão
+@cache_misses('modelo_online')
+def load_online_model(watermark, nome_estacao=ESTACAO_PADRAO):
+    """Métricas e previsão do modelo incremental (só as estatísticas suficientes, sem histórico)"""
+    conn = get_database_connection()
+    if conn is None:
+        return None
+    
+    try:
+        return online_forecast(conn, nome_estacao=nome_estacao)
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Erro ao carregar modelo incremental: {e}")
+        return None
+
+# Função para calcular as anomalias climáticas
+@cache_calls('anomalias')
+@st.cache_data(max_entries=2)
+@cache_misses('anomalias')
+def load_anomalies(watermark, nome_estacao=ESTACAO_PADRAO):
+    """Climatologia, scores e eventos do histórico completo (recalculados só a cada ingestão)"""
+    df = load_data_from_database(watermark, nome_estacao)
+    if df is None or df.empty:
+        return None
+    return compute_anomalies(df)
+
+# Estados do motor de índices por estação (somas acumuladas), compartilhados entre sessões
+@st.cache_resource
+def indices_states():
+    """
+    Dicionário estação -> (marca d'água, estado do motor de índices,
+    assinatura do histórico), com o lock que serializa leitura,
+    atualização e gravação entre as sessões
+    """
+    return {'lock': threading.Lock(), 'estados': {}}
+
+def revision_start(estado):
+    """Início do trecho que a ingestão ainda pode revisar: o coletor regrava o ano corrente"""
+    return pd.Timestamp(estado['datas'][-1].year, 1, 1)
+
+def refresh_indices_state(conn, nome_estacao, estado, assinatura):
+    """
+    Recalcula o estado a partir de revision_start, relendo também os
+    MAX_LACUNA_PREENCHIDA dias anteriores para que lacunas curtas na
+    fronteira sejam interpoladas como na reconstrução completa. Retorna
+    None se o histórico anterior ao trecho mudou (o estado é reconstruído).
+    """
+    corte = revision_start(estado)
+    if assinatura is None or corte <= estado['datas'][0]:
+        return None
+    if data_signature(conn, nome_estacao, corte) != assinatura:
+        return None
+    
+    inicio = corte - pd.Timedelta(days=MAX_LACUNA_PREENCHIDA + 1)
+    trecho = load_weather_data(conn, nome_estacao=nome_estacao, inicio=inicio.date())
+    if trecho.empty:
+        return None
+    return extend_state(truncate_state(estado, corte), resample_station_data(trecho)['dados'])
+
+def load_indices_state(watermark, nome_estacao=ESTACAO_PADRAO):
+    """
+    Estado de índices da estação: construído uma vez a partir do histórico
+    e, a cada nova ingestão, recalculado só a partir de 1º de janeiro do
+    último ano incorporado (dias novos e revisados pelo coletor)
+    """
+    registro = indices_states()
+    with registro['lock']:
+        estados = registro['estados']
+        atual = estados.get(nome_estacao)
+        if atual is not None and atual[0] == watermark:
+            return atual[1]
         
-        # Renomear colunas para manter compatibilidade
-        df = df.rename(columns={
-            'data': 'DATA',
-            'hora': 'HORA',
-            'estacao': 'ESTACAO',
-            'nome_estacao': 'NOME_DA_ESTACAO',
-            'uf': 'UF',
-            'regiao': 'REGIAO',
-            'latitude': 'LATITUDE',
-            'longitude': 'LONGITUDE',
-            'altitude': 'ALTITUDE',
-            'temperatura_maxima': 'TEMPERATURA_MAXIMA',
-            'temperatura_minima': 'TEMPERATURA_MINIMA',
-            'temperatura_media': 'TEMPERATURA_MEDIA',
-            'umidade_relativa': 'UMIDADE_RELATIVA',
-            'precipitacao': 'PRECIPITACAO',
-            'velocidade_vento': 'VELOCIDADE_VENTO',
-            'pressao_atmosferica': 'PRESSAO_ATMOSFERICA'
-        })
+        conn = get_database_connection()
+        with span('indices.estado', estacao=nome_estacao, incremental=atual is not None):
+            estado = None
+            if atual is not None and conn is not None:
+                try:
+                    estado = refresh_indices_state(conn, nome_estacao, atual[1], atual[2])
+                except Exception:
+                    conn.rollback()
+            if estado is None:
+                df = load_data_from_database(watermark, nome_estacao)
+                if df is None or df.empty:
+                    return None
+                estado = build_state(df)
         
-        conn.close()
-        return df
+        # Assinatura do trecho que a próxima atualização não vai reler
+        try:
+            assinatura = data_signature(conn, nome_estacao, revision_start(estado)) if conn is not None else None
+        except Exception:
+            conn.rollback()
+            assinatura = None
         
+        estados[nome_estacao] = (watermark, estado, assinatura)
+        return estado
+
+# Função para carregar o relatório de lacunas gerado na ingestão
+@cache_calls('lacunas')
+@st.cache_data(ttl=3600, max_entries=4)
+@cache_misses('lacunas')
+def load_gaps(watermark, nome_estacao=ESTACAO_PADRAO):
+    """Sequências de dias sem dado de cada variável da estação"""
+    conn = get_database_connection()
+    if conn is None:
+        return None
+    return load_gap_report(conn, nome_estacao)
+
+# Função para carregar a matriz ano × dia do ano gerada na ingestão
+@cache_calls('matriz_anual')
+@st.cache_data(ttl=3600, max_entries=16)
+@cache_misses('matriz_anual')
+def load_year_day_matrix(watermark, nome_estacao, variavel):
+    """Matriz ano × dia do ano da variável (calculada aqui se o coletor ainda não a gravou)"""
+    conn = get_database_connection()
+    matriz = load_year_matrix(conn, nome_estacao, variavel) if conn is not None else None
+    if matriz is None:
+        df = load_data_from_database(watermark, nome_estacao)
+        if df is None or df.empty:
+            return None
+        if f'{variavel}_PREENCHIDO' in df.columns:
+            df = df[~df[f'{variavel}_PREENCHIDO']]
+        matriz = year_day_matrix(df, variavel)
+    return matriz
+
+# Função para carregar o cadastro de estações
+@cache_calls('estacoes')
+@st.cache_data(ttl=3600, max_entries=2)
+@cache_misses('estacoes')
+def load_station_list(watermark, somente_com_dados=False):
+    """Estações cadastradas (todas, ou apenas as que têm dados gravados)"""
+    conn = get_database_connection()
+    if conn is None:
+        return None
+    
+    try:
+        return load_stations(conn, somente_com_dados)
     except Exception as e:
-        st.error(f"Erro ao carregar dados: {e}")
-        conn.close()
+        conn.rollback()
+        st.error(f"Erro ao carregar o cadastro de estações: {e}")
+        return None
+
+# Índice espacial das estações (BallTree haversine), reconstruído só a cada ingestão
+@cache_calls('indice_estacoes')
+@st.cache_resource(max_entries=2)
+@cache_misses('indice_estacoes')
+def load_station_index(watermark):
+    """Índice de vizinhança sobre latitude/longitude das estações"""
+    estacoes = load_station_list(watermark)
+    if estacoes is None or estacoes.empty:
+        return None
+    return build_station_index(estacoes)
+
+# Função para alinhar e comparar várias estações
+@cache_calls('comparacao')
+@st.cache_data(ttl=3600, max_entries=16)
+@cache_misses('comparacao')
+def load_comparison(watermark, estacoes_comparadas, variavel, referencia, inicio, fim):
+    """Matriz datas × estações e suas comparações, cacheadas por seleção"""
+    conn = get_database_connection()
+    if conn is None:
+        return None
+    
+    try:
+        matriz = load_station_matrix(conn, estacoes_comparadas, variavel, inicio, fim)
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Erro ao carregar estações: {e}")
+        return None
+    with span('comparacao.calculo', estacoes=len(estacoes_comparadas)):
+        return matriz, compare_stations(matriz, referencia)
+
+# Pesos IDW da grade regional, reutilizados em todos os dias e variáveis
+@cache_calls('pesos_idw')
+@st.cache_resource(max_entries=2)
+@cache_misses('pesos_idw')
+def load_interpolation_weights(watermark):
+    """Estações da região e matriz de pesos (pontos da grade × estações)"""
+    conn = get_database_connection()
+    if conn is None:
+        return None
+    
+    try:
+        regiao = stations_in_region(load_stations(conn, somente_com_dados=True))
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Erro ao carregar as estações da região: {e}")
+        return None
+    if len(regiao) < 2:
+        st.info("São necessárias ao menos duas estações com dados na região para interpolar.")
+        return None
+    return regiao, idw_weights(regiao, make_grid())
+
+# Função para interpolar os campos diários de um ano
+@cache_calls('campos_regionais')
+@st.cache_data(ttl=3600, max_entries=8)
+@cache_misses('campos_regionais')
+def load_regional_fields(watermark, variavel, ano):
+    """Campos diários da variável sobre a bacia para o ano escolhido"""
+    conn = get_database_connection()
+    pesos = load_interpolation_weights(watermark)
+    if conn is None or pesos is None:
+        return None
+    
+    regiao, pesos = pesos
+    try:
+        with span('interpolacao.campos', variavel=variavel, ano=ano):
+            return regional_fields(conn, variavel, f'{ano}-01-01', f'{ano}-12-31',
+                                   estacoes=regiao, pesos=pesos)
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Erro ao interpolar: {e}")
         return None
 
-# Função para análise de machine learning
-@st.cache_data
-def run_ml_analysis(df):
-    """Executa análise de machine learning"""
-    df_ml = df.copy()
-    df_ml['MES'] = df_ml['DATA'].dt.month
-    df_ml['DIA_DO_ANO'] = df_ml['DATA'].dt.dayofyear
+def show_cached_chart(nome, construir, **vista):
+    """
+    Exibe a figura a partir do cache de JSON compartilhado entre sessões;
+    construir() só roda quando a vista (marca d'água, estação, período,
+    variável) ainda não está no cache. O JSON já foi validado ao ser gerado,
+    então a figura é remontada com skip_invalid e entregue como Figure: o
+    st.plotly_chart só a serializa, sem o go.Figure(**dict) de validação
+    que faria para um dict a cada rerun
+    """
+    texto = cached_figure_json(nome, construir, **vista)
+    with span(f'grafico.{nome}.serializacao'):
+        st.plotly_chart(pio.from_json(texto, skip_invalid=True), use_container_width=True)
+
+def show_chart(nome, fig):
+    """Envia a figura ao navegador medindo a serialização do Plotly"""
+    with span(f'grafico.{nome}.serializacao'):
+        st.plotly_chart(fig, use_container_width=True)
+
+def show_performance_panel():
+    """Painel de depuração com os tempos da última execução e os acertos de cache"""
+    if not st.sidebar.checkbox("⏱️ Painel de desempenho", key='painel_desempenho'):
+        return
+    metricas = snapshot()
+    with st.sidebar.expander("Tempos por etapa", expanded=True):
+        if metricas['spans']:
+            spans = pd.DataFrame(metricas['spans']).T[['ultimo_ms', 'media_ms', 'max_ms', 'count']]
+            st.dataframe(spans.sort_values('ultimo_ms', ascending=False).round(1))
+    with st.sidebar.expander("Caches", expanded=True):
+        if metricas['caches']:
+            st.dataframe(pd.DataFrame(metricas['caches']).T)
+        figuras = figure_cache_stats()
+        st.caption(f"Figuras em cache: {figuras['figuras']} ({figuras['mb']:.1f} MB)")
+
+# Fragmentos: cada seção com widgets próprios declara suas entradas como
+# argumentos e, ao interagir com ela, só a seção é reexecutada. Mudanças de
+# estação, período ou dados reexecutam a página inteira.
+fragment = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None) or (lambda f: f)
+
+@fragment
+def nearby_stations_section(watermark, nome_estacao):
+    """Estações mais próximas (entrada: estação; reexecuta sozinha ao mudar a quantidade)"""
+    indice_estacoes = load_station_index(watermark)
+    if indice_estacoes is not None:
+        with st.expander("🧭 Estações próximas"):
+            n_vizinhas = st.slider("Quantidade", 1, 20, 5, key='n_vizinhas')
+            with span('estacoes.vizinhas'):
+                vizinhas = neighbors_of(indice_estacoes, nome_estacao, n_vizinhas)
+            st.dataframe(
+                vizinhas[['nome_estacao', 'uf', 'distancia_km']].round({'distancia_km': 1}),
+                hide_index=True
+            )
+
+@fragment
+def anomalies_section(watermark, nome_estacao, inicio_periodo, fim_periodo):
+    """Anomalias climáticas (entradas: estação e período; a variável só reexecuta esta seção)"""
+    st.header("🚨 Anomalias Climáticas")
+    
+    anomalias = load_anomalies(watermark, nome_estacao)
+    
+    if anomalias is not None:
+        scores = anomalias['scores']
+        scores = scores[scores['DATA'].between(inicio_periodo, fim_periodo)]
+        eventos = anomalias['eventos']
+        eventos = eventos[(eventos['fim'] >= inicio_periodo) & (eventos['inicio'] <= fim_periodo)]
+        
+        variavel_anomalia = st.selectbox(
+            "Variável para análise de anomalias:",
+            ['TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA',
+             'UMIDADE_RELATIVA', 'PRECIPITACAO', 'PRESSAO_ATMOSFERICA'],
+            key='variavel_anomalia'
+        )
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            z_recente = scores[f'{variavel_anomalia}_Z'].dropna()
+            st.metric("Z-score mais recente", f"{z_recente.iloc[-1]:+.2f}" if not z_recente.empty else "-")
+        
+        with col2:
+            st.metric("Ondas de calor", int((eventos['tipo'] == 'Onda de calor').sum()))
+        
+        with col3:
+            st.metric("Ondas de frio", int((eventos['tipo'] == 'Onda de frio').sum()))
+        
+        with col4:
+            st.metric("Veranicos", int((eventos['tipo'] == 'Veranico').sum()))
+        
+        # Gráfico de z-score em relação à normal do dia do ano
+        with span('grafico.anomalia.construcao'):
+            fig_anomalia = px.line(
+                scores,
+                x='DATA',
+                y=[f'{variavel_anomalia}_Z', f'{variavel_anomalia}_Z_MOVEL'],
+                title=f"Anomalia de {variavel_anomalia} em relação à normal do dia do ano",
+                labels={'value': 'Z-score', 'DATA': 'Data'}
+            )
+            fig_anomalia.add_hline(y=2, line_dash='dash', line_color='red')
+            fig_anomalia.add_hline(y=-2, line_dash='dash', line_color='blue')
+            fig_anomalia.update_layout(height=350)
+        show_chart('anomalia', fig_anomalia)
+        
+        if not eventos.empty:
+            st.subheader("Eventos detectados no período")
+            st.dataframe(eventos)
+
+@fragment
+def year_overlay_section(watermark, nome_estacao, anos):
+    """Ano escolhido vs. envelope climatológico (entradas: estação e anos disponíveis)"""
+    st.header("📆 Este Ano vs. Climatologia")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        variavel_ano = st.selectbox(
+            "Variável:",
+            ['TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA',
+             'UMIDADE_RELATIVA', 'PRECIPITACAO', 'VELOCIDADE_VENTO', 'PRESSAO_ATMOSFERICA'],
+            key='variavel_ano'
+        )
+    with col2:
+        ano = st.selectbox("Ano:", anos, key='ano_comparado')
+    
+    matriz = load_year_day_matrix(watermark, nome_estacao, variavel_ano)
+    if matriz is None or len(matriz['anos']) == 0:
+        st.info("Sem dados suficientes para montar a climatologia.")
+        return
+    
+    with span('envelope_climatologico', variavel=variavel_ano):
+        envelope = climatology_envelope(matriz, int(ano))
+    
+    observados = envelope.dropna(subset=['ATUAL'])
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        if not observados.empty:
+            ultimo = observados.iloc[-1]
+            st.metric(f"Percentil em {ultimo['DATA'].strftime('%d/%m')}", f"{ultimo['PERCENTIL_ATUAL']:.0f}")
+    with col2:
+        st.metric("Dias acima do P95", int((observados['ATUAL'] > observados['P95']).sum()))
+    with col3:
+        st.metric("Dias abaixo do P05", int((observados['ATUAL'] < observados['P05']).sum()))
+    with col4:
+        recordes = int(((observados['ATUAL'] > observados['RECORDE_MAXIMO'])
+                        | (observados['ATUAL'] < observados['RECORDE_MINIMO'])).sum())
+        st.metric("Recordes diários", recordes)
+    
+    with span('grafico.envelope.construcao'):
+        fig_envelope = build_envelope_figure(envelope, variavel_ano, int(ano))
+    show_chart('envelope', fig_envelope)
+    st.caption(f"Envelope dos demais {len(matriz['anos']) - (int(ano) in matriz['anos'])} anos; "
+               f"29/02 fica fora da comparação.")
+
+@fragment
+def indices_section(watermark, nome_estacao, inicio_periodo, fim_periodo):
+    """Índices agrícolas (entradas: estação e período; janelas e variável só reexecutam esta seção)"""
+    st.header("🌱 Índices Agrícolas")
     
-    features = ['MES', 'DIA_DO_ANO']
-    target = 'TEMPERATURA_MEDIA'
+    estado_indices = load_indices_state(watermark, nome_estacao)
     
-    df_ml = df_ml.dropna(subset=features + [target])
+    if estado_indices is not None:
+        indices = compute_indices(estado_indices)
+        periodo = indices['DATA'].between(inicio_periodo, fim_periodo)
+        
+        col1, col2 = st.columns([3, 1])
+        with col2:
+            variavel_media = st.selectbox(
+                "Variável:",
+                ['TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA',
+                 'UMIDADE_RELATIVA', 'PRECIPITACAO', 'GRAUS_DIA'],
+                key='variavel_media_movel'
+            )
+            janelas = st.multiselect("Médias móveis (dias):", list(JANELAS_MEDIA), default=[30, 365],
+                                     key='janelas_media_movel')
+            janela_livre = st.number_input("Outra janela (dias):", min_value=0, max_value=3650, value=0,
+                                           key='janela_livre')
+            if janela_livre > 0:
+                janelas = sorted(set(janelas) | {int(janela_livre)})
+        
+        with col1:
+            with span('grafico.medias_moveis.construcao'):
+                medias = pd.DataFrame({'DATA': estado_indices['datas'],
+                                       variavel_media: estado_indices['valores'].get(variavel_media)})
+                for janela in janelas:
+                    medias[f'MM{janela}'] = window_mean(estado_indices, variavel_media, janela)
+                fig_medias = px.line(
+                    medias[periodo.to_numpy()],
+                    x='DATA',
+                    y=[variavel_media] + [f'MM{janela}' for janela in janelas],
+                    title=f"Médias móveis de {variavel_media}",
+                    labels={'value': variavel_media, 'DATA': 'Data'}
+                )
+                fig_medias.update_layout(height=400)
+            show_chart('medias_moveis', fig_medias)
+        
+        ultimo = indices.iloc[-1]
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            if 'PRECIPITACAO_30D' in indices:
+                st.metric("Chuva nos últimos 30 dias", f"{ultimo['PRECIPITACAO_30D']:.0f} mm")
+        with col2:
+            if 'SPI_30' in indices:
+                st.metric("SPI-30", f"{ultimo['SPI_30']:+.2f}")
+        with col3:
+            if 'SPI_90' in indices:
+                st.metric("SPI-90", f"{ultimo['SPI_90']:+.2f}")
+        with col4:
+            if 'GRAUS_DIA_SAFRA' in indices:
+                st.metric("Graus-dia na safra", f"{ultimo['GRAUS_DIA_SAFRA']:.0f}")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            colunas_spi = [c for c in indices.columns if c.startswith('SPI_')]
+            if colunas_spi:
+                with span('grafico.spi.construcao'):
+                    fig_spi = px.line(
+                        indices[periodo],
+                        x='DATA',
+                        y=colunas_spi,
+                        title="Índice de Precipitação Padronizado (SPI)",
+                        labels={'value': 'SPI', 'DATA': 'Data'}
+                    )
+                    fig_spi.add_hline(y=-1.5, line_dash='dash', line_color='orange')
+                    fig_spi.add_hline(y=-2, line_dash='dash', line_color='red')
+                    fig_spi.update_layout(height=350)
+                show_chart('spi', fig_spi)
+        with col2:
+            if 'GRAUS_DIA_SAFRA' in indices:
+                with span('grafico.graus_dia.construcao'):
+                    fig_gd = px.line(
+                        indices[periodo],
+                        x='DATA',
+                        y='GRAUS_DIA_SAFRA',
+                        title="Graus-dia acumulados no ano agrícola (base 10 °C)",
+                        labels={'GRAUS_DIA_SAFRA': 'Graus-dia', 'DATA': 'Data'}
+                    )
+                    fig_gd.update_layout(height=350)
+                show_chart('graus_dia', fig_gd)
+
+@fragment
+def comparison_section(watermark, nome_estacao, nomes_estacoes, inicio_periodo, fim_periodo):
+    """Comparação entre estações (entradas: estação, lista de estações e período)"""
+    st.header("🗺️ Comparação entre Estações")
     
-    X = df_ml[features]
-    y = df_ml[target]
+    if len(nomes_estacoes) < 2:
+        st.info("Cadastre mais estações em ESTACOES_COLETA para comparar séries.")
+    else:
+        sugeridas = [nome_estacao]
+        indice_estacoes = load_station_index(watermark)
+        if indice_estacoes is not None:
+            vizinhas_com_dados = neighbors_of(indice_estacoes, nome_estacao, 20)
+            sugeridas += [n for n in vizinhas_com_dados['nome_estacao'] if n in nomes_estacoes][:2]
+        
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            comparadas = st.multiselect("Estações comparadas:", nomes_estacoes, default=sugeridas,
+                                        key='estacoes_comparadas')
+        with col2:
+            variavel_comparacao = st.selectbox(
+                "Variável:",
+                ['TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA',
+                 'UMIDADE_RELATIVA', 'PRECIPITACAO', 'VELOCIDADE_VENTO', 'PRESSAO_ATMOSFERICA'],
+                key='variavel_comparacao'
+            )
+        
+        if nome_estacao not in comparadas:
+            comparadas = [nome_estacao] + comparadas
+        
+        comparacao = None
+        if len(comparadas) >= 2:
+            comparacao = load_comparison(
+                watermark, tuple(comparadas), variavel_comparacao, nome_estacao,
+                str(inicio_periodo.date()), str(fim_periodo.date())
+            )
+        
+        if comparacao is not None:
+            matriz, resultado = comparacao
+            
+            with span('grafico.comparacao.construcao'):
+                series = pd.DataFrame(matriz['valores'], index=matriz['datas'], columns=matriz['estacoes'])
+                fig_series = px.line(
+                    series,
+                    title=f"{variavel_comparacao} por estação",
+                    labels={'value': variavel_comparacao, 'index': 'Data', 'variable': 'Estação'}
+                )
+                fig_series.update_layout(height=400)
+                fig_corr = px.imshow(
+                    resultado['correlacao'].round(2),
+                    text_auto=True,
+                    zmin=-1,
+                    zmax=1,
+                    color_continuous_scale='RdBu_r',
+                    title="Correlação entre estações (dias em comum)"
+                )
+                fig_corr.update_layout(height=400)
+            show_chart('comparacao', fig_series)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                show_chart('correlacao', fig_corr)
+            with col2:
+                st.subheader(f"Em relação a {nome_estacao.title()}")
+                resumo = resultado['diferencas'].merge(resultado['melhor_defasagem'], on='estacao', how='left')
+                st.dataframe(resumo.round(2), hide_index=True)
+
+@fragment
+def regional_map_section(watermark, anos):
+    """Mapa regional (entrada: anos disponíveis; variável e ano só reexecutam esta seção)"""
+    st.header("🗺️ Mapa Regional da Bacia do Paraitinga")
+    
+    if st.checkbox("Gerar mapa animado", key='mapa_regional'):
+        col1, col2 = st.columns(2)
+        with col1:
+            variavel_mapa = st.selectbox(
+                "Variável do mapa:",
+                ['TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA',
+                 'PRECIPITACAO', 'UMIDADE_RELATIVA'],
+                key='variavel_mapa'
+            )
+        with col2:
+            ano_mapa = st.selectbox("Ano:", anos, key='ano_mapa')
+        
+        # Sem campos, o motivo (erro ou estações insuficientes) já foi exibido pelo carregador
+        campos = load_regional_fields(watermark, variavel_mapa, int(ano_mapa))
+        if campos is not None:
+            with span('grafico.mapa.construcao'):
+                fig_mapa = build_field_animation(campos, variavel_mapa)
+            show_chart('mapa', fig_mapa)
+            st.caption(f"IDW com {len(campos['estacoes'])} estações, sem correção de altitude.")
+
+@fragment
+def statistics_section(df_filtered, vista):
+    """Estatísticas descritivas (entrada: dados filtrados; a variável só reexecuta esta seção)"""
+    st.header("📋 Estatísticas Descritivas")
     
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    # Seletor de variável
+    variavel = st.selectbox(
+        "Selecione a variável para análise:",
+        ['TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA', 
+         'UMIDADE_RELATIVA', 'PRECIPITACAO', 'VELOCIDADE_VENTO', 'PRESSAO_ATMOSFERICA']
+    )
     
-    model = LinearRegression()
-    model.fit(X_train, y_train)
+    col1, col2 = st.columns(2)
     
-    y_pred = model.predict(X_test)
+    with col1:
+        # Estatísticas básicas
+        st.subheader("Estatísticas Básicas")
+        with span('estatisticas'):
+            stats = df_filtered[variavel].describe()
+        st.dataframe(stats)
     
-    mse = mean_squared_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
+    with col2:
+        # Histograma
+        show_cached_chart('histograma', lambda: build_histogram_figure(df_filtered, variavel),
+                          variavel=variavel, **vista)
+
+@fragment
+def raw_data_section(df_filtered, nome_estacao):
+    """Dados brutos e download (entradas: dados filtrados e estação)"""
+    st.header("📄 Dados Brutos")
     
-    return model, mse, r2, X_test, y_test, y_pred
+    if st.checkbox("Mostrar dados brutos"):
+        st.dataframe(df_filtered)
+        
+        # Download dos dados
+        with span('exportacao_csv'):
+            csv = df_filtered.to_csv(index=False)
+        st.download_button(
+            label="📥 Baixar dados como CSV",
+            data=csv,
+            file_name=f"dados_meteorologicos_{nome_estacao.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.csv",
+            mime="text/csv"
+        )
+
+# Seletor de estação
+watermark = get_current_watermark()
+estacoes = load_station_list(watermark, somente_com_dados=True)
+nomes_estacoes = sorted(estacoes['nome_estacao'].dropna().unique()) if estacoes is not None else []
+if ESTACAO_PADRAO not in nomes_estacoes:
+    nomes_estacoes = [ESTACAO_PADRAO] + nomes_estacoes
+
+estacao_selecionada = st.sidebar.selectbox(
+    "📍 Estação:",
+    nomes_estacoes,
+    index=nomes_estacoes.index(ESTACAO_PADRAO),
+    key='estacao'
+)
+
+# Título principal
+st.title(f"🌤️ Dashboard Meteorológico - {estacao_selecionada.title()}")
+st.markdown("---")
 
 # Carregar dados
 with st.spinner("Carregando dados do banco de dados..."):
-    df = load_data_from_database()
+    df = load_data_from_database(watermark, estacao_selecionada)
 
 if df is not None and not df.empty:
     # Sidebar com filtros
     st.sidebar.header("🔧 Filtros")
     
+    # Estações mais próximas da selecionada
+    with st.sidebar:
+        nearby_stations_section(watermark, estacao_selecionada)
+    
     # Mostrar informações sobre os dados
-    st.sidebar.info(f"📊 Total de registros: {len(df)}")
+    st.sidebar.info(f"📊 Total de registros: {int((~df['DIA_AUSENTE']).sum())}")
     st.sidebar.info(f"📅 Período: {df['DATA'].min().strftime('%d/%m/%Y')} a {df['DATA'].max().strftime('%d/%m/%Y')}")
     
+    # Lacunas de dados (relatório da ingestão)
+    lacunas = load_gaps(watermark, estacao_selecionada)
+    dias_ausentes = int(df['DIA_AUSENTE'].sum())
+    if dias_ausentes > 0 or (lacunas is not None and not lacunas.empty):
+        with st.sidebar.expander(f"🕳️ Lacunas ({dias_ausentes} dias sem registro)"):
+            if lacunas is not None and not lacunas.empty:
+                st.dataframe(gap_summary(lacunas), hide_index=True)
+                longas = lacunas[~lacunas['preenchida']].sort_values('duracao', ascending=False)
+                st.dataframe(longas[['variavel', 'inicio', 'fim', 'duracao']].head(20), hide_index=True)
+            st.caption("Lacunas de até 3 dias são interpoladas (exceto chuva); as demais aparecem como interrupções nos gráficos.")
+    
     # Filtro de data
     min_date = df['DATA'].min().date()
     max_date = df['DATA'].max().date()
@@ -156,13 +766,21 @@ if df is not None and not df.empty:
     # Aplicar filtro de data
     if len(date_range) == 2:
         start_date, end_date = date_range
-        df_filtered = df[(df['DATA'].dt.date >= start_date) & (df['DATA'].dt.date <= end_date)]
+        with span('filtro_periodo'):
+            df_filtered = filter_by_date(df, start_date, end_date)
     else:
         df_filtered = df
+    inicio_periodo = df_filtered['DATA'].min()
+    fim_periodo = df_filtered['DATA'].max()
+    
+    # Vista atual: chave das figuras no cache compartilhado (dados diários, sem reamostragem)
+    vista = {'watermark': watermark, 'estacao': estacao_selecionada,
+             'inicio': str(inicio_periodo.date()), 'fim': str(fim_periodo.date()), 'resolucao': 'diaria'}
     
     # Botão para atualizar dados
     if st.sidebar.button("🔄 Atualizar Dados"):
         st.cache_data.clear()
+        clear_figure_cache()
         st.rerun()
     
     # Métricas principais
@@ -192,136 +810,95 @@ if df is not None and not df.empty:
     st.header("📈 Análise Temporal")
     
     # Gráfico de temperatura ao longo do tempo
-    fig_temp = px.line(
-        df_filtered, 
-        x='DATA', 
-        y=['TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA', 'TEMPERATURA_MEDIA'],
-        title="Evolução da Temperatura ao Longo do Tempo",
-        labels={'value': 'Temperatura (°C)', 'DATA': 'Data'}
-    )
-    fig_temp.update_layout(height=400)
-    st.plotly_chart(fig_temp, use_container_width=True)
+    show_cached_chart('temperatura', lambda: build_temperature_figure(df_filtered), **vista)
     
     # Gráficos em duas colunas
     col1, col2 = st.columns(2)
     
     with col1:
         # Gráfico de precipitação
-        fig_precip = px.bar(
-            df_filtered, 
-            x='DATA', 
-            y='PRECIPITACAO',
-            title="Precipitação Diária",
-            labels={'PRECIPITACAO': 'Precipitação (mm)', 'DATA': 'Data'}
-        )
-        fig_precip.update_layout(height=400)
-        st.plotly_chart(fig_precip, use_container_width=True)
+        show_cached_chart('precipitacao', lambda: build_precipitation_figure(df_filtered), **vista)
     
     with col2:
         # Gráfico de umidade
-        fig_umidade = px.line(
-            df_filtered, 
-            x='DATA', 
-            y='UMIDADE_RELATIVA',
-            title="Umidade Relativa ao Longo do Tempo",
-            labels={'UMIDADE_RELATIVA': 'Umidade (%)', 'DATA': 'Data'}
-        )
-        fig_umidade.update_layout(height=400)
-        st.plotly_chart(fig_umidade, use_container_width=True)
+        show_cached_chart('umidade', lambda: build_humidity_figure(df_filtered), **vista)
     
     st.markdown("---")
     
-    # Análise de Machine Learning
-    st.header("🤖 Análise de Machine Learning")
+    anomalies_section(watermark, estacao_selecionada, inicio_periodo, fim_periodo)
     
-    if st.button("Executar Análise de ML"):
-        with st.spinner("Executando análise..."):
-            model, mse, r2, X_test, y_test, y_pred = run_ml_analysis(df)
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.metric("Erro Quadrático Médio (MSE)", f"{mse:.2f}")
-                st.metric("R² Score", f"{r2:.3f}")
-            
-            with col2:
-                # Gráfico de predição vs real
-                fig_ml = go.Figure()
-                fig_ml.add_trace(go.Scatter(
-                    x=y_test, 
-                    y=y_pred,
-                    mode='markers',
-                    name='Predições',
-                    marker=dict(color='blue', opacity=0.6)
-                ))
-                
-                # Linha de referência (predição perfeita)
-                min_val = min(y_test.min(), y_pred.min())
-                max_val = max(y_test.max(), y_pred.max())
-                fig_ml.add_trace(go.Scatter(
-                    x=[min_val, max_val], 
-                    y=[min_val, max_val],
-                    mode='lines',
-                    name='Predição Perfeita',
-                    line=dict(color='red', dash='dash')
-                ))
-                
-                fig_ml.update_layout(
-                    title="Predição vs. Temperatura Real",
-                    xaxis_title="Temperatura Real (°C)",
-                    yaxis_title="Temperatura Predita (°C)",
-                    height=400
-                )
-                
-                st.plotly_chart(fig_ml, use_container_width=True)
+    st.markdown("---")
+    
+    year_overlay_section(watermark, estacao_selecionada, sorted(df['DATA'].dt.year.unique(), reverse=True))
     
     st.markdown("---")
     
-    # Estatísticas descritivas
-    st.header("📋 Estatísticas Descritivas")
+    indices_section(watermark, estacao_selecionada, inicio_periodo, fim_periodo)
     
-    # Seletor de variável
-    variavel = st.selectbox(
-        "Selecione a variável para análise:",
-        ['TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA', 
-         'UMIDADE_RELATIVA', 'PRECIPITACAO', 'VELOCIDADE_VENTO', 'PRESSAO_ATMOSFERICA']
-    )
+    st.markdown("---")
     
-    col1, col2 = st.columns(2)
+    comparison_section(watermark, estacao_selecionada, nomes_estacoes, inicio_periodo, fim_periodo)
     
-    with col1:
-        # Estatísticas básicas
-        st.subheader("Estatísticas Básicas")
-        stats = df_filtered[variavel].describe()
-        st.dataframe(stats)
+    st.markdown("---")
     
-    with col2:
-        # Histograma
-        fig_hist = px.histogram(
-            df_filtered, 
-            x=variavel,
-            title=f"Distribuição de {variavel}",
-            nbins=30
-        )
-        fig_hist.update_layout(height=300)
-        st.plotly_chart(fig_hist, use_container_width=True)
+    regional_map_section(watermark, sorted(df['DATA'].dt.year.unique(), reverse=True))
     
     st.markdown("---")
     
-    # Dados brutos
-    st.header("📄 Dados Brutos")
+    # Análise de Machine Learning
+    st.header("🤖 Análise de Machine Learning")
     
-    if st.checkbox("Mostrar dados brutos"):
-        st.dataframe(df_filtered)
+    modelo_online = load_online_model(watermark, estacao_selecionada)
+    artefato = load_ml_artifact(watermark, estacao_selecionada)
+    
+    if modelo_online is None and artefato is None:
+        st.info("Nenhum modelo encontrado. Execute `python online_model.py` para a carga inicial do modelo incremental.")
+    else:
+        col1, col2 = st.columns(2)
         
-        # Download dos dados
-        csv = df_filtered.to_csv(index=False)
-        st.download_button(
-            label="📥 Baixar dados como CSV",
-            data=csv,
-            file_name=f"dados_meteorologicos_slp_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv"
-        )
+        with col1:
+            # Métricas do modelo incremental, atualizado a cada ingestão
+            if modelo_online is not None:
+                metricas = modelo_online['metricas']
+                st.metric("RMSE (modelo incremental)", f"{metricas['rmse']:.2f}")
+                if metricas['r2'] is not None:
+                    st.metric("R² (modelo incremental)", f"{metricas['r2']:.3f}")
+                st.caption(f"{metricas['n_total']} dias incorporados, até {modelo_online['ultima_data']}")
+            
+            # Avaliação em holdout do último retreino completo (job agendado)
+            if artefato is not None:
+                st.metric("MSE no teste (último retreino completo)", f"{artefato['metricas']['mse']:.2f}")
+                st.metric("R² no teste (último retreino completo)", f"{artefato['metricas']['r2']:.3f}")
+        
+        with col2:
+            # Gráfico de predição vs real
+            if artefato is not None:
+                y_test = np.asarray(artefato['y_test'])
+                y_pred = np.asarray(artefato['y_pred'])
+                show_cached_chart('ml', lambda: build_ml_figure(y_test, y_pred),
+                                  watermark=artefato['watermark'], estacao=estacao_selecionada)
+        
+        # Previsão para os próximos dias
+        if modelo_online is not None:
+            with span('grafico.previsao.construcao'):
+                fig_prev = px.line(
+                    modelo_online['previsao'],
+                    x='DATA',
+                    y='TEMPERATURA_MEDIA',
+                    markers=True,
+                    title="Previsão da Temperatura Média para os Próximos Dias (modelo incremental)",
+                    labels={'TEMPERATURA_MEDIA': 'Temperatura (°C)', 'DATA': 'Data'}
+                )
+                fig_prev.update_layout(height=350)
+            show_chart('previsao', fig_prev)
+    
+    st.markdown("---")
+    
+    statistics_section(df_filtered, vista)
+    
+    st.markdown("---")
+    
+    raw_data_section(df_filtered, estacao_selecionada)
 
 else:
     st.error("Não foi possível carregar os dados do banco de dados.")
@@ -332,6 +909,9 @@ else:
     
     if st.button("🔄 Tentar Novamente"):
         st.cache_data.clear()
+        clear_figure_cache()
         st.cache_resource.clear()
         st.rerun()
 
+# Painel de desempenho (ao final, para mostrar os tempos desta execução)
+show_performance_panel()
@@ -11,6 +11,8 @@ from sklearn.linear_model import LinearRegression
 from sklearn.metrics import mean_squared_error, r2_score
 import os
 
+from resampling import resample_station_data
+
 # Configuração da página
 st.set_page_config(
     page_title="Dashboard Meteorológico - São Luiz do Paraitinga",
@@ -31,7 +33,8 @@ def load_data():
     if os.path.exists(file_path):
         df = pd.read_csv(file_path)
         df['DATA'] = pd.to_datetime(df['DATA'])
-        return df
+        # Calendário diário contínuo: lacunas curtas interpoladas, longas como NaN
+        return resample_station_data(df)['dados']
     else:
         st.error("Arquivo de dados não encontrado!")
         return None
@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+import importlib.util
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from charts import (build_histogram_figure, build_humidity_figure, build_precipitation_figure,
+                    build_temperature_figure, filter_by_date)
+from data_collector import process_inmet_data
+from database import connect, load_weather_data
+from generate_sample_data import generate_synthetic_weather, to_frame
+from model_registry import train_model
+
+# Escala 1× = uma estação diária de 2000 até hoje (o tamanho de produção)
+ESCALAS = (1, 10, 100)
+REPETICOES = 3
+DIRETORIO_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'results')
+
+# Tabela equivalente à do Neon para o SQLite local
+TABELA_SQLITE = """
+CREATE TABLE IF NOT EXISTS dados_meteorologicos (
+    id INTEGER PRIMARY KEY,
+    data DATE NOT NULL,
+    hora TIME,
+    estacao VARCHAR(10),
+    nome_estacao VARCHAR(100),
+    uf VARCHAR(2),
+    regiao VARCHAR(2),
+    latitude DECIMAL(10, 6),
+    longitude DECIMAL(10, 6),
+    altitude DECIMAL(8, 2),
+    temperatura_maxima DECIMAL(5, 2),
+    temperatura_minima DECIMAL(5, 2),
+    temperatura_media DECIMAL(5, 2),
+    umidade_relativa DECIMAL(5, 2),
+    precipitacao DECIMAL(8, 2),
+    velocidade_vento DECIMAL(5, 2),
+    pressao_atmosferica DECIMAL(7, 2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(data, estacao)
+);
+"""
+
+
+def _importar_coletor():
+    """api/collect-data.py tem hífen no nome; importa pelo caminho"""
+    caminho = os.path.join(RAIZ, 'api', 'collect-data.py')
+    spec = importlib.util.spec_from_file_location('collect_data', caminho)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def _medir(funcao, repeticoes=REPETICOES, preparar=None):
+    """
+    Executa a função várias vezes e devolve tempos (s) e o pico de memória
+    alocada (MB, via tracemalloc) da primeira execução.
+    """
+    tempos = []
+    pico = None
+    for i in range(repeticoes):
+        argumentos = preparar() if preparar else ()
+        if i == 0:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        funcao(*argumentos)
+        tempos.append(time.perf_counter() - inicio)
+        if i == 0:
+            pico = tracemalloc.get_traced_memory()[1] / 1e6
+            tracemalloc.stop()
+    return {
+        'tempo_min_s': min(tempos),
+        'tempo_mediana_s': float(np.median(tempos)),
+        'pico_memoria_mb': pico
+    }
+
+
+def _escrever_csv_inmet(df, caminho):
+    """Grava o DataFrame no formato dos arquivos anuais do INMET (8 linhas de cabeçalho, ';' e ',')"""
+    cabecalho = [
+        'REGIAO:;SE', 'UF:;SP', 'ESTACAO:;SAO LUIZ DO PARAITINGA', 'CODIGO (WMO):;A740',
+        'LATITUDE:;-23,2283', 'LONGITUDE:;-45,4169', 'ALTITUDE:;874', 'DATA DE FUNDACAO:;2007-01-01'
+    ]
+    inmet = df.copy()
+    inmet['DATA'] = inmet['DATA'].dt.strftime('%Y-%m-%d')
+    inmet.columns = [c.replace('_', ' ') for c in inmet.columns]
+    with open(caminho, 'w', encoding='latin1') as f:
+        f.write('\n'.join(cabecalho) + '\n')
+        inmet.to_csv(f, sep=';', decimal=',', index=False)
+
+
+def run_benchmarks(escalas=ESCALAS, database_url=None, repeticoes=REPETICOES):
+    """Roda cada caminho de código em cada escala e devolve a lista de resultados"""
+    coletor = _importar_coletor()
+    resultados = []
+
+    for escala in escalas:
+        df = to_frame(generate_synthetic_weather(n_estacoes=escala, inicio='2000-01-01', semente=42))
+        linhas = len(df)
+        print(f"\n--- Escala {escala}x ({linhas} linhas) ---")
+
+        def registrar(caso, medida):
+            medida.update({'caso': caso, 'escala': escala, 'linhas': linhas})
+            resultados.append(medida)
+            print(f"{caso:<28} {medida['tempo_min_s'] * 1000:10.1f} ms  {medida['pico_memoria_mb']:8.1f} MB")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Leitura e filtro de um arquivo anual do INMET
+            caminho_csv = os.path.join(temp_dir, 'INMET_SE_SP_A740_BENCH.CSV')
+            _escrever_csv_inmet(df, caminho_csv)
+            registrar('process_inmet_data', _medir(
+                lambda: process_inmet_data(caminho_csv, output_dir=temp_dir), repeticoes))
+
+            # Montagem dos registros e upsert do coletor
+            df_coletor = pd.read_csv(caminho_csv, encoding='latin1', sep=';', skiprows=8, decimal=',')
+            df_coletor.columns = [col.strip().replace(' ', '_').replace('.', '') for col in df_coletor.columns]
+            registrar('coletor_build_records', _medir(lambda: coletor.build_records(df_coletor), repeticoes))
+            records = coletor.build_records(df_coletor)
+
+            url = database_url or f"sqlite:///{os.path.join(temp_dir, 'bench.db')}"
+            conn = connect(url)
+            cur = conn.cursor()
+            if url.startswith('sqlite:'):
+                cur.execute(TABELA_SQLITE)
+            conn.commit()
+
+            def upsert():
+                coletor.upsert_records(conn, cur, records)
+                conn.commit()
+            registrar('coletor_upsert', _medir(upsert, repeticoes))
+
+            # Leitura do banco pelo dashboard (todas as estações sintéticas)
+            registrar('load_weather_data', _medir(
+                lambda: load_weather_data(conn, nome_estacao=None), repeticoes))
+            cur.close()
+            conn.close()
+
+        # Filtro de período do app.py (último ano)
+        fim = df['DATA'].max().date()
+        inicio = (df['DATA'].max() - pd.DateOffset(years=1)).date()
+        registrar('filtro_periodo', _medir(lambda: filter_by_date(df, inicio, fim), repeticoes))
+
+        # Construção e serialização das figuras do dashboard
+        def figuras():
+            for fig in (build_temperature_figure(df), build_precipitation_figure(df),
+                        build_humidity_figure(df), build_histogram_figure(df, 'TEMPERATURA_MEDIA')):
+                fig.to_json()
+        registrar('figuras', _medir(figuras, repeticoes))
+
+        # Treino do modelo de ML (antigo run_ml_analysis)
+        registrar('train_model', _medir(lambda: train_model(df), repeticoes))
+
+    return resultados
+
+
+def _commit_atual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, text=True).strip()
+    except Exception:
+        return 'desconhecido'
+
+
+def save_results(resultados, diretorio=DIRETORIO_RESULTADOS):
+    """Grava os resultados em JSON com o commit e o ambiente de execução"""
+    os.makedirs(diretorio, exist_ok=True)
+    commit = _commit_atual()
+    agora = datetime.now()
+    caminho = os.path.join(diretorio, f"{agora.strftime('%Y%m%d_%H%M%S')}_{commit}.json")
+    with open(caminho, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'timestamp': agora.isoformat(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count(),
+            'resultados': resultados
+        }, f, indent=2)
+    return caminho
+
+
+def compare_results(caminho_base, caminho_novo):
+    """Tabela com a razão de tempo e memória (novo / base) de cada caso e escala"""
+    tabelas = []
+    for caminho in (caminho_base, caminho_novo):
+        with open(caminho) as f:
+            tabelas.append(pd.DataFrame(json.load(f)['resultados']).set_index(['caso', 'escala']))
+    base, novo = tabelas
+    return pd.DataFrame({
+        'base_ms': base['tempo_min_s'] * 1000,
+        'novo_ms': novo['tempo_min_s'] * 1000,
+        'razao_tempo': novo['tempo_min_s'] / base['tempo_min_s'],
+        'razao_memoria': novo['pico_memoria_mb'] / base['pico_memoria_mb']
+    }).dropna()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks dos caminhos críticos do projeto")
+    parser.add_argument('--escalas', type=int, nargs='+', default=list(ESCALAS))
+    parser.add_argument('--repeticoes', type=int, default=REPETICOES)
+    parser.add_argument('--database-url', help="banco a usar (padrão: SQLite temporário)")
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NOVO'),
+                        help="compara dois arquivos de resultados em vez de rodar")
+    args = parser.parse_args()
+
+    if args.comparar:
+        print(compare_results(*args.comparar).round(3).to_string())
+    else:
+        resultados = run_benchmarks(args.escalas, args.database_url, args.repeticoes)
+        print(f"\nResultados gravados em {save_results(resultados)}")
@@ -0,0 +1,163 @@
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+
+def filter_by_date(df, start_date, end_date):
+    """Aplica o filtro de período selecionado na barra lateral"""
+    return df[(df['DATA'].dt.date >= start_date) & (df['DATA'].dt.date <= end_date)]
+
+
+def build_temperature_figure(df_filtered):
+    """Gráfico de temperatura ao longo do tempo"""
+    fig_temp = px.line(
+        df_filtered,
+        x='DATA',
+        y=['TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA', 'TEMPERATURA_MEDIA'],
+        title="Evolução da Temperatura ao Longo do Tempo",
+        labels={'value': 'Temperatura (°C)', 'DATA': 'Data'}
+    )
+    fig_temp.update_layout(height=400)
+    return fig_temp
+
+
+def build_precipitation_figure(df_filtered):
+    """Gráfico de precipitação diária"""
+    fig_precip = px.bar(
+        df_filtered,
+        x='DATA',
+        y='PRECIPITACAO',
+        title="Precipitação Diária",
+        labels={'PRECIPITACAO': 'Precipitação (mm)', 'DATA': 'Data'}
+    )
+    fig_precip.update_layout(height=400)
+    return fig_precip
+
+
+def build_humidity_figure(df_filtered):
+    """Gráfico de umidade relativa ao longo do tempo"""
+    fig_umidade = px.line(
+        df_filtered,
+        x='DATA',
+        y='UMIDADE_RELATIVA',
+        title="Umidade Relativa ao Longo do Tempo",
+        labels={'UMIDADE_RELATIVA': 'Umidade (%)', 'DATA': 'Data'}
+    )
+    fig_umidade.update_layout(height=400)
+    return fig_umidade
+
+
+def build_histogram_figure(df_filtered, variavel):
+    """Histograma da variável selecionada"""
+    fig_hist = px.histogram(
+        df_filtered,
+        x=variavel,
+        title=f"Distribuição de {variavel}",
+        nbins=30
+    )
+    fig_hist.update_layout(height=300)
+    return fig_hist
+
+
+def build_ml_figure(y_test, y_pred):
+    """Gráfico de predição vs real"""
+    fig_ml = go.Figure()
+    fig_ml.add_trace(go.Scatter(
+        x=y_test,
+        y=y_pred,
+        mode='markers',
+        name='Predições',
+        marker=dict(color='blue', opacity=0.6)
+    ))
+
+    # Linha de referência (predição perfeita)
+    min_val = min(y_test.min(), y_pred.min())
+    max_val = max(y_test.max(), y_pred.max())
+    fig_ml.add_trace(go.Scatter(
+        x=[min_val, max_val],
+        y=[min_val, max_val],
+        mode='lines',
+        name='Predição Perfeita',
+        line=dict(color='red', dash='dash')
+    ))
+
+    fig_ml.update_layout(
+        title="Predição vs. Temperatura Real",
+        xaxis_title="Temperatura Real (°C)",
+        yaxis_title="Temperatura Predita (°C)",
+        height=400
+    )
+    return fig_ml
+
+
+def build_field_animation(campos, variavel, titulo=None):
+    """Mapa animado (um quadro por dia) dos campos interpolados"""
+    escala = 'Blues' if variavel == 'PRECIPITACAO' else 'RdYlBu_r'
+    validos = campos['campos'][np.isfinite(campos['campos'])]
+    fig_mapa = px.imshow(
+        campos['campos'],
+        x=campos['lon'],
+        y=campos['lat'],
+        animation_frame=0,
+        origin='lower',
+        zmin=float(np.percentile(validos, 1)) if validos.size else None,
+        zmax=float(np.percentile(validos, 99)) if validos.size else None,
+        color_continuous_scale=escala,
+        labels={'x': 'Longitude', 'y': 'Latitude', 'color': variavel, 'animation_frame': 'Dia'},
+        title=titulo or f"{variavel} interpolada"
+    )
+    # Rótulos do controle deslizante com a data de cada quadro
+    if fig_mapa.layout.sliders:
+        for passo, data in zip(fig_mapa.layout.sliders[0].steps, campos['datas']):
+            passo.label = data.strftime('%d/%m/%Y')
+
+    estacoes = campos['estacoes']
+    fig_mapa.add_trace(go.Scatter(
+        x=estacoes['longitude'],
+        y=estacoes['latitude'],
+        mode='markers',
+        text=estacoes['nome_estacao'],
+        name='Estações',
+        marker=dict(color='black', size=7, symbol='triangle-up')
+    ))
+    fig_mapa.update_xaxes(range=[campos['lon'][0], campos['lon'][-1]])
+    fig_mapa.update_yaxes(range=[campos['lat'][0], campos['lat'][-1]], scaleanchor='x')
+    fig_mapa.update_layout(height=550)
+    return fig_mapa
+
+
+def build_envelope_figure(envelope, variavel, ano):
+    """Ano escolhido sobre o envelope climatológico (faixas de percentis e recordes)"""
+    fig_envelope = go.Figure()
+    datas = envelope['DATA']
+
+    # Faixas sombreadas: P05–P95 e P25–P75
+    for inferior, superior, nome, cor in (('P05', 'P95', 'Percentis 5–95', 'rgba(100, 149, 237, 0.18)'),
+                                          ('P25', 'P75', 'Percentis 25–75', 'rgba(100, 149, 237, 0.35)')):
+        fig_envelope.add_trace(go.Scatter(x=datas, y=envelope[superior], mode='lines',
+                                          line=dict(width=0), showlegend=False, hoverinfo='skip'))
+        fig_envelope.add_trace(go.Scatter(x=datas, y=envelope[inferior], mode='lines', line=dict(width=0),
+                                          fill='tonexty', fillcolor=cor, name=nome))
+
+    fig_envelope.add_trace(go.Scatter(x=datas, y=envelope['P50'], mode='lines', name='Mediana',
+                                      line=dict(color='royalblue', dash='dash')))
+    fig_envelope.add_trace(go.Scatter(x=datas, y=envelope['RECORDE_MAXIMO'], mode='lines', name='Recorde máximo',
+                                      line=dict(color='firebrick', width=1, dash='dot'),
+                                      customdata=envelope['ANO_RECORDE_MAXIMO'].astype('float64'),
+                                      hovertemplate='%{y:.1f} (%{customdata:.0f})'))
+    fig_envelope.add_trace(go.Scatter(x=datas, y=envelope['RECORDE_MINIMO'], mode='lines', name='Recorde mínimo',
+                                      line=dict(color='navy', width=1, dash='dot'),
+                                      customdata=envelope['ANO_RECORDE_MINIMO'].astype('float64'),
+                                      hovertemplate='%{y:.1f} (%{customdata:.0f})'))
+    fig_envelope.add_trace(go.Scatter(x=datas, y=envelope['ATUAL'], mode='lines', name=str(ano),
+                                      line=dict(color='black', width=2),
+                                      customdata=envelope['PERCENTIL_ATUAL'],
+                                      hovertemplate='%{y:.1f} (percentil %{customdata:.0f})'))
+
+    fig_envelope.update_layout(
+        title=f"{variavel} em {ano} comparada aos demais anos",
+        xaxis_title="Data",
+        yaxis_title=variavel,
+        height=450
+    )
+    return fig_envelope
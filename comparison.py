@@ -0,0 +1,158 @@
+import numpy as np
+import pandas as pd
+
+from database import load_weather_data
+
+# Defasagem máxima (dias) da correlação cruzada
+DEFASAGEM_MAXIMA = 10
+
+# Mínimo de dias em comum para reportar uma correlação
+MINIMO_PARES = 30
+
+
+def station_matrix(df, variavel, estacoes=None):
+    """
+    Alinha as séries das estações em uma matriz densa datas × estações
+    sobre um calendário diário contínuo. Dias sem observação ficam NaN e
+    'mascara' marca as posições observadas.
+    """
+    df = df.dropna(subset=['DATA'])
+    estacoes = list(estacoes) if estacoes is not None else sorted(df['NOME_DA_ESTACAO'].dropna().unique())
+    if df.empty or not estacoes:
+        return {'datas': pd.DatetimeIndex([]), 'estacoes': estacoes,
+                'valores': np.empty((0, len(estacoes))), 'mascara': np.empty((0, len(estacoes)), bool)}
+
+    datas = pd.date_range(df['DATA'].min(), df['DATA'].max(), freq='D')
+    linha = (df['DATA'].to_numpy() - datas[0].to_datetime64()) // np.timedelta64(1, 'D')
+    coluna = pd.Categorical(df['NOME_DA_ESTACAO'], categories=estacoes).codes
+    x = df[variavel].to_numpy(dtype='float64')
+    valido = (coluna >= 0) & np.isfinite(x)
+
+    # Média das leituras que caem na mesma célula (ex.: dados horários)
+    forma = (len(datas), len(estacoes))
+    soma = np.zeros(forma)
+    contagem = np.zeros(forma)
+    np.add.at(soma, (linha[valido], coluna[valido]), x[valido])
+    np.add.at(contagem, (linha[valido], coluna[valido]), 1)
+    with np.errstate(invalid='ignore'):
+        valores = soma / contagem
+
+    return {
+        'datas': datas,
+        'estacoes': estacoes,
+        'valores': valores,
+        'mascara': contagem > 0
+    }
+
+
+def load_station_matrix(conn, estacoes, variavel, inicio=None, fim=None):
+    """Uma única consulta para todas as estações selecionadas, já alinhada em matriz"""
+    df = load_weather_data(conn, nome_estacao=list(estacoes), inicio=inicio, fim=fim, colunas=[variavel])
+    return station_matrix(df, variavel, estacoes)
+
+
+def correlation_matrix(matriz, minimo_pares=MINIMO_PARES):
+    """
+    Correlação de Pearson entre todas as estações usando apenas os dias
+    observados em ambas (pairwise complete), com produtos de matrizes.
+    Retorna (correlações, número de dias em comum).
+    """
+    m = matriz['mascara'].astype('float64')
+    x = np.where(matriz['mascara'], matriz['valores'], 0.0)
+
+    n = m.T @ m
+    soma = x.T @ m            # soma[i, j] = Σ x_i nos dias em que j também foi observada
+    soma2 = (x * x).T @ m
+    cruzada = x.T @ x
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * cruzada - soma * soma.T
+        var_i = n * soma2 - soma ** 2
+        corr = cov / np.sqrt(var_i * var_i.T)
+    corr[n < minimo_pares] = np.nan
+    return np.clip(corr, -1.0, 1.0), n.astype(int)
+
+
+def difference_summary(matriz, referencia):
+    """
+    Diferença de cada estação em relação à de referência (dia a dia),
+    resumida em viés médio, erro absoluto médio e dias em comum.
+    """
+    j = matriz['estacoes'].index(referencia)
+    diferenca = matriz['valores'] - matriz['valores'][:, [j]]
+    comum = np.isfinite(diferenca)
+    n = comum.sum(axis=0)
+    with np.errstate(invalid='ignore'):
+        vies = np.nansum(diferenca, axis=0) / n
+        mae = np.nansum(np.abs(diferenca), axis=0) / n
+    return pd.DataFrame({
+        'estacao': matriz['estacoes'],
+        'vies': vies,
+        'erro_absoluto_medio': mae,
+        'dias_em_comum': n
+    })
+
+
+def _correlacao_colunas(x, Y, minimo_pares=MINIMO_PARES):
+    """Correlação de um vetor com cada coluna de Y, só nos pares observados"""
+    m = np.isfinite(x)[:, None] & np.isfinite(Y)
+    n = m.sum(axis=0)
+    xm = np.where(m, x[:, None], 0.0)
+    ym = np.where(m, Y, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx = xm.sum(axis=0) / n
+        my = ym.sum(axis=0) / n
+        cov = (xm * ym).sum(axis=0) / n - mx * my
+        vx = (xm * xm).sum(axis=0) / n - mx ** 2
+        vy = (ym * ym).sum(axis=0) / n - my ** 2
+        corr = cov / np.sqrt(vx * vy)
+    corr[n < minimo_pares] = np.nan
+    return corr
+
+
+def lagged_cross_correlation(matriz, referencia, defasagem_maxima=DEFASAGEM_MAXIMA):
+    """
+    Correlação cruzada entre a estação de referência e todas as demais para
+    defasagens de -defasagem_maxima a +defasagem_maxima dias. Defasagem
+    positiva: a outra estação segue a referência com atraso.
+    Retorna um DataFrame defasagens × estações.
+    """
+    valores = matriz['valores']
+    x = valores[:, matriz['estacoes'].index(referencia)]
+    t = len(x)
+    defasagens = np.arange(-defasagem_maxima, defasagem_maxima + 1)
+
+    resultado = np.full((len(defasagens), valores.shape[1]), np.nan)
+    for i, d in enumerate(defasagens):
+        if abs(d) >= t:
+            continue
+        if d >= 0:
+            resultado[i] = _correlacao_colunas(x[:t - d], valores[d:])
+        else:
+            resultado[i] = _correlacao_colunas(x[-d:], valores[:t + d])
+
+    return pd.DataFrame(resultado, index=pd.Index(defasagens, name='defasagem'), columns=matriz['estacoes'])
+
+
+def best_lags(correlacao_cruzada):
+    """Defasagem de máxima correlação de cada estação"""
+    validas = correlacao_cruzada.dropna(axis=1, how='all')
+    return pd.DataFrame({
+        'estacao': validas.columns,
+        'defasagem': validas.idxmax().to_numpy(),
+        'correlacao': validas.max().to_numpy()
+    })
+
+
+def compare_stations(matriz, referencia, defasagem_maxima=DEFASAGEM_MAXIMA):
+    """Todas as comparações da visão multiestação de uma só vez"""
+    corr, pares = correlation_matrix(matriz)
+    cruzada = lagged_cross_correlation(matriz, referencia, defasagem_maxima)
+    return {
+        'correlacao': pd.DataFrame(corr, index=matriz['estacoes'], columns=matriz['estacoes']),
+        'dias_em_comum': pd.DataFrame(pares, index=matriz['estacoes'], columns=matriz['estacoes']),
+        'diferencas': difference_summary(matriz, referencia),
+        'correlacao_cruzada': cruzada,
+        'melhor_defasagem': best_lags(cruzada),
+        'cobertura': pd.Series(matriz['mascara'].mean(axis=0), index=matriz['estacoes'])
+    }
@@ -1,87 +1,276 @@
 
+import argparse
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are only written to disk
+
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_squared_error, r2_score
 import matplotlib.pyplot as plt
 import seaborn as sns
-import os
 
-def analyze_and_predict_weather(file_path="data/inmet_data_sao_luiz_do_paraitinga_combined.csv"):
-    """Performs data analysis and builds a simple prediction model."""
-    if not os.path.exists(file_path):
-        print(f"Error: Data file not found at {file_path}")
-        return
+from database import VARIAVEIS, connect, load_weather_data
+from forecasting import HORIZONTE, fit_forecaster, rolling_origin_backtest
+from resampling import gap_summary, resample_station_data
 
-    df = pd.read_csv(file_path)
+# Report output directory and manifest (file -> key of the inputs that produced it)
+REPORT_DIR = "data/relatorio"
+MANIFEST_FILE = "manifesto.json"
 
-    print("\n--- Data Overview ---")
-    print(df.head())
-    print("\n--- Data Info ---")
-    df.info()
-    print("\n--- Basic Statistics ---")
-    print(df.describe())
+# Bump when the drawing code changes so every figure is redrawn
+REPORT_VERSION = 1
 
-    # Convert 'DATA' to datetime objects
-    df["DATA"] = pd.to_datetime(df["DATA"])
-    df["MES"] = df["DATA"].dt.month
-    df["DIA_DO_ANO"] = df["DATA"].dt.dayofyear
+# Target of the forecast figure
+FORECAST_TARGET = "TEMPERATURA_MEDIA"
+
+
+def _slug(texto):
+    return re.sub(r"[^a-z0-9]+", "_", str(texto).lower()).strip("_")
+
+
+def slice_key(dados, parametros):
+    """Hash of a data slice plus the figure parameters and report version."""
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(dados, index=False).to_numpy().tobytes())
+    h.update(json.dumps(list(dados.columns)).encode())
+    h.update(json.dumps({**parametros, "versao": REPORT_VERSION}, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+def _task(tipo, arquivo, dados, **parametros):
+    return {
+        "tipo": tipo,
+        "arquivo": arquivo,
+        "parametros": parametros,
+        "dados": dados,
+        "chave": slice_key(dados, {"tipo": tipo, **parametros})
+    }
+
+
+def report_tasks(df, variaveis=VARIAVEIS, previsao=True):
+    """
+    One task per figure: per station and variable, the full series, the
+    distribution and one series per year; per variable, all stations
+    together (monthly means); per station, the forecast vs. observed plot.
+    Each task carries only its own slice, so its key changes only when
+    that slice changes.
+    """
+    df = df.dropna(subset=["DATA"]).sort_values("DATA")
+    variaveis = [v for v in variaveis if v in df.columns]
+    if "NOME_DA_ESTACAO" in df.columns:
+        estacoes = list(df.groupby("NOME_DA_ESTACAO", sort=True))
+    else:
+        estacoes = [("estacao", df)]
+
+    tarefas = []
+    for estacao, grupo in estacoes:
+        pasta = _slug(estacao)
+        for var in variaveis:
+            dados = grupo[["DATA", var]].dropna().reset_index(drop=True)
+            if dados.empty:
+                continue
+            nome = _slug(var)
+            tarefas.append(_task("serie", f"{pasta}/{nome}.png", dados, estacao=estacao, variavel=var))
+            tarefas.append(_task("distribuicao", f"{pasta}/{nome}_distribuicao.png", dados,
+                                 estacao=estacao, variavel=var))
+            for ano, fatia in dados.groupby(dados["DATA"].dt.year):
+                tarefas.append(_task("ano", f"{pasta}/{ano}/{nome}.png", fatia.reset_index(drop=True),
+                                     estacao=estacao, variavel=var, ano=int(ano)))
 
-    # --- Machine Learning Model (Simple Linear Regression) ---
-    # Predict average temperature based on month and day of year
-    features = ["MES", "DIA_DO_ANO"]
-    target = "TEMPERATURA_MEDIA"
+        if previsao and FORECAST_TARGET in grupo.columns:
+            dados = grupo[["DATA", FORECAST_TARGET]].reset_index(drop=True)
+            if not dados[FORECAST_TARGET].dropna().empty:
+                tarefas.append(_task("previsao", f"{pasta}/previsao_vs_real.png", dados,
+                                     estacao=estacao, variavel=FORECAST_TARGET, horizonte=HORIZONTE))
 
-    # Drop rows with NaN values in features or target
-    df_ml = df.dropna(subset=features + [target])
+    if len(estacoes) > 1:
+        for var in variaveis:
+            dados = df[["DATA", "NOME_DA_ESTACAO", var]].dropna().reset_index(drop=True)
+            if not dados.empty:
+                tarefas.append(_task("estacoes", f"estacoes/{_slug(var)}.png", dados, variavel=var))
 
-    if df_ml.empty:
-        print("Not enough data after dropping NaNs for ML model.")
-        return
+    return tarefas
 
-    X = df_ml[features]
-    y = df_ml[target]
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+def render_figure(tarefa, saida=REPORT_DIR):
+    """Draws one report figure (runs inside the worker processes)."""
+    dados = tarefa["dados"]
+    p = tarefa["parametros"]
+    var = p["variavel"]
+    titulo = p.get("estacao", "")
 
-    model = LinearRegression()
-    model.fit(X_train, y_train)
+    fig, ax = plt.subplots(figsize=(12, 6))
+    if tarefa["tipo"] in ("serie", "ano"):
+        sns.lineplot(x="DATA", y=var, data=dados, ax=ax)
+        ax.set_title(f"{var} - {titulo}" + (f" ({p['ano']})" if "ano" in p else ""))
+        ax.set_xlabel("Data")
+    elif tarefa["tipo"] == "distribuicao":
+        sns.histplot(dados[var], kde=True, ax=ax)
+        ax.set_title(f"Distribuição de {var} - {titulo}")
+    elif tarefa["tipo"] == "estacoes":
+        mensal = dados.groupby(["NOME_DA_ESTACAO", pd.Grouper(key="DATA", freq="MS")])[var].mean().reset_index()
+        sns.lineplot(x="DATA", y=var, hue="NOME_DA_ESTACAO", data=mensal, ax=ax)
+        ax.set_title(f"{var} por estação (média mensal)")
+        ax.set_xlabel("Data")
+    elif tarefa["tipo"] == "previsao":
+        _, mse, r2, _, y_test, y_pred = fit_forecaster(dados, var, p["horizonte"])
+        sns.scatterplot(x=y_test, y=y_pred, ax=ax)
+        ax.set_xlabel(f"{var} real")
+        ax.set_ylabel(f"{var} prevista")
+        ax.set_title(f"Previsão vs. Real - {titulo} (MSE {mse:.2f}, R² {r2:.2f})")
+    ax.grid(True)
 
-    y_pred = model.predict(X_test)
+    caminho = os.path.join(saida, tarefa["arquivo"])
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    fig.savefig(caminho)
+    plt.close(fig)
+    return tarefa["arquivo"]
 
-    mse = mean_squared_error(y_test, y_pred)
-    r2 = r2_score(y_test, y_pred)
 
-    print(f"\n--- Machine Learning Model Results ---")
-    print(f"Mean Squared Error (MSE): {mse:.2f}")
-    print(f"R-squared (R2): {r2:.2f}")
+def _read_manifest(saida):
+    caminho = os.path.join(saida, MANIFEST_FILE)
+    if not os.path.exists(caminho):
+        return {}
+    try:
+        with open(caminho) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(saida, manifesto):
+    caminho = os.path.join(saida, MANIFEST_FILE)
+    temporario = caminho + ".tmp"
+    with open(temporario, "w") as f:
+        json.dump(manifesto, f, indent=2, sort_keys=True)
+    os.replace(temporario, caminho)
+
+
+def build_report(df, saida=REPORT_DIR, variaveis=VARIAVEIS, max_workers=None, previsao=True):
+    """
+    Renders the report figures in a process pool, skipping every figure
+    whose key (hash of its input slice and parameters) matches the manifest
+    and whose file still exists. Figures that are no longer produced are
+    removed. After a daily ingest only the current year and full-period
+    figures of the stations that received data are redrawn.
+    """
+    os.makedirs(saida, exist_ok=True)
+    anterior = _read_manifest(saida)
+    tarefas = report_tasks(df, variaveis, previsao)
+
+    pendentes = [
+        t for t in tarefas
+        if anterior.get(t["arquivo"]) != t["chave"] or not os.path.exists(os.path.join(saida, t["arquivo"]))
+    ]
+    redesenhar = {t["arquivo"] for t in pendentes}
+    manifesto = {t["arquivo"]: t["chave"] for t in tarefas if t["arquivo"] not in redesenhar}
+
+    falhas = {}
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(pendentes), 1))
+    if max_workers == 1:
+        for tarefa in pendentes:
+            try:
+                render_figure(tarefa, saida)
+                manifesto[tarefa["arquivo"]] = tarefa["chave"]
+            except Exception as e:
+                falhas[tarefa["arquivo"]] = str(e)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {executor.submit(render_figure, tarefa, saida): tarefa for tarefa in pendentes}
+            for futuro in as_completed(futuros):
+                tarefa = futuros[futuro]
+                try:
+                    futuro.result()
+                    manifesto[tarefa["arquivo"]] = tarefa["chave"]
+                except Exception as e:
+                    falhas[tarefa["arquivo"]] = str(e)
+
+    removidas = 0
+    for arquivo in set(anterior) - {t["arquivo"] for t in tarefas}:
+        caminho = os.path.join(saida, arquivo)
+        if os.path.exists(caminho):
+            os.remove(caminho)
+            removidas += 1
+
+    _write_manifest(saida, manifesto)
+    return {
+        "figuras": len(tarefas),
+        "geradas": len(pendentes) - len(falhas),
+        "reaproveitadas": len(tarefas) - len(pendentes),
+        "removidas": removidas,
+        "falhas": falhas
+    }
+
+
+def analyze_and_predict_weather(file_path="data/inmet_data_sao_luiz_do_paraitinga_combined.csv", df=None,
+                                saida=REPORT_DIR, max_workers=None, detalhes=False, backtest=False):
+    """Performs data analysis and renders the figure report (only what changed)."""
+    if df is None:
+        if not os.path.exists(file_path):
+            print(f"Error: Data file not found at {file_path}")
+            return
+        df = pd.read_csv(file_path)
+
+    if detalhes:
+        print("\n--- Data Overview ---")
+        print(df.head())
+        print("\n--- Data Info ---")
+        df.info()
+        print("\n--- Basic Statistics ---")
+        print(df.describe())
+
+    # Convert 'DATA' to datetime objects
+    df["DATA"] = pd.to_datetime(df["DATA"])
 
-    # --- Data Visualization (Example) ---
-    plt.figure(figsize=(12, 6))
-    sns.lineplot(x=\
+    # Continuous daily calendar: short gaps interpolated, long gaps left as NaN
+    resampled = resample_station_data(df)
+    df = resampled["dados"]
+    if not resampled["lacunas"].empty:
+        print("\n--- Data Gaps ---")
+        print(gap_summary(resampled["lacunas"]).to_string(index=False))
 
-        "DATA", y="TEMPERATURA_MEDIA", data=df, label="Temperatura Média Real")
-    plt.title("Temperatura Média ao Longo do Tempo em São Luiz do Paraitinga")
-    plt.xlabel("Data")
-    plt.ylabel("Temperatura Média (°C)")
-    plt.grid(True)
-    plt.savefig("data/temperatura_media_slp.png")
-    plt.close()
+    # --- Seasonal harmonic forecaster ---
+    # Time-ordered rolling-origin backtests (no future data in training);
+    # the 1-day-ahead holdout is drawn per station in the report
+    if backtest and not df[FORECAST_TARGET].dropna().empty:
+        resultado = rolling_origin_backtest(df, variaveis=[FORECAST_TARGET])
+        if not resultado.empty:
+            print("\n--- Rolling-Origin Backtest (mean over folds) ---")
+            print(resultado.groupby("horizonte")[["mae", "rmse"]].mean())
 
-    plt.figure(figsize=(10, 6))
-    sns.scatterplot(x=y_test, y=y_pred)
-    plt.xlabel("Temperatura Média Real (°C)")
-    plt.ylabel("Temperatura Média Prevista (°C)")
-    plt.title("Previsão vs. Real (Temperatura Média)")
-    plt.grid(True)
-    plt.savefig("data/previsao_vs_real_slp.png")
-    plt.close()
+    # --- Figure report ---
+    relatorio = build_report(df, saida, max_workers=max_workers)
 
-    print("\n--- Visualizations Saved ---")
-    print("temperatura_media_slp.png")
-    print("previsao_vs_real_slp.png")
+    print("\n--- Report ---")
+    print(f"{relatorio['figuras']} figures in {saida}: {relatorio['geradas']} rendered, "
+          f"{relatorio['reaproveitadas']} unchanged, {relatorio['removidas']} removed")
+    for arquivo, erro in relatorio["falhas"].items():
+        print(f"Failed {arquivo}: {erro}")
+    return relatorio
 
 if __name__ == "__main__":
-    analyze_and_predict_weather()
+    parser = argparse.ArgumentParser(description="Relatório de figuras dos dados meteorológicos")
+    parser.add_argument("arquivo", nargs="?", default="data/inmet_data_sao_luiz_do_paraitinga_combined.csv")
+    parser.add_argument("--banco", action="store_true", help="todas as estações do banco (DATABASE_URL)")
+    parser.add_argument("--saida", default=REPORT_DIR)
+    parser.add_argument("--processos", type=int, help="processos de renderização (padrão: núcleos)")
+    parser.add_argument("--detalhes", action="store_true", help="imprime head/info/describe")
+    parser.add_argument("--backtest", action="store_true", help="roda o backtest com origem móvel")
+    args = parser.parse_args()
 
+    df = None
+    if args.banco:
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            print("Por favor, defina a variável de ambiente DATABASE_URL")
+            raise SystemExit(1)
+        conn = connect(database_url)
+        df = load_weather_data(conn, nome_estacao=None)
+        conn.close()
 
+    analyze_and_predict_weather(args.arquivo, df=df, saida=args.saida, max_workers=args.processos,
+                                detalhes=args.detalhes, backtest=args.backtest)
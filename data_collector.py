@@ -6,6 +6,9 @@ import zipfile
 import glob
 from datetime import datetime
 
+from database import ESTACAO_PADRAO
+from stations import attach_station, configured_stations, is_configured, read_station_header
+
 def download_inmet_data(year, output_dir="data"):
     """Downloads INMET historical data for a given year."""
     if not os.path.exists(output_dir):
@@ -32,14 +35,17 @@ def extract_zip(zip_file_path, extract_dir):
         zip_ref.extractall(extract_dir)
     print(f"Extracted {zip_file_path} to {extract_dir}")
 
-def process_inmet_data(file_path, city_name="SAO LUIZ DO PARAITINGA", output_dir="data"):
+def process_inmet_data(file_path, city_name=ESTACAO_PADRAO, output_dir="data"):
     """Processes INMET data to filter for a specific city and saves as CSV."""
     df = pd.read_csv(file_path, encoding='latin1', sep=';', skiprows=8, decimal=',')
     
     # Clean column names
     df.columns = [col.strip().replace(' ', '_').replace(".", '') for col in df.columns]
 
-    # Filter for São Luiz do Paraitinga
+    # Station identity comes from the file header when the rows don't carry it
+    df = attach_station(df, read_station_header(file_path))
+
+    # Filter for the requested station
     df_sjc = df[df['NOME_DA_ESTACAO'] == city_name.upper()]
 
     if df_sjc.empty:
@@ -62,13 +68,14 @@ if __name__ == "__main__":
             extract_dir = os.path.join("data", str(year))
             extract_zip(zip_file, extract_dir)
             
-            # Find the CSV file dynamically within the extracted directory
-            csv_files = glob.glob(os.path.join(extract_dir, "*.CSV"))
-            if csv_files:
-                # Assuming there's only one CSV file per zip or we take the first one
-                extracted_csv_path = csv_files[0]
-                process_inmet_data(extracted_csv_path)
-            else:
+            # One CSV per station; keep the stations listed in ESTACOES_COLETA
+            csv_files = glob.glob(os.path.join(extract_dir, "**", "*.CSV"), recursive=True)
+            selected = configured_stations()
+            for extracted_csv_path in csv_files:
+                header = read_station_header(extracted_csv_path)
+                if is_configured(header, selected):
+                    process_inmet_data(extracted_csv_path, city_name=header['nome_estacao'])
+            if not csv_files:
                 print(f"No CSV file found in {extract_dir}.")
 
 
@@ -0,0 +1,289 @@
+import json
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+import psycopg2
+
+from perf import span
+
+# Estação padrão do dashboard
+ESTACAO_PADRAO = 'SAO LUIZ DO PARAITINGA'
+
+# Mapeamento das colunas do banco para os nomes usados nos DataFrames
+COLUNAS_BANCO = {
+    'data': 'DATA',
+    'hora': 'HORA',
+    'estacao': 'ESTACAO',
+    'nome_estacao': 'NOME_DA_ESTACAO',
+    'uf': 'UF',
+    'regiao': 'REGIAO',
+    'latitude': 'LATITUDE',
+    'longitude': 'LONGITUDE',
+    'altitude': 'ALTITUDE',
+    'temperatura_maxima': 'TEMPERATURA_MAXIMA',
+    'temperatura_minima': 'TEMPERATURA_MINIMA',
+    'temperatura_media': 'TEMPERATURA_MEDIA',
+    'umidade_relativa': 'UMIDADE_RELATIVA',
+    'precipitacao': 'PRECIPITACAO',
+    'velocidade_vento': 'VELOCIDADE_VENTO',
+    'pressao_atmosferica': 'PRESSAO_ATMOSFERICA'
+}
+
+# Colunas numéricas (DECIMAL no Postgres)
+COLUNAS_NUMERICAS = [
+    'LATITUDE', 'LONGITUDE', 'ALTITUDE',
+    'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA', 'TEMPERATURA_MEDIA',
+    'UMIDADE_RELATIVA', 'PRECIPITACAO', 'VELOCIDADE_VENTO', 'PRESSAO_ATMOSFERICA'
+]
+
+# Variáveis meteorológicas analisadas no dashboard
+VARIAVEIS = [
+    'TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA',
+    'UMIDADE_RELATIVA', 'PRECIPITACAO', 'VELOCIDADE_VENTO', 'PRESSAO_ATMOSFERICA'
+]
+
+
+def connect(database_url):
+    """
+    Abre uma conexão com o banco. URLs 'sqlite:///caminho.db' usam um
+    SQLite local como substituto do Neon (testes e desenvolvimento).
+    """
+    if database_url.startswith('sqlite:'):
+        return sqlite3.connect(database_url.split('sqlite:///', 1)[-1])
+    return psycopg2.connect(database_url)
+
+
+def is_sqlite(conn):
+    """Indica se a conexão é o substituto SQLite local"""
+    return isinstance(conn, sqlite3.Connection)
+
+
+def placeholder(conn):
+    """Marcador de parâmetro do driver da conexão"""
+    return '?' if is_sqlite(conn) else '%s'
+
+
+def create_control_table(cur):
+    """Cria a tabela com a marca d'água da última ingestão"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS controle_ingestao (
+        id INTEGER PRIMARY KEY,
+        watermark VARCHAR(64) NOT NULL,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+
+def bump_data_watermark(conn):
+    """
+    Registra uma nova marca d'água de ingestão. Deve ser chamada sempre que
+    'dados_meteorologicos' for alterada, para invalidar os caches de leitura.
+    """
+    watermark = datetime.now().strftime('%Y%m%dT%H%M%S.%f')
+    p = placeholder(conn)
+    cur = conn.cursor()
+    create_control_table(cur)
+    cur.execute(f"""
+    INSERT INTO controle_ingestao (id, watermark, atualizado_em) VALUES (1, {p}, CURRENT_TIMESTAMP)
+    ON CONFLICT (id) DO UPDATE SET
+        watermark = EXCLUDED.watermark,
+        atualizado_em = EXCLUDED.atualizado_em
+    """, (watermark,))
+    conn.commit()
+    cur.close()
+    return watermark
+
+
+# Colunas de collector_runs posteriores à primeira versão da tabela
+COLUNAS_RUNS_ADICIONAIS = [
+    ('tamanho_lote', 'INTEGER'),
+    ('lotes', 'INTEGER'),
+    ('pico_memoria_mb', 'DOUBLE PRECISION'),
+    ('pico_memoria_ingestao_mb', 'DOUBLE PRECISION')
+]
+
+
+def create_runs_table(cur):
+    """Cria a tabela com o histórico de execuções do coletor"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS collector_runs (
+        iniciado_em TIMESTAMP NOT NULL,
+        status VARCHAR(10) NOT NULL,
+        ano INTEGER,
+        arquivos INTEGER,
+        bytes_baixados BIGINT,
+        tempo_download DOUBLE PRECISION,
+        tempo_descompressao DOUBLE PRECISION,
+        tempo_parse DOUBLE PRECISION,
+        tempo_conversao DOUBLE PRECISION,
+        tempo_upsert DOUBLE PRECISION,
+        tempo_total DOUBLE PRECISION,
+        linhas_lidas INTEGER,
+        linhas_rejeitadas INTEGER,
+        linhas_gravadas INTEGER,
+        linhas_por_segundo DOUBLE PRECISION,
+        erros TEXT
+    );
+    """)
+
+    # Colunas acrescentadas depois da criação da tabela
+    if is_sqlite(cur.connection):
+        existentes = {linha[1] for linha in cur.execute("PRAGMA table_info(collector_runs)").fetchall()}
+        for coluna, tipo in COLUNAS_RUNS_ADICIONAIS:
+            if coluna not in existentes:
+                cur.execute(f"ALTER TABLE collector_runs ADD COLUMN {coluna} {tipo}")
+    else:
+        for coluna, tipo in COLUNAS_RUNS_ADICIONAIS:
+            cur.execute(f"ALTER TABLE collector_runs ADD COLUMN IF NOT EXISTS {coluna} {tipo}")
+
+
+def record_collector_run(conn, execucao):
+    """Grava a telemetria de uma execução do coletor em 'collector_runs'"""
+    tempos = execucao['tempos']
+    valores = (
+        execucao['iniciado_em'], execucao['status'], execucao['ano'], execucao['arquivos'],
+        execucao['bytes_baixados'], tempos['download'], tempos['descompressao'], tempos['parse'],
+        tempos['conversao'], tempos['upsert'], execucao['tempo_total'], execucao['linhas_lidas'],
+        execucao['linhas_rejeitadas'], execucao['linhas_gravadas'], execucao['linhas_por_segundo'],
+        json.dumps(execucao['erros']), execucao.get('tamanho_lote'), execucao.get('lotes'),
+        execucao.get('pico_memoria_mb'), execucao.get('pico_memoria_ingestao_mb')
+    )
+    marcadores = ', '.join([placeholder(conn)] * len(valores))
+    cur = conn.cursor()
+    create_runs_table(cur)
+    cur.execute(f"""
+    INSERT INTO collector_runs (
+        iniciado_em, status, ano, arquivos, bytes_baixados,
+        tempo_download, tempo_descompressao, tempo_parse, tempo_conversao, tempo_upsert,
+        tempo_total, linhas_lidas, linhas_rejeitadas, linhas_gravadas, linhas_por_segundo, erros,
+        tamanho_lote, lotes, pico_memoria_mb, pico_memoria_ingestao_mb
+    ) VALUES ({marcadores})
+    """, valores)
+    conn.commit()
+    cur.close()
+
+
+def get_data_watermark(conn):
+    """
+    Retorna a marca d'água atual dos dados. Se a tabela de controle ainda
+    não existir, deriva uma marca da contagem e das datas mais recentes.
+    """
+    with span('db.get_data_watermark'):
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT watermark FROM controle_ingestao WHERE id = 1")
+            row = cur.fetchone()
+        except Exception:
+            conn.rollback()
+            row = None
+
+        if row is not None:
+            cur.close()
+            return row[0]
+
+        cur.execute("SELECT COUNT(*), MAX(data), MAX(created_at) FROM dados_meteorologicos")
+        count, max_data, max_created = cur.fetchone()
+        cur.close()
+        return f"{count}:{max_data}:{max_created}"
+
+
+def data_signature(conn, nome_estacao, ate):
+    """
+    Assinatura barata (contagem e somas das variáveis) das linhas da estação
+    anteriores a 'ate': muda quando algum dia desse trecho é inserido,
+    revisado ou apagado, sem transferir as linhas
+    """
+    somas = ', '.join(f"SUM({coluna})" for coluna, nome in COLUNAS_BANCO.items() if nome in VARIAVEIS)
+    p = placeholder(conn)
+    cur = conn.cursor()
+    cur.execute(f"""
+    SELECT COUNT(*), {somas} FROM dados_meteorologicos
+    WHERE nome_estacao = {p} AND data < {p}
+    """, (nome_estacao, str(pd.Timestamp(ate).date())))
+    row = cur.fetchone()
+    cur.close()
+    return tuple(None if v is None else round(float(v), 6) for v in row)
+
+
+def station_coverage(conn, nome_estacao, antes=None, variaveis=VARIAVEIS):
+    """
+    Primeiro e último dia com registro da estação (só antes de 'antes', se
+    informado) e quantos dias têm valor em cada variável, sem transferir as linhas
+    """
+    nomes = {v: k for k, v in COLUNAS_BANCO.items()}
+    contagens = ', '.join(f"COUNT({nomes[v]})" for v in variaveis)
+    p = placeholder(conn)
+    filtros = [f"nome_estacao = {p}"]
+    params = [nome_estacao]
+    if antes is not None:
+        filtros.append(f"data < {p}")
+        params.append(str(pd.Timestamp(antes).date()))
+
+    cur = conn.cursor()
+    cur.execute(f"""
+    SELECT MIN(data), MAX(data), {contagens}
+    FROM dados_meteorologicos
+    WHERE {' AND '.join(filtros)}
+    """, params)
+    primeiro, ultimo, *observados = cur.fetchone()
+    cur.close()
+    return {
+        'primeiro': pd.Timestamp(primeiro) if primeiro is not None else None,
+        'ultimo': pd.Timestamp(ultimo) if ultimo is not None else None,
+        'observados': dict(zip(variaveis, (int(n) for n in observados)))
+    }
+
+
+def load_weather_data(conn, nome_estacao=ESTACAO_PADRAO, inicio=None, fim=None, colunas=None):
+    """
+    Carrega os dados meteorológicos de uma estação, opcionalmente restritos
+    a um período e a um subconjunto de variáveis. Com nome_estacao=None
+    carrega todas as estações; uma lista de nomes carrega várias.
+    """
+    if colunas is None:
+        colunas = list(COLUNAS_BANCO) + ['created_at']
+    else:
+        nomes = {v: k for k, v in COLUNAS_BANCO.items()}
+        colunas = ['data'] + [nomes.get(c, c) for c in colunas if nomes.get(c, c) != 'data']
+
+    p = placeholder(conn)
+    filtros = ['1 = 1']
+    params = []
+    if isinstance(nome_estacao, (list, tuple, set)):
+        colunas = colunas + ([] if 'nome_estacao' in colunas else ['nome_estacao'])
+        filtros.append(f"nome_estacao IN ({', '.join([p] * len(nome_estacao))})")
+        params.extend(nome_estacao)
+    elif nome_estacao is not None:
+        filtros.append(f"nome_estacao = {p}")
+        params.append(nome_estacao)
+    if inicio is not None:
+        filtros.append(f"data >= {p}")
+        params.append(str(inicio))
+    if fim is not None:
+        filtros.append(f"data <= {p}")
+        params.append(str(fim))
+
+    query = f"""
+    SELECT {', '.join(colunas)}
+    FROM dados_meteorologicos
+    WHERE {' AND '.join(filtros)}
+    ORDER BY data DESC
+    """
+
+    with span('db.load_weather_data', estacao=nome_estacao):
+        df = pd.read_sql_query(query, conn, params=params)
+
+    with span('db.conversao', linhas=len(df)):
+        # Converter coluna de data
+        df['data'] = pd.to_datetime(df['data'])
+
+        # Renomear colunas para manter compatibilidade
+        df = df.rename(columns=COLUNAS_BANCO)
+
+        # DECIMAL chega como objetos Decimal; converter uma vez para float
+        for col in COLUNAS_NUMERICAS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+
+    return df
@@ -0,0 +1,212 @@
+import os
+import calendar
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import gamma
+
+# Períodos de retorno (anos) reportados por padrão
+PERIODOS_RETORNO = (2, 5, 10, 25, 50, 100)
+
+# Bootstrap
+N_BOOTSTRAP = 5000
+NIVEL_CONFIANCA = 0.95
+SEMENTE = 42
+
+# Máximos anuais: fração mínima de dias observados para aceitar o ano
+COBERTURA_MINIMA = 0.8
+
+# Picos acima do limiar: quantil do limiar e dias mínimos entre eventos distintos
+QUANTIL_LIMIAR = 0.98
+SEPARACAO_EVENTOS = 3
+
+_EULER = 0.5772156649015329
+_TOLERANCIA_GUMBEL = 1e-6
+
+
+def annual_maxima(df, variavel='PRECIPITACAO', cobertura_minima=COBERTURA_MINIMA):
+    """Máximo diário de cada ano com cobertura suficiente de dados"""
+    serie = df.dropna(subset=['DATA']).groupby('DATA')[variavel].max()
+    anos = serie.index.year
+    maximos = serie.groupby(anos).max()
+    dias_no_ano = np.array([366 if calendar.isleap(ano) else 365 for ano in maximos.index])
+    cobertura = serie.notna().groupby(anos).sum().to_numpy() / dias_no_ano
+    return maximos[(cobertura >= cobertura_minima) & maximos.notna().to_numpy()]
+
+
+def peaks_over_threshold(df, variavel='PRECIPITACAO', quantil=QUANTIL_LIMIAR,
+                         separacao=SEPARACAO_EVENTOS):
+    """
+    Excessos acima do limiar, com desagrupamento por sequências: excedências
+    separadas por menos de 'separacao' dias formam um único evento (o pico).
+
+    Retorna (excessos, limiar, eventos_por_ano).
+    """
+    serie = df.dropna(subset=['DATA']).groupby('DATA')[variavel].max().dropna().sort_index()
+    valores = serie.to_numpy(dtype='float64')
+    limiar = float(np.quantile(valores, quantil))
+
+    posicoes = np.flatnonzero(valores > limiar)
+    if len(posicoes) == 0:
+        return np.array([]), limiar, 0.0
+
+    dias = (serie.index[posicoes] - serie.index[0]).days.to_numpy()
+    inicios = np.concatenate([[0], np.flatnonzero(np.diff(dias) >= separacao) + 1])
+    picos = np.maximum.reduceat(valores[posicoes], inicios)
+
+    anos = (serie.index[-1] - serie.index[0]).days / 365.25
+    return picos - limiar, limiar, len(picos) / max(anos, 1.0 / 365.25)
+
+
+def _l_moments(ordenado):
+    """Três primeiros L-momentos amostrais ao longo do último eixo (dados ordenados)"""
+    n = ordenado.shape[-1]
+    j = np.arange(n, dtype='float64')
+    b0 = ordenado.mean(axis=-1)
+    b1 = (ordenado * (j / (n - 1))).mean(axis=-1)
+    b2 = (ordenado * (j * (j - 1) / ((n - 1) * (n - 2)))).mean(axis=-1)
+    return b0, 2 * b1 - b0, 6 * b2 - 6 * b1 + b0
+
+
+def _gev_parametros(l1, l2, l3):
+    """Parâmetros da GEV por L-momentos (Hosking, 1985); forma k na convenção de Hosking"""
+    t3 = l3 / l2
+    c = 2 / (3 + t3) - np.log(2) / np.log(3)
+    k = 7.8590 * c + 2.9554 * c ** 2
+    gumbel = np.abs(k) < _TOLERANCIA_GUMBEL
+    k_seguro = np.where(gumbel, 1.0, k)
+    g = gamma(1 + k_seguro)
+    escala = np.where(gumbel, l2 / np.log(2), l2 * k_seguro / ((1 - 2 ** (-k_seguro)) * g))
+    posicao = np.where(gumbel, l1 - _EULER * escala, l1 - escala * (1 - g) / k_seguro)
+    return posicao, escala, np.where(gumbel, 0.0, k)
+
+
+def _gev_quantis(posicao, escala, k, periodos):
+    """Níveis de retorno da GEV; broadcast dos parâmetros contra os períodos"""
+    y = -np.log(1 - 1 / np.asarray(periodos, dtype='float64'))
+    posicao, escala, k = (np.asarray(a)[..., None] for a in (posicao, escala, k))
+    gumbel = np.abs(k) < _TOLERANCIA_GUMBEL
+    k_seguro = np.where(gumbel, 1.0, k)
+    return np.where(gumbel,
+                    posicao - escala * np.log(y),
+                    posicao + escala / k_seguro * (1 - y ** k_seguro))
+
+
+def _gpd_parametros(l1, l2):
+    """Parâmetros da GPD (posição zero) por L-momentos"""
+    k = l1 / l2 - 2
+    return (1 + k) * l1, k
+
+
+def _gpd_quantis(escala, k, limiar, taxa, periodos):
+    """Níveis de retorno da GPD para 'taxa' eventos por ano acima do limiar"""
+    m = taxa * np.asarray(periodos, dtype='float64')
+    escala, k = (np.asarray(a)[..., None] for a in (escala, k))
+    gumbel = np.abs(k) < _TOLERANCIA_GUMBEL
+    k_seguro = np.where(gumbel, 1.0, k)
+    return limiar + np.where(gumbel,
+                             escala * np.log(m),
+                             escala / k_seguro * (1 - m ** (-k_seguro)))
+
+
+def fit_gev(amostra, periodos=PERIODOS_RETORNO):
+    """Ajusta a GEV aos máximos anuais e devolve parâmetros e níveis de retorno"""
+    l1, l2, l3 = _l_moments(np.sort(np.asarray(amostra, dtype='float64')))
+    posicao, escala, k = _gev_parametros(l1, l2, l3)
+    return {
+        'posicao': float(posicao),
+        'escala': float(escala),
+        'forma': float(k),
+        'niveis': _gev_quantis(posicao, escala, k, periodos)
+    }
+
+
+def fit_gpd(excessos, limiar, taxa, periodos=PERIODOS_RETORNO):
+    """Ajusta a GPD aos excessos e devolve parâmetros e níveis de retorno"""
+    l1, l2, _ = _l_moments(np.sort(np.asarray(excessos, dtype='float64')))
+    escala, k = _gpd_parametros(l1, l2)
+    return {
+        'limiar': float(limiar),
+        'escala': float(escala),
+        'forma': float(k),
+        'niveis': _gpd_quantis(escala, k, limiar, taxa, periodos)
+    }
+
+
+def _bootstrap_lote(amostra, n_replicas, semente, periodos, metodo, limiar, taxa):
+    """Um lote de réplicas: reamostragem, L-momentos e níveis, tudo em matrizes"""
+    rng = np.random.default_rng(semente)
+    n = len(amostra)
+    reamostras = np.sort(amostra[rng.integers(0, n, size=(n_replicas, n))], axis=1)
+    l1, l2, l3 = _l_moments(reamostras)
+    if metodo == 'gev':
+        return _gev_quantis(*_gev_parametros(l1, l2, l3), periodos)
+    escala, k = _gpd_parametros(l1, l2)
+    return _gpd_quantis(escala, k, limiar, taxa, periodos)
+
+
+def bootstrap_return_levels(amostra, periodos=PERIODOS_RETORNO, metodo='gev', limiar=0.0, taxa=1.0,
+                            n_bootstrap=N_BOOTSTRAP, semente=SEMENTE, max_workers=None):
+    """
+    Réplicas bootstrap dos níveis de retorno (n_bootstrap × períodos). As
+    réplicas são divididas em lotes com sementes independentes e
+    processadas em paralelo.
+    """
+    amostra = np.asarray(amostra, dtype='float64')
+    max_workers = max(1, min(max_workers or os.cpu_count() or 1, n_bootstrap))
+    tamanhos = np.full(max_workers, n_bootstrap // max_workers)
+    tamanhos[:n_bootstrap % max_workers] += 1
+    sementes = np.random.SeedSequence(semente).spawn(max_workers)
+    argumentos = [(amostra, int(t), s, periodos, metodo, limiar, taxa) for t, s in zip(tamanhos, sementes)]
+
+    if max_workers == 1:
+        lotes = [_bootstrap_lote(*a) for a in argumentos]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            lotes = list(executor.map(_bootstrap_lote, *zip(*argumentos)))
+    return np.vstack(lotes)
+
+
+def return_level_analysis(df, variavel='PRECIPITACAO', metodo='gev', periodos=PERIODOS_RETORNO,
+                          n_bootstrap=N_BOOTSTRAP, nivel=NIVEL_CONFIANCA, semente=SEMENTE,
+                          max_workers=None):
+    """
+    Níveis de retorno com intervalos de confiança bootstrap.
+    metodo='gev' usa máximos anuais; metodo='gpd' usa picos acima do limiar.
+    """
+    if metodo == 'gev':
+        amostra = annual_maxima(df, variavel).to_numpy(dtype='float64')
+        limiar, taxa = 0.0, 1.0
+        if len(amostra) < 3:
+            raise ValueError("São necessários ao menos 3 anos completos para ajustar a GEV")
+        ajuste = fit_gev(amostra, periodos)
+    elif metodo == 'gpd':
+        amostra, limiar, taxa = peaks_over_threshold(df, variavel)
+        if len(amostra) < 3:
+            raise ValueError("São necessários ao menos 3 eventos acima do limiar para ajustar a GPD")
+        ajuste = fit_gpd(amostra, limiar, taxa, periodos)
+    else:
+        raise ValueError(f"metodo inválido: {metodo} (use 'gev' ou 'gpd')")
+
+    replicas = bootstrap_return_levels(amostra, periodos, metodo, limiar, taxa,
+                                       n_bootstrap, semente, max_workers)
+    alfa = (1 - nivel) / 2
+    inferior, superior = np.nanquantile(replicas, [alfa, 1 - alfa], axis=0)
+
+    return pd.DataFrame({
+        'periodo_retorno': list(periodos),
+        'nivel_retorno': np.ravel(ajuste['niveis']),
+        'ic_inferior': inferior,
+        'ic_superior': superior
+    })
+
+
+if __name__ == "__main__":
+    file_path = "data/inmet_data_sao_luiz_do_paraitinga_combined.csv"
+    df = pd.read_csv(file_path)
+    df['DATA'] = pd.to_datetime(df['DATA'])
+
+    for metodo in ('gev', 'gpd'):
+        print(f"\n--- Níveis de retorno da precipitação diária ({metodo.upper()}) ---")
+        print(return_level_analysis(df, metodo=metodo).round(1).to_string(index=False))
@@ -0,0 +1,115 @@
+import os
+import json
+import glob
+import hashlib
+import threading
+from collections import OrderedDict
+
+from perf import count_cache, span
+
+# Limite (MB) do JSON das figuras mantido em memória por processo
+CACHE_MAX_MB = float(os.environ.get('FIGURE_CACHE_MB', '64'))
+
+# Diretório opcional para persistir as figuras entre reinícios, e seu limite (MB)
+CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR')
+CACHE_DISCO_MAX_MB = float(os.environ.get('FIGURE_CACHE_DISK_MB', '256'))
+
+# LRU compartilhado por todas as sessões do processo: chave -> JSON da figura
+_lock = threading.Lock()
+_figuras = OrderedDict()
+_bytes = 0
+
+
+def figure_key(nome, **parametros):
+    """Chave da figura: nome e parâmetros da vista (marca d'água, período, variável...)"""
+    texto = json.dumps({'figura': nome, **parametros}, sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def _guardar(chave, texto):
+    """Insere no LRU e descarta as figuras menos usadas acima do limite"""
+    global _bytes
+    limite = CACHE_MAX_MB * 1024 * 1024
+    with _lock:
+        if chave in _figuras:
+            _bytes -= len(_figuras.pop(chave))
+        _figuras[chave] = texto
+        _bytes += len(texto)
+        while _bytes > limite and len(_figuras) > 1:
+            _, antigo = _figuras.popitem(last=False)
+            _bytes -= len(antigo)
+
+
+def _ler_disco(chave):
+    caminho = os.path.join(CACHE_DIR, f'{chave}.json')
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            texto = f.read()
+    except OSError:
+        return None
+    os.utime(caminho)  # ordem de descarte pelo último uso
+    return texto
+
+
+def _gravar_disco(chave, texto):
+    """Grava a figura (escrita atômica) e apaga as mais antigas acima do limite"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        caminho = os.path.join(CACHE_DIR, f'{chave}.json')
+        with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(texto)
+        os.replace(caminho + '.tmp', caminho)
+
+        arquivos = sorted(glob.glob(os.path.join(CACHE_DIR, '*.json')), key=os.path.getmtime)
+        total = sum(os.path.getsize(a) for a in arquivos)
+        limite = CACHE_DISCO_MAX_MB * 1024 * 1024
+        while total > limite and len(arquivos) > 1:
+            antigo = arquivos.pop(0)
+            total -= os.path.getsize(antigo)
+            os.remove(antigo)
+    except OSError as e:
+        print(f"Erro ao gravar figura em cache: {e}")
+
+
+def cached_figure_json(nome, construir, **parametros):
+    """
+    JSON da figura para a vista informada: da memória, do disco ou, só se
+    nenhum dos dois tiver, construído por construir() e serializado uma vez.
+    """
+    chave = figure_key(nome, **parametros)
+    with _lock:
+        texto = _figuras.get(chave)
+        if texto is not None:
+            _figuras.move_to_end(chave)
+
+    if texto is None and CACHE_DIR:
+        texto = _ler_disco(chave)
+        if texto is not None:
+            _guardar(chave, texto)
+
+    count_cache(f'figura.{nome}', texto is not None)
+    if texto is not None:
+        return texto
+
+    with span(f'grafico.{nome}.construcao'):
+        fig = construir()
+    with span(f'grafico.{nome}.json'):
+        texto = fig.to_json()
+    _guardar(chave, texto)
+    if CACHE_DIR:
+        _gravar_disco(chave, texto)
+    return texto
+
+
+def clear():
+    """Esvazia o cache em memória (o disco só é limpo pelo limite de tamanho)"""
+    global _bytes
+    with _lock:
+        _figuras.clear()
+        _bytes = 0
+
+
+def stats():
+    """Figuras e bytes mantidos em memória"""
+    with _lock:
+        return {'figuras': len(_figuras), 'mb': _bytes / 1024 / 1024}
@@ -0,0 +1,246 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.metrics import accuracy_score, brier_score_loss, mean_squared_error, r2_score
+from sklearn.multioutput import MultiOutputClassifier
+
+# Configuração padrão do previsor sazonal
+HARMONICAS = 3              # pares seno/cosseno do ciclo anual
+PERIODO_ANUAL = 365.25
+LAGS = (1, 2, 3, 7)         # defasagens em dias (1 = valor do próprio dia de origem)
+JANELAS = (7, 30)           # médias móveis em dias
+HORIZONTE = 7               # dias previstos à frente
+FRACAO_TESTE = 0.2
+
+# Referência para o tempo absoluto (termos de Fourier e tendência)
+_ORIGEM = pd.Timestamp('2000-01-01')
+
+
+def daily_series(df, variavel):
+    """Série diária contínua em ordem cronológica; dias ausentes viram NaN"""
+    serie = df.dropna(subset=['DATA']).groupby('DATA')[variavel].mean().sort_index()
+    if serie.empty:
+        return serie.astype('float64')
+    calendario = pd.date_range(serie.index.min(), serie.index.max(), freq='D')
+    return serie.reindex(calendario).astype('float64')
+
+
+def days_since_origin(datas):
+    """Dias decorridos desde 2000-01-01 (tempo absoluto das features)"""
+    return (pd.DatetimeIndex(datas) - _ORIGEM).days.to_numpy(dtype='float64')
+
+
+def fourier_terms(datas, harmonicas=HARMONICAS, periodo=PERIODO_ANUAL):
+    """Matriz (n, 2*harmonicas) com os termos sazonais seno/cosseno de cada data"""
+    k = np.arange(1, harmonicas + 1)
+    angulos = 2 * np.pi * days_since_origin(datas)[:, None] * k[None, :] / periodo
+    return np.hstack([np.sin(angulos), np.cos(angulos)])
+
+
+def _lag(y, k):
+    """y[t - k] alinhado com t"""
+    saida = np.full(len(y), np.nan)
+    if k < len(y):
+        saida[k:] = y[:len(y) - k]
+    return saida
+
+
+def rolling_mean(y, janela):
+    """Média móvel terminando em t via somas acumuladas; NaN se faltar algum dia"""
+    valido = np.isfinite(y)
+    soma = np.concatenate([[0.0], np.cumsum(np.where(valido, y, 0.0))])
+    contagem = np.concatenate([[0], np.cumsum(valido)])
+    saida = np.full(len(y), np.nan)
+    if len(y) >= janela:
+        s = soma[janela:] - soma[:-janela]
+        c = contagem[janela:] - contagem[:-janela]
+        saida[janela - 1:] = np.where(c == janela, s / janela, np.nan)
+    return saida
+
+
+def build_features(serie, lags=LAGS, janelas=JANELAS, harmonicas=HARMONICAS):
+    """
+    Features na data de origem t: termos de Fourier, tendência linear,
+    defasagens e médias móveis. Usa apenas valores observados até t.
+    """
+    y = serie.to_numpy(dtype='float64')
+    tendencia = days_since_origin(serie.index) / (10 * PERIODO_ANUAL)
+    colunas = [fourier_terms(serie.index, harmonicas), tendencia[:, None]]
+    colunas += [_lag(y, k - 1)[:, None] for k in lags]
+    colunas += [rolling_mean(y, janela)[:, None] for janela in janelas]
+    return np.hstack(colunas)
+
+
+def build_targets(serie, horizonte=HORIZONTE):
+    """Matriz (n, horizonte) com Y[t, h-1] = y[t + h]"""
+    y = serie.to_numpy(dtype='float64')
+    estendida = np.concatenate([y[1:], np.full(horizonte, np.nan)])
+    return sliding_window_view(estendida, horizonte)[:len(y)]
+
+
+def _linhas_validas(X, Y):
+    return np.isfinite(X).all(axis=1) & np.isfinite(Y).all(axis=1)
+
+
+def fit_forecaster(df, variavel='TEMPERATURA_MEDIA', horizonte=HORIZONTE, fracao_teste=FRACAO_TESTE):
+    """
+    Treina o previsor multi-horizonte (uma saída por dia à frente) e avalia
+    em um holdout cronológico: o teste são as origens mais recentes e o
+    treino só usa origens cujos alvos terminam antes do início do teste.
+
+    Retorna model, mse, r2, X_test, y_test, y_pred (horizonte de 1 dia),
+    com o modelo final reajustado sobre todo o histórico.
+    """
+    return fit_series_forecaster(daily_series(df, variavel), horizonte, fracao_teste)
+
+
+def _holdout(serie, horizonte, fracao_teste):
+    """Features, alvos e o corte cronológico (origens válidas, treino e teste)"""
+    X = build_features(serie)
+    Y = build_targets(serie, horizonte)
+    indices = np.flatnonzero(_linhas_validas(X, Y))
+    if len(indices) < 2 * X.shape[1]:
+        raise ValueError(f"Dados insuficientes para treinar o previsor de {serie.name}")
+
+    corte = indices[int(len(indices) * (1 - fracao_teste))]
+    treino = indices[indices + horizonte < corte]
+    teste = indices[indices >= corte]
+    return X, Y, indices, treino, teste
+
+
+def fit_series_forecaster(serie, horizonte=HORIZONTE, fracao_teste=FRACAO_TESTE):
+    """Mesmo que fit_forecaster, a partir de uma série diária já contínua"""
+    X, Y, indices, treino, teste = _holdout(serie, horizonte, fracao_teste)
+
+    model = LinearRegression()
+    model.fit(X[treino], Y[treino])
+
+    y_test = Y[teste, 0]
+    y_pred = model.predict(X[teste])[:, 0]
+
+    mse = mean_squared_error(y_test, y_pred)
+    r2 = r2_score(y_test, y_pred)
+
+    model.fit(X[indices], Y[indices])
+
+    return model, mse, r2, X[teste], y_test, y_pred
+
+
+def fit_series_classifier(serie, horizonte=HORIZONTE, fracao_teste=FRACAO_TESTE):
+    """
+    Versão para alvos binários (ocorrência de chuva): uma regressão
+    logística por dia à frente, com as mesmas features e o mesmo holdout
+    cronológico de fit_series_forecaster.
+
+    Retorna model, brier, acuracia, X_test, y_test, y_pred (probabilidade
+    prevista para 1 dia à frente), com o modelo final reajustado sobre
+    todo o histórico.
+    """
+    X, Y, indices, treino, teste = _holdout(serie, horizonte, fracao_teste)
+
+    # Uma classe só no treino (estação que nunca ou sempre chove) também é
+    # ValueError no LogisticRegression, tratado como dados insuficientes
+    model = MultiOutputClassifier(LogisticRegression(max_iter=1000))
+    model.fit(X[treino], Y[treino].astype(int))
+
+    y_test = Y[teste, 0]
+    y_pred = model.predict_proba(X[teste])[0][:, 1]
+
+    brier = brier_score_loss(y_test.astype(int), y_pred)
+    acuracia = accuracy_score(y_test.astype(int), (y_pred >= 0.5).astype(int))
+
+    model.fit(X[indices], Y[indices].astype(int))
+
+    return model, brier, acuracia, X[teste], y_test, y_pred
+
+
+# Dados compartilhados com os processos do backtest (enviados uma vez por worker)
+_DADOS_BACKTEST = {}
+
+
+def _iniciar_worker(dados):
+    global _DADOS_BACKTEST
+    _DADOS_BACKTEST = dados
+
+
+def _avaliar_fold(variavel, fold, corte, fim):
+    """Treina até o corte e avalia as origens em [corte, fim)"""
+    X, Y, valido, datas = _DADOS_BACKTEST[variavel]
+    horizonte = Y.shape[1]
+    indices = np.arange(len(X))
+
+    treino = valido & (indices + horizonte < corte)
+    teste = valido & (indices >= corte) & (indices < fim)
+    if treino.sum() <= X.shape[1] or not teste.any():
+        return []
+
+    model = LinearRegression()
+    model.fit(X[treino], Y[treino])
+    erro = model.predict(X[teste]) - Y[teste]
+
+    mae = np.abs(erro).mean(axis=0)
+    rmse = np.sqrt((erro ** 2).mean(axis=0))
+    return [
+        {
+            'variavel': variavel,
+            'fold': fold,
+            'corte': datas[corte].strftime('%Y-%m-%d'),
+            'horizonte': h + 1,
+            'mae': float(mae[h]),
+            'rmse': float(rmse[h]),
+            'n_treino': int(treino.sum()),
+            'n_teste': int(teste.sum())
+        }
+        for h in range(horizonte)
+    ]
+
+
+def rolling_origin_backtest(df, variaveis=('TEMPERATURA_MEDIA',), horizonte=HORIZONTE,
+                            n_folds=5, passo=365, max_workers=None):
+    """
+    Backtest com origem móvel: cada fold treina com o passado até um corte e
+    testa no período seguinte de 'passo' dias. Folds e variáveis rodam em
+    paralelo em todos os núcleos; as matrizes vão uma vez para cada worker.
+    """
+    dados = {}
+    tarefas = []
+    for variavel in variaveis:
+        serie = daily_series(df, variavel)
+        X = build_features(serie)
+        Y = build_targets(serie, horizonte)
+        dados[variavel] = (X, Y, _linhas_validas(X, Y), serie.index)
+
+        n = len(serie)
+        for fold in range(n_folds):
+            corte = n - passo * (n_folds - fold)
+            if corte > passo:
+                tarefas.append((variavel, fold, corte, corte + passo))
+
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(tarefas), 1))
+    if max_workers == 1:
+        _iniciar_worker(dados)
+        resultados = [_avaliar_fold(*tarefa) for tarefa in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_iniciar_worker,
+                                 initargs=(dados,)) as executor:
+            resultados = list(executor.map(_avaliar_fold, *zip(*tarefas)))
+
+    return pd.DataFrame([linha for resultado in resultados for linha in resultado])
+
+
+if __name__ == "__main__":
+    file_path = "data/inmet_data_sao_luiz_do_paraitinga_combined.csv"
+    df = pd.read_csv(file_path)
+    df['DATA'] = pd.to_datetime(df['DATA'])
+
+    resultado = rolling_origin_backtest(
+        df, variaveis=['TEMPERATURA_MEDIA', 'UMIDADE_RELATIVA', 'PRESSAO_ATMOSFERICA']
+    )
+    if resultado.empty:
+        print("Dados insuficientes para o backtest.")
+    else:
+        print(resultado.groupby(['variavel', 'horizonte'])[['mae', 'rmse']].mean())
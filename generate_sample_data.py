@@ -1,103 +1,289 @@
+import io
+import sys
+import argparse
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+from scipy.signal import lfilter
 import os
 
+from database import COLUNAS_BANCO, bump_data_watermark, connect, is_sqlite
+
+# Estação real usada como primeira estação de todo conjunto sintético
+ESTACAO_BASE = {
+    'ESTACAO': 'A740',
+    'NOME_DA_ESTACAO': 'SAO LUIZ DO PARAITINGA',
+    'UF': 'SP',
+    'REGIAO': 'SE',
+    'LATITUDE': -23.2283,
+    'LONGITUDE': -45.4169,
+    'ALTITUDE': 874.0
+}
+
+# Persistência diária das anomalias de temperatura (AR(1))
+PERSISTENCIA = 0.7
+
+# Queda de temperatura com a altitude (°C por metro)
+GRADIENTE_TERMICO = 0.0065
+
+COLUNAS_SAIDA = list(COLUNAS_BANCO.values())
+
+# Estações geradas e gravadas por vez no modo de teste de carga
+ESTACOES_POR_BLOCO = 20
+
+
+def synthetic_stations(n_estacoes, rng):
+    """Metadados das estações: a primeira é A740, as demais espalhadas pelo Sudeste"""
+    estacoes = pd.DataFrame({
+        'ESTACAO': [f'S{i:03d}' for i in range(n_estacoes)],
+        'NOME_DA_ESTACAO': [f'ESTACAO SINTETICA {i:04d}' for i in range(n_estacoes)],
+        'UF': 'SP',
+        'REGIAO': 'SE',
+        'LATITUDE': np.round(rng.uniform(-25.0, -20.0, n_estacoes), 4),
+        'LONGITUDE': np.round(rng.uniform(-53.0, -44.0, n_estacoes), 4),
+        'ALTITUDE': np.round(rng.uniform(0.0, 1600.0, n_estacoes), 1)
+    })
+    estacoes.loc[0, list(ESTACAO_BASE)] = list(ESTACAO_BASE.values())
+    return estacoes
+
+
+def generate_synthetic_weather(n_estacoes=1, inicio='2000-01-01', fim=None, frequencia='D', semente=42):
+    """
+    Gera dados de N estações × período em uma única passada vetorizada.
+    frequencia='D' produz um registro diário; frequencia='H', um por hora.
+
+    Retorna um dicionário com 'estacoes' (metadados), 'tempos' (DatetimeIndex)
+    e uma matriz (estações × tempos) por variável.
+    """
+    rng = np.random.default_rng(semente)
+    fim = fim or datetime.now().strftime('%Y-%m-%d')
+    estacoes = synthetic_stations(n_estacoes, rng)
+    return simulate_stations(estacoes, pd.date_range(inicio, fim, freq='D'), frequencia, rng)
+
+
+def iter_synthetic_weather(n_estacoes, inicio='2000-01-01', fim=None, frequencia='D', semente=42,
+                           estacoes_por_bloco=ESTACOES_POR_BLOCO):
+    """
+    Mesmo gerador, em blocos de estações: só um bloco fica em memória por
+    vez. Os metadados de todas as estações são sorteados antes, então o
+    conjunto é reprodutível para uma mesma semente e tamanho de bloco.
+    """
+    rng = np.random.default_rng(semente)
+    fim = fim or datetime.now().strftime('%Y-%m-%d')
+    dias = pd.date_range(inicio, fim, freq='D')
+    estacoes = synthetic_stations(n_estacoes, rng)
+    for inicio_bloco in range(0, n_estacoes, estacoes_por_bloco):
+        bloco = estacoes.iloc[inicio_bloco:inicio_bloco + estacoes_por_bloco].reset_index(drop=True)
+        yield simulate_stations(bloco, dias, frequencia, rng)
+
+
+def simulate_stations(estacoes, dias, frequencia, rng):
+    """Séries das estações informadas nos dias informados (ver generate_synthetic_weather)"""
+    n_estacoes = len(estacoes)
+    n_dias = len(dias)
+    horas_por_dia = 24 if frequencia == 'H' else 1
+
+    # Ciclo sazonal (dias) e ajuste da estação pela altitude
+    sazonal = np.sin(2 * np.pi * (dias.dayofyear.to_numpy() - 80) / 365.25)[None, :]
+    ajuste_altitude = (GRADIENTE_TERMICO * (ESTACAO_BASE['ALTITUDE'] - estacoes['ALTITUDE'].to_numpy()))[:, None]
+
+    # Anomalias diárias persistentes: AR(1) ao longo do tempo para todas as estações
+    anomalia = lfilter([1.0], [1.0, -PERSISTENCIA], rng.normal(0, 1.5, (n_estacoes, n_dias)), axis=1)
+    temp_dia = 20 + 8 * sazonal + ajuste_altitude + anomalia
+    amplitude = rng.gamma(4, 1.25, (n_estacoes, n_dias))
+
+    if horas_por_dia == 1:
+        temp_media = temp_dia
+        temp_maxima = temp_dia + amplitude
+        temp_minima = temp_dia - amplitude
+        umidade_base = 60 + 20 * sazonal - 1.5 * anomalia
+        prob_chuva = np.broadcast_to(0.3 + 0.2 * sazonal, (n_estacoes, n_dias))
+        chuva_media = 5.0
+        tempos = dias + pd.Timedelta(hours=12)
+    else:
+        # Repete os valores diários para cada hora e soma o ciclo diurno
+        hora = np.arange(24)
+        diurno = np.sin(2 * np.pi * (hora - 9) / 24)
+        temp_media = (temp_dia[:, :, None] + amplitude[:, :, None] * diurno).reshape(n_estacoes, -1)
+        temp_media = temp_media + rng.normal(0, 0.4, temp_media.shape)
+        variacao = rng.uniform(0.2, 1.0, temp_media.shape)
+        temp_maxima = temp_media + variacao
+        temp_minima = temp_media - variacao
+        umidade_base = (60 + 20 * sazonal - 1.5 * anomalia)[:, :, None] - 12 * diurno
+        umidade_base = umidade_base.reshape(n_estacoes, -1)
+        prob_chuva = np.broadcast_to(np.repeat((0.3 + 0.2 * sazonal) / 8, 24, axis=1), temp_media.shape)
+        chuva_media = 1.5
+        tempos = (dias.to_numpy()[:, None] + (hora * np.timedelta64(1, 'h'))[None, :]).ravel()
+        tempos = pd.DatetimeIndex(tempos)
+
+    forma = temp_media.shape
+    umidade = np.clip(umidade_base + rng.normal(0, 10, forma), 30, 100)
+    chuva = np.where(rng.random(forma) < prob_chuva, rng.exponential(chuva_media, forma), 0.0)
+    vento = rng.gamma(2, 2, forma)
+    pressao = 1013 + rng.normal(0, 10, forma)
+
+    return {
+        'estacoes': estacoes,
+        'tempos': tempos,
+        'TEMPERATURA_MAXIMA': np.round(temp_maxima, 1),
+        'TEMPERATURA_MINIMA': np.round(temp_minima, 1),
+        'TEMPERATURA_MEDIA': np.round(temp_media, 1),
+        'UMIDADE_RELATIVA': np.round(umidade, 1),
+        'PRECIPITACAO': np.round(chuva, 1),
+        'VELOCIDADE_VENTO': np.round(vento, 1),
+        'PRESSAO_ATMOSFERICA': np.round(pressao, 1)
+    }
+
+
+def to_frame(dados):
+    """Converte o resultado do gerador em um DataFrame longo (uma linha por estação e tempo)"""
+    estacoes = dados['estacoes']
+    tempos = dados['tempos']
+    n_estacoes, n_tempos = len(estacoes), len(tempos)
+
+    df = pd.DataFrame({
+        'DATA': np.tile(tempos.normalize().to_numpy(), n_estacoes),
+        'HORA': np.tile(tempos.strftime('%H:00').to_numpy(), n_estacoes)
+    })
+    for col in ['ESTACAO', 'NOME_DA_ESTACAO', 'UF', 'REGIAO', 'LATITUDE', 'LONGITUDE', 'ALTITUDE']:
+        df[col] = np.repeat(estacoes[col].to_numpy(), n_tempos)
+    for col in COLUNAS_SAIDA[9:]:
+        df[col] = dados[col].ravel()
+    return df[COLUNAS_SAIDA]
+
+
+def create_hourly_table(cur):
+    """Tabela de dados horários usada nos testes de carga"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS dados_meteorologicos_horarios (
+        data DATE NOT NULL,
+        hora TIME NOT NULL,
+        estacao VARCHAR(10),
+        nome_estacao VARCHAR(100),
+        uf VARCHAR(2),
+        regiao VARCHAR(2),
+        latitude DECIMAL(10, 6),
+        longitude DECIMAL(10, 6),
+        altitude DECIMAL(8, 2),
+        temperatura_maxima DECIMAL(5, 2),
+        temperatura_minima DECIMAL(5, 2),
+        temperatura_media DECIMAL(5, 2),
+        umidade_relativa DECIMAL(5, 2),
+        precipitacao DECIMAL(8, 2),
+        velocidade_vento DECIMAL(5, 2),
+        pressao_atmosferica DECIMAL(7, 2),
+        UNIQUE(data, hora, estacao)
+    );
+    """)
+
+
+def copy_to_database(conn, df, tabela='dados_meteorologicos', tamanho_lote=500000):
+    """
+    Grava o DataFrame com COPY ... FROM STDIN em lotes, sem montar tuplas
+    em Python. No SQLite local usa executemany. A tabela deve estar livre
+    de conflitos (dados novos ou tabela vazia).
+    """
+    colunas = list(COLUNAS_BANCO)
+    cur = conn.cursor()
+
+    for inicio in range(0, len(df), tamanho_lote):
+        lote = df[COLUNAS_SAIDA].iloc[inicio:inicio + tamanho_lote].copy()
+        lote['DATA'] = pd.to_datetime(lote['DATA']).dt.strftime('%Y-%m-%d')
+
+        if is_sqlite(conn):
+            marcadores = ', '.join('?' for _ in colunas)
+            cur.executemany(
+                f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({marcadores})",
+                lote.itertuples(index=False, name=None)
+            )
+        else:
+            buffer = io.StringIO()
+            lote.to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            cur.copy_expert(f"COPY {tabela} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    conn.commit()
+    cur.close()
+    return len(df)
+
+
 def generate_sample_weather_data(start_date_str, end_date_str, city='SAO LUIZ DO PARAITINGA'):
     """Generate sample weather data for São Luiz do Paraitinga-SP"""
-    
-    start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
-    end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
-    
-    date_range = pd.date_range(start=start_date, end=end_date, freq='D')
-    
-    # Set random seed for reproducibility
-    np.random.seed(42)
-    
-    # Generate realistic weather data for São Luiz do Paraitinga (subtropical climate)
-    data = []
-    
-    for date in date_range:
-        # Seasonal temperature variation
-        day_of_year = date.timetuple().tm_yday
-        base_temp = 20 + 8 * np.sin(2 * np.pi * (day_of_year - 80) / 365)  # Seasonal variation
-        
-        # Daily temperature variation
-        temp_max = base_temp + np.random.normal(5, 2)
-        temp_min = base_temp - np.random.normal(5, 2)
-        temp_avg = (temp_max + temp_min) / 2
-        
-        # Humidity (higher in summer)
-        humidity = 60 + 20 * np.sin(2 * np.pi * (day_of_year - 80) / 365) + np.random.normal(0, 10)
-        humidity = np.clip(humidity, 30, 95)
-        
-        # Precipitation (more in summer)
-        precip_prob = 0.3 + 0.2 * np.sin(2 * np.pi * (day_of_year - 80) / 365)
-        precipitation = np.random.exponential(5) if np.random.random() < precip_prob else 0
-        
-        # Wind speed
-        wind_speed = np.random.gamma(2, 2)
-        
-        # Atmospheric pressure
-        pressure = 1013 + np.random.normal(0, 10)
-        
-        data.append({
-            'DATA': date.strftime('%Y-%m-%d'),
-            'HORA': '12:00',
-            'ESTACAO': 'A740',
-            'NOME_DA_ESTACAO': city,
-            'UF': 'SP',
-            'REGIAO': 'SE',
-            'LATITUDE': -23.2283,
-            'LONGITUDE': -45.4169,
-            'ALTITUDE': 874.0,
-            'TEMPERATURA_MAXIMA': round(temp_max, 1),
-            'TEMPERATURA_MINIMA': round(temp_min, 1),
-            'TEMPERATURA_MEDIA': round(temp_avg, 1),
-            'UMIDADE_RELATIVA': round(humidity, 1),
-            'PRECIPITACAO': round(precipitation, 1),
-            'VELOCIDADE_VENTO': round(wind_speed, 1),
-            'PRESSAO_ATMOSFERICA': round(pressure, 1)
-        })
-    
-    return pd.DataFrame(data)
+    dados = generate_synthetic_weather(1, start_date_str, end_date_str, frequencia='D', semente=42)
+    df = to_frame(dados)
+    df['DATA'] = df['DATA'].dt.strftime('%Y-%m-%d')
+    df['NOME_DA_ESTACAO'] = city
+    return df
+
 
 def save_sample_data():
     """Generate and save sample data for multiple years"""
     if not os.path.exists('data'):
         os.makedirs('data')
-    
+
     start_year = 2000
     current_year = datetime.now().year
-    
-    # Generate data for each year from 2000 to current year
+
+    # Generate the whole period in one pass, then split by year
+    combined_df = generate_sample_weather_data(f'{start_year}-01-01', datetime.now().strftime('%Y-%m-%d'))
+    years = combined_df['DATA'].str[:4].astype(int)
+
     for year in range(start_year, current_year + 1):
-        start_date = f'{year}-01-01'
-        end_date = f'{year}-12-31'
-        
-        # For the current year, generate data only up to the current date
-        if year == current_year:
-            end_date = datetime.now().strftime('%Y-%m-%d')
-            
-        df = generate_sample_weather_data(start_date, end_date)
         filename = f'data/inmet_data_sao_luiz_do_paraitinga_{year}.csv'
-        df.to_csv(filename, index=False)
+        combined_df[years == year].to_csv(filename, index=False)
         print(f'Generated sample data for {year}: {filename}')
-    
-    # Create a combined dataset for all years from 2000 to current year
-    all_data = []
-    for year in range(start_year, current_year + 1):
-        filename = f'data/inmet_data_sao_luiz_do_paraitinga_{year}.csv'
-        if os.path.exists(filename):
-            df = pd.read_csv(filename)
-            all_data.append(df)
-    
-    if all_data:
-        combined_df = pd.concat(all_data, ignore_index=True)
-        combined_df.to_csv('data/inmet_data_sao_luiz_do_paraitinga_combined.csv', index=False)
-        print('Generated combined dataset: data/inmet_data_sao_luiz_do_paraitinga_combined.csv')
+
+    combined_df.to_csv('data/inmet_data_sao_luiz_do_paraitinga_combined.csv', index=False)
+    print('Generated combined dataset: data/inmet_data_sao_luiz_do_paraitinga_combined.csv')
 
 if __name__ == "__main__":
-    save_sample_data()
-    print("Sample weather data generation completed!")
+    parser = argparse.ArgumentParser(description="Gera dados meteorológicos sintéticos")
+    parser.add_argument('--estacoes', type=int, help="número de estações (modo de teste de carga)")
+    parser.add_argument('--anos', type=int, default=1, help="anos de dados a partir de 2000")
+    parser.add_argument('--horaria', action='store_true', help="um registro por hora em vez de por dia")
+    parser.add_argument('--semente', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.estacoes is None:
+        save_sample_data()
+        print("Sample weather data generation completed!")
+        sys.exit(0)
+
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        print("Por favor, defina a variável de ambiente DATABASE_URL")
+        sys.exit(1)
+
+    fim = (pd.Timestamp('2000-01-01') + pd.DateOffset(years=args.anos) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    frequencia = 'H' if args.horaria else 'D'
+
+    conn = connect(database_url)
+    tabela = 'dados_meteorologicos'
+    if args.horaria:
+        cur = conn.cursor()
+        create_hourly_table(cur)
+        conn.commit()
+        cur.close()
+        tabela = 'dados_meteorologicos_horarios'
+
+    # Gera e grava um bloco de estações por vez: o conjunto completo nunca fica em memória
+    tempo_geracao = tempo_copia = 0.0
+    gravados = 0
+    blocos = iter_synthetic_weather(args.estacoes, '2000-01-01', fim, frequencia, args.semente)
+    while True:
+        inicio_geracao = datetime.now()
+        dados = next(blocos, None)
+        if dados is None:
+            break
+        df = to_frame(dados)
+        tempo_geracao += (datetime.now() - inicio_geracao).total_seconds()
+
+        inicio_copia = datetime.now()
+        gravados += copy_to_database(conn, df, tabela)
+        tempo_copia += (datetime.now() - inicio_copia).total_seconds()
 
+    if tabela == 'dados_meteorologicos':
+        bump_data_watermark(conn)  # invalida os caches de leitura (api/series.py e dashboard)
+    conn.close()
+    print(f"Gerados {gravados} registros em {tempo_geracao:.1f}s")
+    print(f"Gravados em '{tabela}' em {tempo_copia:.1f}s")
@@ -0,0 +1,214 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import gamma, norm
+
+from anomalies import circular_window_sum, day_of_year_365
+
+# Janelas (dias) das médias móveis padrão
+JANELAS_MEDIA = (7, 30, 90, 365)
+
+# Janela (dias) da chuva acumulada
+JANELA_CHUVA = 30
+
+# Escalas (dias) do índice de precipitação padronizado
+ESCALAS_SPI = (30, 90)
+
+# Fração mínima de dias observados para aceitar uma janela
+COBERTURA_MINIMA = 0.8
+
+# Graus-dia: temperatura base e teto (°C), método modificado
+TEMPERATURA_BASE = 10.0
+TEMPERATURA_TETO = 30.0
+
+# Mês de início do ano agrícola (julho a junho)
+MES_INICIO_SAFRA = 7
+
+# Janela (dias do ano) agrupada no ajuste da gama de cada dia do SPI
+JANELA_CALIBRACAO_SPI = 31
+
+# Variáveis acumuladas no estado (GRAUS_DIA é derivada das temperaturas)
+VARIAVEIS_INDICES = ('TEMPERATURA_MEDIA', 'TEMPERATURA_MAXIMA', 'TEMPERATURA_MINIMA',
+                     'UMIDADE_RELATIVA', 'PRECIPITACAO', 'GRAUS_DIA')
+
+_PROBABILIDADE_LIMITE = 1e-6
+
+
+def degree_days(tmax, tmin, base=TEMPERATURA_BASE, teto=TEMPERATURA_TETO):
+    """Graus-dia diários: máxima limitada ao teto, mínima à base"""
+    tmax = np.minimum(np.asarray(tmax, dtype='float64'), teto)
+    tmin = np.maximum(np.asarray(tmin, dtype='float64'), base)
+    return np.maximum((tmax + tmin) / 2 - base, 0.0)
+
+
+def _prefixos(valores, soma_inicial=0.0, contagem_inicial=0):
+    """Somas e contagens acumuladas (com o zero inicial) dos valores observados"""
+    valido = np.isfinite(valores)
+    soma = soma_inicial + np.cumsum(np.where(valido, valores, 0.0))
+    contagem = contagem_inicial + np.cumsum(valido)
+    return soma, contagem
+
+
+def _serie_diaria(df, calendario):
+    """Média diária das variáveis no calendário informado (GRAUS_DIA incluído)"""
+    diario = df.dropna(subset=['DATA']).groupby('DATA').mean(numeric_only=True).reindex(calendario)
+    valores = {}
+    for var in VARIAVEIS_INDICES:
+        if var in diario.columns:
+            valores[var] = diario[var].to_numpy(dtype='float64')
+    if 'TEMPERATURA_MAXIMA' in valores and 'TEMPERATURA_MINIMA' in valores:
+        valores['GRAUS_DIA'] = degree_days(valores['TEMPERATURA_MAXIMA'], valores['TEMPERATURA_MINIMA'])
+    return valores
+
+
+def build_state(df):
+    """
+    Estado do motor de índices de uma estação: calendário contínuo, valores
+    diários e somas acumuladas de cada variável. Qualquer janela móvel ou
+    acumulado sai do estado em O(n), sem percorrer a série de novo.
+    """
+    datas = df['DATA'].dropna()
+    calendario = pd.date_range(datas.min(), datas.max(), freq='D')
+    valores = _serie_diaria(df, calendario)
+
+    prefixos = {}
+    for var, x in valores.items():
+        soma, contagem = _prefixos(x)
+        prefixos[var] = (np.concatenate([[0.0], soma]), np.concatenate([[0], contagem]))
+
+    estado = {'datas': calendario, 'valores': valores, 'prefixos': prefixos, 'spi': {}}
+    if 'PRECIPITACAO' in valores:
+        for escala in ESCALAS_SPI:
+            estado['spi'][escala] = fit_spi(calendario, window_sum(estado, 'PRECIPITACAO', escala))
+    return estado
+
+
+def extend_state(estado, df_novos):
+    """
+    Acrescenta ao estado os dias posteriores ao último já incorporado,
+    continuando as somas acumuladas a partir do último valor. Os
+    parâmetros do SPI são mantidos (calibrados no histórico).
+    """
+    ultima = estado['datas'][-1]
+    df_novos = df_novos[df_novos['DATA'] > ultima]
+    if df_novos.empty:
+        return estado
+
+    calendario = pd.date_range(ultima + pd.Timedelta(days=1), df_novos['DATA'].max(), freq='D')
+    novos = _serie_diaria(df_novos, calendario)
+
+    valores, prefixos = {}, {}
+    for var, x in estado['valores'].items():
+        x_novo = novos.get(var, np.full(len(calendario), np.nan))
+        soma, contagem = estado['prefixos'][var]
+        soma_nova, contagem_nova = _prefixos(x_novo, soma[-1], contagem[-1])
+        valores[var] = np.concatenate([x, x_novo])
+        prefixos[var] = (np.concatenate([soma, soma_nova]), np.concatenate([contagem, contagem_nova]))
+
+    return {
+        'datas': estado['datas'].append(calendario),
+        'valores': valores,
+        'prefixos': prefixos,
+        'spi': estado['spi']
+    }
+
+
+def truncate_state(estado, ate):
+    """Estado restrito aos dias anteriores a 'ate' (para recalcular um trecho final)"""
+    k = int(estado['datas'].searchsorted(pd.Timestamp(ate)))
+    return {
+        'datas': estado['datas'][:k],
+        'valores': {var: x[:k] for var, x in estado['valores'].items()},
+        'prefixos': {var: (soma[:k + 1], contagem[:k + 1]) for var, (soma, contagem) in estado['prefixos'].items()},
+        'spi': estado['spi']
+    }
+
+
+def _janela(estado, variavel, janela, cobertura):
+    """Soma e contagem de observações das janelas de 'janela' dias terminando em cada dia"""
+    soma, contagem = estado['prefixos'][variavel]
+    n = len(soma) - 1
+    s = np.full(n, np.nan)
+    c = np.zeros(n)
+    if n >= janela:
+        s[janela - 1:] = soma[janela:] - soma[:-janela]
+        c[janela - 1:] = contagem[janela:] - contagem[:-janela]
+    s[c < cobertura * janela] = np.nan
+    return s, c
+
+
+def window_mean(estado, variavel, janela, cobertura=COBERTURA_MINIMA):
+    """Média móvel de 'janela' dias (NaN se a cobertura for insuficiente)"""
+    s, c = _janela(estado, variavel, janela, cobertura)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return s / c
+
+
+def window_sum(estado, variavel, janela, cobertura=COBERTURA_MINIMA):
+    """Acumulado de 'janela' dias, escalado pelos dias observados"""
+    s, c = _janela(estado, variavel, janela, cobertura)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return s * janela / c
+
+
+def season_total(estado, variavel, mes_inicio=MES_INICIO_SAFRA):
+    """Acumulado desde o início do ano agrícola corrente de cada dia"""
+    datas = estado['datas']
+    soma, _ = estado['prefixos'][variavel]
+    ano_safra = datas.year - (datas.month < mes_inicio)
+    inicio_safra = pd.to_datetime(pd.DataFrame({
+        'year': np.asarray(ano_safra), 'month': mes_inicio, 'day': 1
+    }))
+    k = np.maximum((pd.DatetimeIndex(inicio_safra) - datas[0]).days.to_numpy(), 0)
+    return soma[1:] - soma[k]
+
+
+def fit_spi(datas, totais, janela=JANELA_CALIBRACAO_SPI):
+    """
+    Parâmetros da gama (aproximação de Thom) e probabilidade de total nulo
+    para cada dia do ano, agrupando os dias vizinhos da janela.
+    """
+    totais = np.asarray(totais, dtype='float64')
+    dia = day_of_year_365(datas)
+    valido = np.isfinite(totais)
+    positivo = valido & (totais > 0)
+
+    n = circular_window_sum(np.bincount(dia[valido], minlength=365).astype('float64'), janela)
+    n_pos = circular_window_sum(np.bincount(dia[positivo], minlength=365).astype('float64'), janela)
+    soma = circular_window_sum(np.bincount(dia[positivo], weights=totais[positivo], minlength=365), janela)
+    soma_log = circular_window_sum(np.bincount(dia[positivo], weights=np.log(totais[positivo]), minlength=365), janela)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = soma / n_pos
+        a = np.log(media) - soma_log / n_pos
+        alfa = (1 + np.sqrt(1 + 4 * a / 3)) / (4 * a)
+        return {'alfa': alfa, 'beta': media / alfa, 'q': 1 - n_pos / n}
+
+
+def spi(datas, totais, parametros):
+    """Índice de precipitação padronizado (z) de cada total acumulado"""
+    totais = np.asarray(totais, dtype='float64')
+    dia = day_of_year_365(datas)
+    alfa, beta, q = parametros['alfa'][dia], parametros['beta'][dia], parametros['q'][dia]
+    with np.errstate(invalid='ignore'):
+        probabilidade = q + (1 - q) * gamma.cdf(np.maximum(totais, 0.0), a=alfa, scale=beta)
+    probabilidade = np.clip(probabilidade, _PROBABILIDADE_LIMITE, 1 - _PROBABILIDADE_LIMITE)
+    z = norm.ppf(probabilidade)
+    z[~np.isfinite(totais)] = np.nan
+    return z
+
+
+def compute_indices(estado, janelas=JANELAS_MEDIA):
+    """Tabela diária com os índices padrão do painel agrícola"""
+    datas = estado['datas']
+    indices = pd.DataFrame({'DATA': datas})
+    if 'TEMPERATURA_MEDIA' in estado['valores']:
+        for janela in janelas:
+            indices[f'TEMPERATURA_MEDIA_MM{janela}'] = window_mean(estado, 'TEMPERATURA_MEDIA', janela)
+    if 'PRECIPITACAO' in estado['valores']:
+        indices[f'PRECIPITACAO_{JANELA_CHUVA}D'] = window_sum(estado, 'PRECIPITACAO', JANELA_CHUVA)
+        for escala, parametros in estado['spi'].items():
+            indices[f'SPI_{escala}'] = spi(datas, window_sum(estado, 'PRECIPITACAO', escala), parametros)
+    if 'GRAUS_DIA' in estado['valores']:
+        indices['GRAUS_DIA'] = estado['valores']['GRAUS_DIA']
+        indices['GRAUS_DIA_SAFRA'] = season_total(estado, 'GRAUS_DIA')
+    return indices
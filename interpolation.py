@@ -0,0 +1,117 @@
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from comparison import load_station_matrix
+from stations import RAIO_TERRA_KM, load_stations
+
+# Retângulo (lat_min, lat_max, lon_min, lon_max) da bacia do Paraitinga
+BACIA_PARAITINGA = (-23.55, -22.95, -45.65, -44.90)
+
+# Resolução padrão da grade (graus)
+RESOLUCAO_GRADE = 0.02
+
+# Margem (graus) ao redor da região para buscar estações
+MARGEM_ESTACOES = 1.5
+
+# IDW: vizinhos por ponto da grade e expoente da distância
+VIZINHOS_IDW = 8
+POTENCIA_IDW = 2.0
+
+# Distância mínima (rad) para evitar divisão por zero em pontos sobre uma estação
+_DISTANCIA_MINIMA = 1e-9
+
+
+def make_grid(limites=BACIA_PARAITINGA, resolucao=RESOLUCAO_GRADE):
+    """Grade regular lat × lon; 'pontos' lista as células linha a linha"""
+    lat_min, lat_max, lon_min, lon_max = limites
+    lat = np.arange(lat_min, lat_max + resolucao / 2, resolucao)
+    lon = np.arange(lon_min, lon_max + resolucao / 2, resolucao)
+    malha_lat, malha_lon = np.meshgrid(lat, lon, indexing='ij')
+    return {
+        'lat': lat,
+        'lon': lon,
+        'pontos': np.column_stack([malha_lat.ravel(), malha_lon.ravel()])
+    }
+
+
+def stations_in_region(estacoes, limites=BACIA_PARAITINGA, margem=MARGEM_ESTACOES):
+    """Estações com coordenadas dentro da região ampliada pela margem"""
+    lat_min, lat_max, lon_min, lon_max = limites
+    dentro = (estacoes['latitude'].between(lat_min - margem, lat_max + margem)
+              & estacoes['longitude'].between(lon_min - margem, lon_max + margem))
+    return estacoes[dentro].dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+
+
+def idw_weights(estacoes, grade, vizinhos=VIZINHOS_IDW, potencia=POTENCIA_IDW):
+    """
+    Matriz de pesos IDW (pontos da grade × estações), com os k vizinhos
+    mais próximos de cada ponto pela distância haversine. Calculada uma
+    vez por grade e reutilizada em todos os passos de tempo.
+    """
+    coordenadas = np.radians(estacoes[['latitude', 'longitude']].to_numpy(dtype='float64'))
+    vizinhos = min(vizinhos, len(coordenadas))
+    distancias, posicoes = BallTree(coordenadas, metric='haversine').query(
+        np.radians(grade['pontos']), k=vizinhos)
+
+    pesos = 1.0 / np.maximum(distancias, _DISTANCIA_MINIMA) ** potencia
+    matriz = np.zeros((len(grade['pontos']), len(coordenadas)))
+    matriz[np.arange(len(grade['pontos']))[:, None], posicoes] = pesos
+    return {
+        'estacoes': estacoes['nome_estacao'].tolist(),
+        'pesos': matriz,
+        'distancia_media_km': float(distancias.mean() * RAIO_TERRA_KM)
+    }
+
+
+def interpolate(valores, pesos):
+    """
+    Interpola todos os passos de tempo de uma vez: (tempos × estações) →
+    (tempos × pontos). Estações sem dado em um dia saem da média e os
+    pesos restantes são renormalizados.
+    """
+    observado = np.isfinite(valores)
+    numerador = np.where(observado, valores, 0.0) @ pesos.T
+    denominador = observado.astype('float64') @ pesos.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return numerador / denominador
+
+
+def interpolate_fields(matriz, pesos):
+    """
+    Campos interpolados para cada dia da matriz de estações. Não há
+    correção de altitude: sem um modelo digital de terreno, a altitude das
+    células seria a própria média IDW das estações e a correção se anularia.
+    """
+    colunas = [matriz['estacoes'].index(nome) for nome in pesos['estacoes']]
+    return interpolate(matriz['valores'][:, colunas], pesos['pesos'])
+
+
+def regional_fields(conn, variavel, inicio=None, fim=None, limites=BACIA_PARAITINGA,
+                    resolucao=RESOLUCAO_GRADE, estacoes=None, pesos=None):
+    """
+    Campos diários da variável sobre a região: uma consulta para as
+    estações próximas, pesos IDW (recebidos prontos ou calculados) e uma
+    multiplicação de matrizes para todo o período.
+
+    Retorna um dicionário com 'datas', 'lat', 'lon', 'campos' (dias × lat × lon)
+    e as estações usadas.
+    """
+    grade = make_grid(limites, resolucao)
+    if estacoes is None:
+        estacoes = stations_in_region(load_stations(conn, somente_com_dados=True), limites)
+    if estacoes.empty:
+        raise ValueError("Nenhuma estação com dados na região")
+    if pesos is None:
+        pesos = idw_weights(estacoes, grade)
+
+    matriz = load_station_matrix(conn, pesos['estacoes'], variavel, inicio, fim)
+    campos = interpolate_fields(matriz, pesos)
+
+    return {
+        'datas': matriz['datas'],
+        'lat': grade['lat'],
+        'lon': grade['lon'],
+        'campos': campos.reshape(len(matriz['datas']), len(grade['lat']), len(grade['lon'])),
+        'estacoes': estacoes
+    }
+
@@ -0,0 +1,151 @@
+import os
+import json
+import pickle
+
+from database import ESTACAO_PADRAO, connect, get_data_watermark, load_weather_data, placeholder
+from forecasting import fit_forecaster
+
+# Alvo padrão do modelo exibido no dashboard
+ALVO_PADRAO = 'TEMPERATURA_MEDIA'
+
+
+def create_registry_table(cur):
+    """Cria a tabela que guarda os modelos treinados por marca d'água"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS modelos_ml (
+        watermark VARCHAR(64) NOT NULL,
+        estacao VARCHAR(100) NOT NULL,
+        alvo VARCHAR(50) NOT NULL,
+        modelo BYTEA,
+        metricas TEXT,
+        predicoes TEXT,
+        criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (watermark, estacao, alvo)
+    );
+    """)
+
+
+def train_model(df, target=ALVO_PADRAO):
+    """Treina o previsor sazonal e avalia em um holdout cronológico"""
+    return fit_forecaster(df, target)
+
+
+def save_artifact(conn, watermark, model, metricas, y_test, y_pred,
+                  nome_estacao=ESTACAO_PADRAO, target=ALVO_PADRAO):
+    """
+    Grava (ou substitui) o artefato do modelo para a marca d'água informada
+    e apaga os artefatos de marcas anteriores da mesma estação e alvo
+    """
+    p = placeholder(conn)
+    predicoes = {
+        'y_test': [float(v) for v in y_test],
+        'y_pred': [float(v) for v in y_pred]
+    }
+
+    cur = conn.cursor()
+    create_registry_table(cur)
+    cur.execute(f"""
+    INSERT INTO modelos_ml (watermark, estacao, alvo, modelo, metricas, predicoes)
+    VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+    ON CONFLICT (watermark, estacao, alvo) DO UPDATE SET
+        modelo = EXCLUDED.modelo,
+        metricas = EXCLUDED.metricas,
+        predicoes = EXCLUDED.predicoes,
+        criado_em = CURRENT_TIMESTAMP
+    """, (
+        watermark,
+        nome_estacao,
+        target,
+        pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL),
+        json.dumps(metricas),
+        json.dumps(predicoes)
+    ))
+    cur.execute(f"""
+    DELETE FROM modelos_ml WHERE estacao = {p} AND alvo = {p} AND watermark <> {p}
+    """, (nome_estacao, target, watermark))
+    conn.commit()
+    cur.close()
+
+
+def train_and_register(conn, nome_estacao=ESTACAO_PADRAO, target=ALVO_PADRAO, force=False):
+    """
+    Job de retreino completo, executado pelo workflow logo após o coletor: treina o modelo
+    com todo o histórico e registra o artefato (avaliação em holdout), a
+    menos que já exista um para esta marca d'água. Retorna a marca d'água
+    do artefato.
+    """
+    watermark = get_data_watermark(conn)
+    p = placeholder(conn)
+
+    cur = conn.cursor()
+    create_registry_table(cur)
+    conn.commit()
+    if not force:
+        cur.execute(f"""
+        SELECT 1 FROM modelos_ml WHERE watermark = {p} AND estacao = {p} AND alvo = {p}
+        """, (watermark, nome_estacao, target))
+        if cur.fetchone() is not None:
+            cur.close()
+            return watermark
+    cur.close()
+
+    df = load_weather_data(conn, nome_estacao=nome_estacao, colunas=[target])
+    model, mse, r2, X_test, y_test, y_pred = train_model(df, target)
+
+    metricas = {
+        'mse': float(mse),
+        'r2': float(r2),
+        'n_teste': int(len(y_test)),
+        'n_total': int(df[target].notna().sum())
+    }
+    save_artifact(conn, watermark, model, metricas, y_test, y_pred, nome_estacao, target)
+    return watermark
+
+
+def load_latest_artifact(conn, nome_estacao=ESTACAO_PADRAO, target=ALVO_PADRAO):
+    """
+    Carrega o artefato mais recente do modelo, sem treinar nada.
+    Retorna None se nenhum modelo foi registrado ainda.
+    """
+    p = placeholder(conn)
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+        SELECT watermark, modelo, metricas, predicoes, criado_em
+        FROM modelos_ml
+        WHERE estacao = {p} AND alvo = {p}
+        ORDER BY criado_em DESC
+        LIMIT 1
+        """, (nome_estacao, target))
+        row = cur.fetchone()
+    except Exception:
+        conn.rollback()
+        row = None
+    finally:
+        cur.close()
+
+    if row is None:
+        return None
+
+    watermark, modelo, metricas, predicoes, criado_em = row
+    predicoes = json.loads(predicoes)
+    return {
+        'watermark': watermark,
+        'model': pickle.loads(bytes(modelo)),
+        'metricas': json.loads(metricas),
+        'y_test': predicoes['y_test'],
+        'y_pred': predicoes['y_pred'],
+        'criado_em': str(criado_em)
+    }
+
+
+if __name__ == "__main__":
+    database_url = os.environ.get('DATABASE_URL')
+
+    if not database_url:
+        print("Por favor, defina a variável de ambiente DATABASE_URL")
+    else:
+        conn = connect(database_url)
+        watermark = train_and_register(conn)
+        conn.close()
+        print(f"Modelo registrado para a marca d'água {watermark}")
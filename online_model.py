@@ -0,0 +1,264 @@
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from database import ESTACAO_PADRAO, connect, load_weather_data, placeholder
+from forecasting import HARMONICAS, HORIZONTE, PERIODO_ANUAL, days_since_origin, fourier_terms
+
+# Variáveis mantidas pelo modelo incremental
+VARIAVEIS_ONLINE = ['TEMPERATURA_MEDIA', 'UMIDADE_RELATIVA', 'PRESSAO_ATMOSFERICA']
+
+# Regularização (ridge) usada ao resolver as equações normais
+LAMBDA_RIDGE = 1e-3
+
+
+def create_online_table(cur):
+    """Cria a tabela com as estatísticas suficientes do modelo incremental"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS modelo_online (
+        estacao VARCHAR(100) NOT NULL,
+        variavel VARCHAR(50) NOT NULL,
+        n INTEGER NOT NULL,
+        xtx TEXT NOT NULL,
+        xty TEXT NOT NULL,
+        yty DOUBLE PRECISION NOT NULL,
+        ultima_data DATE,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (estacao, variavel)
+    );
+    """)
+
+
+def seasonal_features(datas, harmonicas=HARMONICAS):
+    """Conjunto de features sazonais: intercepto, tendência e termos de Fourier"""
+    datas = pd.DatetimeIndex(datas)
+    tendencia = days_since_origin(datas) / (10 * PERIODO_ANUAL)
+    return np.hstack([
+        np.ones((len(datas), 1)),
+        tendencia[:, None],
+        fourier_terms(datas, harmonicas)
+    ])
+
+
+def empty_state(harmonicas=HARMONICAS):
+    """Estatísticas suficientes de um modelo ainda sem observações"""
+    p = 2 + 2 * harmonicas
+    return {
+        'n': 0,
+        'xtx': np.zeros((p, p)),
+        'xty': np.zeros(p),
+        'yty': 0.0,
+        'ultima_data': None
+    }
+
+
+def _acumular(estado, datas, valores, sinal=1):
+    """Soma (sinal=1) ou retira (sinal=-1) as observações válidas das estatísticas"""
+    valido = np.isfinite(valores)
+    if not valido.any():
+        return estado
+
+    X = seasonal_features(datas[valido])
+    y = valores[valido]
+    estado['n'] += sinal * len(y)
+    estado['xtx'] = estado['xtx'] + sinal * (X.T @ X)
+    estado['xty'] = estado['xty'] + sinal * (X.T @ y)
+    estado['yty'] = estado['yty'] + sinal * float(y @ y)
+    if sinal > 0:
+        ultima = datas[valido].max().date()
+        if estado['ultima_data'] is None or ultima > estado['ultima_data']:
+            estado['ultima_data'] = ultima
+    return estado
+
+
+def partial_fit(estado, datas, valores, anteriores=None):
+    """
+    Acumula novas observações nas estatísticas suficientes (X'X, X'y, y'y).
+    O custo é proporcional ao número de novas linhas, não ao histórico.
+
+    'anteriores' são os valores que já estavam gravados nas mesmas datas
+    (NaN onde não havia linha): a contribuição antiga é retirada antes de
+    somar a nova, então um dia revisado pelo upsert substitui o valor
+    antigo. Só se retira o que o estado já incorporou, isto é, datas até
+    'ultima_data' de um estado já carregado; linhas gravadas por fora do
+    modelo (ex.: COPY de dados de exemplo) nunca deixam n ou X'X negativos.
+    Sem 'anteriores', linhas até 'ultima_data' são tratadas como já
+    incorporadas e ignoradas (carga inicial).
+    """
+    datas = pd.DatetimeIndex(datas)
+    valores = np.asarray(valores, dtype='float64')
+    if anteriores is not None:
+        if estado['ultima_data'] is not None:
+            incorporados = datas <= pd.Timestamp(estado['ultima_data'])
+            antigos = np.where(incorporados, np.asarray(anteriores, dtype='float64'), np.nan)
+            _acumular(estado, datas, antigos, sinal=-1)
+    elif estado['ultima_data'] is not None:
+        valores = np.where(datas > pd.Timestamp(estado['ultima_data']), valores, np.nan)
+    return _acumular(estado, datas, valores)
+
+
+def coefficients(estado, lambda_ridge=LAMBDA_RIDGE):
+    """Resolve as equações normais regularizadas a partir das estatísticas"""
+    p = len(estado['xty'])
+    penalidade = lambda_ridge * np.eye(p)
+    penalidade[0, 0] = 0.0  # não penalizar o intercepto
+    return np.linalg.solve(estado['xtx'] + penalidade, estado['xty'])
+
+
+def rmse(estado, beta=None):
+    """RMSE no treino calculado só com as estatísticas suficientes"""
+    if estado['n'] == 0:
+        return None
+    beta = coefficients(estado) if beta is None else beta
+    sse = estado['yty'] - 2 * beta @ estado['xty'] + beta @ estado['xtx'] @ beta
+    return float(np.sqrt(max(sse, 0.0) / estado['n']))
+
+
+def r2(estado, beta=None):
+    """R² no treino calculado só com as estatísticas suficientes"""
+    if estado['n'] == 0:
+        return None
+    beta = coefficients(estado) if beta is None else beta
+    sse = estado['yty'] - 2 * beta @ estado['xty'] + beta @ estado['xtx'] @ beta
+    sst = estado['yty'] - estado['xty'][0] ** 2 / estado['n']  # xty[0] = soma de y (intercepto)
+    return float(1 - max(sse, 0.0) / sst) if sst > 0 else None
+
+
+def predict(estado, datas):
+    """Previsão sazonal para as datas informadas"""
+    return seasonal_features(datas) @ coefficients(estado)
+
+
+def online_forecast(conn, nome_estacao=ESTACAO_PADRAO, variavel='TEMPERATURA_MEDIA', horizonte=HORIZONTE):
+    """
+    Métricas e previsão dos próximos dias a partir do estado incremental,
+    sem ler o histórico. None se o modelo ainda não tem observações suficientes.
+    """
+    estado = load_state(conn, variavel, nome_estacao)
+    if estado['n'] <= len(estado['xty']) or estado['ultima_data'] is None:
+        return None
+
+    beta = coefficients(estado)
+    datas = pd.date_range(pd.Timestamp(estado['ultima_data']) + pd.Timedelta(days=1), periods=horizonte, freq='D')
+    return {
+        'metricas': {'rmse': rmse(estado, beta), 'r2': r2(estado, beta), 'n_total': int(estado['n'])},
+        'ultima_data': str(estado['ultima_data']),
+        'previsao': pd.DataFrame({'DATA': datas, variavel: seasonal_features(datas) @ beta})
+    }
+
+
+def stored_values(conn, datas, nome_estacao=ESTACAO_PADRAO, variaveis=VARIAVEIS_ONLINE):
+    """
+    Valores já gravados nas datas informadas (NaN onde não há linha), lidos
+    antes de um upsert para retirar do modelo a contribuição dos dias revisados.
+    Lê só o intervalo das datas, não o histórico.
+    """
+    datas = pd.DatetimeIndex(pd.to_datetime(datas)).unique()
+    if datas.empty:
+        return pd.DataFrame(columns=variaveis)
+    gravados = load_weather_data(conn, nome_estacao=nome_estacao, inicio=datas.min().date(),
+                                 fim=datas.max().date(), colunas=variaveis)
+    return gravados.drop_duplicates('DATA').set_index('DATA').reindex(datas)
+
+
+def load_state(conn, variavel, nome_estacao=ESTACAO_PADRAO):
+    """Lê as estatísticas suficientes do banco (ou um estado vazio)"""
+    p = placeholder(conn)
+    cur = conn.cursor()
+    create_online_table(cur)
+    cur.execute(f"""
+    SELECT n, xtx, xty, yty, ultima_data FROM modelo_online
+    WHERE estacao = {p} AND variavel = {p}
+    """, (nome_estacao, variavel))
+    row = cur.fetchone()
+    cur.close()
+
+    if row is None:
+        return empty_state()
+
+    n, xtx, xty, yty, ultima_data = row
+    return {
+        'n': int(n),
+        'xtx': np.array(json.loads(xtx)),
+        'xty': np.array(json.loads(xty)),
+        'yty': float(yty),
+        'ultima_data': pd.Timestamp(ultima_data).date() if ultima_data is not None else None
+    }
+
+
+def save_state(conn, variavel, estado, nome_estacao=ESTACAO_PADRAO, commit=True):
+    """Grava as estatísticas suficientes no banco (commit=False deixa a transação aberta)"""
+    p = placeholder(conn)
+    cur = conn.cursor()
+    create_online_table(cur)
+    cur.execute(f"""
+    INSERT INTO modelo_online (estacao, variavel, n, xtx, xty, yty, ultima_data)
+    VALUES ({p}, {p}, {p}, {p}, {p}, {p}, {p})
+    ON CONFLICT (estacao, variavel) DO UPDATE SET
+        n = EXCLUDED.n,
+        xtx = EXCLUDED.xtx,
+        xty = EXCLUDED.xty,
+        yty = EXCLUDED.yty,
+        ultima_data = EXCLUDED.ultima_data,
+        atualizado_em = CURRENT_TIMESTAMP
+    """, (
+        nome_estacao,
+        variavel,
+        estado['n'],
+        json.dumps(estado['xtx'].tolist()),
+        json.dumps(estado['xty'].tolist()),
+        estado['yty'],
+        str(estado['ultima_data']) if estado['ultima_data'] is not None else None
+    ))
+    if commit:
+        conn.commit()
+    cur.close()
+
+
+def update_online_models(conn, df_novos, nome_estacao=ESTACAO_PADRAO, variaveis=VARIAVEIS_ONLINE,
+                         anteriores=None, commit=True):
+    """
+    Atualiza os modelos incrementais com as linhas recém-ingeridas.
+    Com 'anteriores' (ver stored_values), dias que já existiam têm o valor
+    antigo substituído pelo novo; sem ele, linhas com data até 'ultima_data'
+    são ignoradas. Todas as variáveis são gravadas com um único commit ao
+    final; com commit=False quem chama confirma a transação (o coletor a
+    confirma junto com o upsert do lote). Retorna o saldo de observações
+    de cada variável.
+    """
+    df_novos = df_novos.assign(DATA=pd.to_datetime(df_novos['DATA'])).drop_duplicates('DATA', keep='last')
+    datas = df_novos['DATA']
+    if anteriores is not None:
+        anteriores = anteriores.reindex(index=pd.DatetimeIndex(datas), columns=variaveis)
+    incorporadas = {}
+    for variavel in variaveis:
+        if variavel not in df_novos.columns:
+            continue
+        estado = load_state(conn, variavel, nome_estacao)
+        n_antes, xty_antes = estado['n'], estado['xty']
+        antigos = anteriores[variavel].to_numpy(dtype='float64') if anteriores is not None else None
+        estado = partial_fit(estado, datas, pd.to_numeric(df_novos[variavel], errors='coerce'), antigos)
+        if estado['n'] != n_antes or not np.array_equal(estado['xty'], xty_antes):
+            save_state(conn, variavel, estado, nome_estacao, commit=False)
+        incorporadas[variavel] = estado['n'] - n_antes
+    if commit:
+        conn.commit()
+    return incorporadas
+
+
+if __name__ == "__main__":
+    # Carga inicial: incorpora todo o histórico já existente no banco.
+    # Depois disso o coletor envia apenas os dias novos.
+    database_url = os.environ.get('DATABASE_URL')
+
+    if not database_url:
+        print("Por favor, defina a variável de ambiente DATABASE_URL")
+    else:
+        conn = connect(database_url)
+        df = load_weather_data(conn, colunas=VARIAVEIS_ONLINE)
+        incorporadas = update_online_models(conn, df)
+        conn.close()
+        for variavel, n in incorporadas.items():
+            print(f"{variavel}: {n} observações incorporadas")
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Limites (segundos) dos buckets do histograma de duração dos spans
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Logs estruturados (uma linha JSON por span) quando PERF_LOG=1
+_logger = logging.getLogger('perf')
+if os.environ.get('PERF_LOG') == '1' and not _logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    _logger.addHandler(_handler)
+    _logger.setLevel(logging.INFO)
+    _logger.propagate = False
+
+# Métricas do processo; os módulos continuam importados entre as
+# execuções do Streamlit, então os contadores acumulam desde o início
+_lock = threading.Lock()
+_spans = {}
+_cache_chamadas = {}
+_cache_falhas = {}
+_ultimos = {}
+
+
+@contextmanager
+def span(nome, **atributos):
+    """Mede a duração de um trecho, acumula no histograma e registra no log"""
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield
+    except Exception as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        with _lock:
+            estado = _spans.setdefault(nome, {'count': 0, 'sum': 0.0, 'max': 0.0,
+                                              'buckets': [0] * len(BUCKETS)})
+            estado['count'] += 1
+            estado['sum'] += duracao
+            estado['max'] = max(estado['max'], duracao)
+            for i, limite in enumerate(BUCKETS):
+                if duracao <= limite:
+                    estado['buckets'][i] += 1
+            _ultimos[nome] = duracao
+        if _logger.isEnabledFor(logging.INFO):
+            registro = {'evento': 'span', 'span': nome, 'duracao_ms': round(duracao * 1000, 3)}
+            registro.update(atributos)
+            if erro:
+                registro['erro'] = erro
+            _logger.info(json.dumps(registro, default=str))
+
+
+def timed(nome):
+    """Decorador equivalente a envolver a função inteira em span(nome)"""
+    def decorador(funcao):
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with span(nome):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+def cache_calls(nome):
+    """
+    Conta as chamadas de uma função cacheada. Aplicar por fora do
+    decorador de cache; junto com cache_misses dá a taxa de acerto.
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with _lock:
+                _cache_chamadas[nome] = _cache_chamadas.get(nome, 0) + 1
+            with span(f'cache.{nome}'):
+                return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+def cache_misses(nome):
+    """
+    Conta as execuções reais de uma função cacheada. Aplicar por dentro do
+    decorador de cache: o corpo só roda quando o cache não tem o valor.
+    """
+    def decorador(funcao):
+        @wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with _lock:
+                _cache_falhas[nome] = _cache_falhas.get(nome, 0) + 1
+            return funcao(*args, **kwargs)
+        return envolvida
+    return decorador
+
+
+def count_cache(nome, acerto):
+    """Registra uma consulta a um cache próprio (sem decoradores)"""
+    with _lock:
+        _cache_chamadas[nome] = _cache_chamadas.get(nome, 0) + 1
+        if not acerto:
+            _cache_falhas[nome] = _cache_falhas.get(nome, 0) + 1
+
+
+def snapshot():
+    """Cópia das métricas atuais: spans (contagem, total, média, máximo, última) e caches"""
+    with _lock:
+        spans = {
+            nome: {
+                'count': e['count'],
+                'total_ms': e['sum'] * 1000,
+                'media_ms': e['sum'] / e['count'] * 1000,
+                'max_ms': e['max'] * 1000,
+                'ultimo_ms': _ultimos[nome] * 1000
+            }
+            for nome, e in _spans.items()
+        }
+        caches = {}
+        for nome, chamadas in _cache_chamadas.items():
+            falhas = min(_cache_falhas.get(nome, 0), chamadas)
+            caches[nome] = {'chamadas': chamadas, 'acertos': chamadas - falhas, 'falhas': falhas}
+    return {'spans': spans, 'caches': caches}
+
+
+def reset():
+    """Zera todas as métricas"""
+    with _lock:
+        _spans.clear()
+        _cache_chamadas.clear()
+        _cache_falhas.clear()
+        _ultimos.clear()
+
+
+def _rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_prometheus():
+    """Métricas no formato de exposição em texto do Prometheus"""
+    linhas = [
+        '# HELP perf_span_seconds Duração dos trechos instrumentados',
+        '# TYPE perf_span_seconds histogram'
+    ]
+    with _lock:
+        for nome, e in sorted(_spans.items()):
+            r = _rotulo(nome)
+            for limite, n in zip(BUCKETS, e['buckets']):
+                linhas.append(f'perf_span_seconds_bucket{{span="{r}",le="{limite}"}} {n}')
+            linhas.append(f'perf_span_seconds_bucket{{span="{r}",le="+Inf"}} {e["count"]}')
+            linhas.append(f'perf_span_seconds_sum{{span="{r}"}} {e["sum"]:.6f}')
+            linhas.append(f'perf_span_seconds_count{{span="{r}"}} {e["count"]}')
+
+        linhas += ['# HELP perf_cache_calls_total Chamadas de funções cacheadas',
+                   '# TYPE perf_cache_calls_total counter']
+        linhas += [f'perf_cache_calls_total{{cache="{_rotulo(n)}"}} {c}'
+                   for n, c in sorted(_cache_chamadas.items())]
+        linhas += ['# HELP perf_cache_misses_total Execuções reais (cache sem o valor)',
+                   '# TYPE perf_cache_misses_total counter']
+        linhas += [f'perf_cache_misses_total{{cache="{_rotulo(n)}"}} {c}'
+                   for n, c in sorted(_cache_falhas.items())]
+    return '\n'.join(linhas) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        corpo = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(porta):
+    """Serve GET /metrics em uma thread daemon (o Streamlit não expõe rotas próprias)"""
+    servidor = ThreadingHTTPServer(('0.0.0.0', int(porta)), _MetricsHandler)
+    threading.Thread(target=servidor.serve_forever, name='perf-metrics', daemon=True).start()
+    return servidor
@@ -0,0 +1,269 @@
+import numpy as np
+import pandas as pd
+
+from database import VARIAVEIS, load_weather_data, placeholder, station_coverage
+
+# Lacunas de até N dias seguidos são preenchidas por interpolação linear
+MAX_LACUNA_PREENCHIDA = 3
+
+# Chuva não é interpolada: um dia sem dado não é um dia sem chuva
+VARIAVEIS_SEM_INTERPOLACAO = ('PRECIPITACAO',)
+
+# Colunas de identificação repetidas em todas as linhas de uma estação
+COLUNAS_ESTACAO = ['ESTACAO', 'NOME_DA_ESTACAO', 'UF', 'REGIAO', 'LATITUDE', 'LONGITUDE', 'ALTITUDE']
+
+
+def runs(mascara):
+    """Índices de início e fim (exclusivo) de cada sequência de True"""
+    bordas = np.diff(np.concatenate([[0], np.asarray(mascara).astype(np.int8), [0]]))
+    return np.flatnonzero(bordas == 1), np.flatnonzero(bordas == -1)
+
+
+def fill_short_gaps(valores, max_lacuna=MAX_LACUNA_PREENCHIDA):
+    """
+    Interpola linearmente as lacunas internas de até max_lacuna posições.
+    Retorna (valores preenchidos, máscara das posições preenchidas).
+    """
+    valores = np.asarray(valores, dtype='float64')
+    ausente = ~np.isfinite(valores)
+    inicios, fins = runs(ausente)
+    curta = (fins - inicios <= max_lacuna) & (inicios > 0) & (fins < len(valores))
+
+    marca = np.zeros(len(valores) + 1)
+    np.add.at(marca, inicios[curta], 1)
+    np.add.at(marca, fins[curta], -1)
+    preencher = np.cumsum(marca)[:len(valores)] > 0
+
+    preenchido = valores.copy()
+    if preencher.any():
+        observados = np.flatnonzero(~ausente)
+        preenchido[preencher] = np.interp(np.flatnonzero(preencher), observados, valores[observados])
+    return preenchido, preencher
+
+
+def regular_calendar(df):
+    """
+    Reindexa cada estação em um calendário diário contínuo, do primeiro ao
+    último dia observado. Dias sem registro entram com NaN nas variáveis e
+    DIA_AUSENTE=True; as colunas de identificação da estação são repetidas.
+    """
+    df = df.dropna(subset=['DATA'])
+    if 'NOME_DA_ESTACAO' in df.columns:
+        grupos = df.groupby('NOME_DA_ESTACAO', sort=False)
+    else:
+        grupos = [(None, df)]
+
+    partes = []
+    for _, grupo in grupos:
+        if grupo.empty:
+            continue
+        grupo = grupo.drop_duplicates('DATA', keep='last').set_index('DATA').sort_index()
+        calendario = pd.date_range(grupo.index[0], grupo.index[-1], freq='D', name='DATA')
+        regular = grupo.reindex(calendario)
+        regular['DIA_AUSENTE'] = ~calendario.isin(grupo.index)
+        for col in COLUNAS_ESTACAO:
+            if col in regular.columns:
+                regular[col] = grupo[col].iloc[-1]
+        partes.append(regular.reset_index())
+
+    if not partes:
+        return df.assign(DIA_AUSENTE=pd.Series(dtype=bool))
+    return pd.concat(partes, ignore_index=True)
+
+
+def resample_station_data(df, variaveis=VARIAVEIS, max_lacuna=MAX_LACUNA_PREENCHIDA):
+    """
+    Etapa de regularização: calendário contínuo por estação, relatório de
+    lacunas (run-length) e preenchimento das lacunas curtas.
+
+    Retorna um dicionário com 'dados' (uma linha por estação e dia, com
+    {variavel}_PREENCHIDO marcando os valores interpolados) e 'lacunas'
+    (uma linha por sequência de dias sem dado de cada variável).
+    """
+    dados = regular_calendar(df)
+    variaveis = [v for v in variaveis if v in dados.columns]
+    estacao = dados['NOME_DA_ESTACAO'] if 'NOME_DA_ESTACAO' in dados.columns else pd.Series('', index=dados.index)
+
+    # Fronteiras entre estações: lacunas não atravessam de uma estação para outra
+    codigos = pd.factorize(estacao)[0]
+    fronteiras = np.flatnonzero(np.diff(codigos)) + 1
+    blocos = np.split(np.arange(len(dados)), fronteiras)
+
+    lacunas = []
+    datas = dados['DATA'].to_numpy()
+    nomes = estacao.to_numpy()
+    for var in variaveis:
+        valores = dados[var].to_numpy(dtype='float64')
+        preenchido = np.zeros(len(dados), dtype=bool)
+        for bloco in blocos:
+            if len(bloco) == 0:
+                continue
+            ausente = ~np.isfinite(valores[bloco])
+            inicios, fins = runs(ausente)
+            duracao = fins - inicios
+            interpolar = var not in VARIAVEIS_SEM_INTERPOLACAO
+            if interpolar:
+                valores[bloco], preenchido[bloco] = fill_short_gaps(valores[bloco], max_lacuna)
+            lacunas.append(pd.DataFrame({
+                'estacao': nomes[bloco[0]],
+                'variavel': var,
+                'inicio': datas[bloco[inicios]],
+                'fim': datas[bloco[fins - 1]],
+                'duracao': duracao,
+                'preenchida': preenchido[bloco][inicios] if interpolar else np.zeros(len(inicios), bool)
+            }))
+        dados[var] = valores
+        dados[f'{var}_PREENCHIDO'] = preenchido
+
+    colunas = ['estacao', 'variavel', 'inicio', 'fim', 'duracao', 'preenchida']
+    lacunas = pd.concat(lacunas, ignore_index=True) if lacunas else pd.DataFrame(columns=colunas)
+    return {
+        'dados': dados,
+        'lacunas': lacunas.sort_values(['estacao', 'variavel', 'inicio'], ignore_index=True)
+    }
+
+
+def gap_summary(lacunas):
+    """Dias sem dado, dias preenchidos e maior lacuna por estação e variável"""
+    if lacunas.empty:
+        return pd.DataFrame(columns=['estacao', 'variavel', 'dias_ausentes', 'dias_preenchidos', 'maior_lacuna'])
+    return lacunas.assign(
+        preenchidos=lacunas['duracao'].where(lacunas['preenchida'], 0)
+    ).groupby(['estacao', 'variavel']).agg(
+        dias_ausentes=('duracao', 'sum'),
+        dias_preenchidos=('preenchidos', 'sum'),
+        maior_lacuna=('duracao', 'max')
+    ).reset_index()
+
+
+def merge_gap_reports(anteriores, novas, inicio, fim, max_lacuna=MAX_LACUNA_PREENCHIDA):
+    """
+    Junta um relatório de lacunas com o recalculado na janela [inicio, fim],
+    em que 'inicio' é um dia com registro. As lacunas que começam na janela
+    são substituídas; a que atravessa o início é cortada na véspera e, se a
+    variável continua sem dado no primeiro dia da janela, emendada com a
+    lacuna recalculada (duração somada, preenchimento reavaliado).
+    """
+    inicio, fim = pd.Timestamp(inicio), pd.Timestamp(fim)
+    vespera = inicio - pd.Timedelta(days=1)
+    anteriores = anteriores.assign(inicio=pd.to_datetime(anteriores['inicio']), fim=pd.to_datetime(anteriores['fim']))
+    novas = novas.assign(inicio=pd.to_datetime(novas['inicio']), fim=pd.to_datetime(novas['fim']))
+
+    antes = anteriores[anteriores['inicio'] < inicio].copy()
+    antes['fim'] = antes['fim'].where(antes['fim'] < inicio, vespera)
+    antes['duracao'] = (antes['fim'] - antes['inicio']).dt.days + 1
+
+    cortadas = antes[antes['fim'] == vespera].set_index('variavel')
+    emendar = (novas['inicio'] == inicio) & novas['variavel'].isin(cortadas.index)
+    if emendar.any():
+        var = novas.loc[emendar, 'variavel']
+        novas.loc[emendar, 'inicio'] = var.map(cortadas['inicio']).to_numpy()
+        novas.loc[emendar, 'duracao'] += var.map(cortadas['duracao']).to_numpy()
+        novas.loc[emendar, 'preenchida'] = (
+            (novas.loc[emendar, 'duracao'] <= max_lacuna)
+            & (novas.loc[emendar, 'fim'] < fim)
+            & ~var.isin(VARIAVEIS_SEM_INTERPOLACAO)
+        ).to_numpy()
+        antes = antes[~((antes['fim'] == vespera) & antes['variavel'].isin(var))]
+
+    return pd.concat([antes, novas], ignore_index=True).sort_values(
+        ['estacao', 'variavel', 'inicio'], ignore_index=True)
+
+
+def _report_matches(lacunas, cobertura, variaveis):
+    """O relatório gravado bate com os dias observados no banco até cobertura['ultimo']?"""
+    primeiro, ultimo = cobertura['primeiro'], cobertura['ultimo']
+    dias = (ultimo - primeiro).days + 1
+    ate = lacunas[lacunas['inicio'] <= ultimo]
+    ausentes = ((ate['fim'].clip(upper=ultimo) - ate['inicio']).dt.days + 1).groupby(ate['variavel']).sum()
+    return all(int(ausentes.get(var, 0)) == dias - cobertura['observados'][var] for var in variaveis)
+
+
+def refresh_gap_report(conn, nome_estacao, desde, variaveis=VARIAVEIS):
+    """
+    Atualiza o relatório de lacunas da estação recalculando só a partir de
+    'desde', um ano de dados por vez: cada janela começa no último dia com
+    registro da anterior e é emendada ao relatório (merge_gap_reports). Se
+    o relatório gravado não bate com as contagens do banco antes de 'desde'
+    (estação nova ou carga feita fora do coletor), percorre o histórico
+    inteiro, também ano a ano. Retorna o relatório gravado.
+    """
+    cobertura = station_coverage(conn, nome_estacao, antes=desde, variaveis=variaveis)
+    lacunas = load_gap_report(conn, nome_estacao)
+    lacunas = lacunas[lacunas['variavel'].isin(variaveis)]
+    if cobertura['ultimo'] is None:
+        inicio = pd.Timestamp(desde)
+        lacunas = lacunas.iloc[0:0]
+    elif _report_matches(lacunas, cobertura, variaveis):
+        inicio = cobertura['ultimo']
+    else:
+        inicio = cobertura['primeiro']
+        lacunas = lacunas.iloc[0:0]
+
+    ultimo = station_coverage(conn, nome_estacao, variaveis=variaveis)['ultimo']
+    for ano in range(inicio.year, ultimo.year + 1 if ultimo is not None else inicio.year):
+        janela = load_weather_data(conn, nome_estacao=nome_estacao, inicio=inicio.date(),
+                                   fim=f'{ano}-12-31', colunas=variaveis)
+        if janela.empty:
+            continue
+        janela['NOME_DA_ESTACAO'] = nome_estacao
+        novas = resample_station_data(janela, variaveis)['lacunas']
+        lacunas = merge_gap_reports(lacunas, novas, janela['DATA'].min(), janela['DATA'].max())
+        inicio = janela['DATA'].max()
+
+    save_gap_report(conn, nome_estacao, lacunas)
+    return lacunas
+
+
+def create_gaps_table(cur):
+    """Cria a tabela com o relatório de lacunas gerado na ingestão"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS lacunas_dados (
+        estacao VARCHAR(100) NOT NULL,
+        variavel VARCHAR(50) NOT NULL,
+        inicio DATE NOT NULL,
+        fim DATE NOT NULL,
+        duracao INTEGER NOT NULL,
+        preenchida BOOLEAN NOT NULL,
+        PRIMARY KEY (estacao, variavel, inicio)
+    );
+    """)
+
+
+def save_gap_report(conn, nome_estacao, lacunas):
+    """Substitui o relatório de lacunas da estação"""
+    p = placeholder(conn)
+    linhas = [
+        (nome_estacao, var, str(pd.Timestamp(inicio).date()), str(pd.Timestamp(fim).date()), int(d), bool(f))
+        for var, inicio, fim, d, f in lacunas[['variavel', 'inicio', 'fim', 'duracao', 'preenchida']].itertuples(
+            index=False, name=None)
+    ]
+    cur = conn.cursor()
+    create_gaps_table(cur)
+    cur.execute(f"DELETE FROM lacunas_dados WHERE estacao = {p}", (nome_estacao,))
+    cur.executemany(f"""
+    INSERT INTO lacunas_dados (estacao, variavel, inicio, fim, duracao, preenchida)
+    VALUES ({p}, {p}, {p}, {p}, {p}, {p})
+    """, linhas)
+    conn.commit()
+    cur.close()
+    return len(linhas)
+
+
+def load_gap_report(conn, nome_estacao):
+    """Relatório de lacunas gravado na última ingestão da estação (vazio se não houver)"""
+    p = placeholder(conn)
+    try:
+        lacunas = pd.read_sql_query(f"""
+        SELECT estacao, variavel, inicio, fim, duracao, preenchida
+        FROM lacunas_dados
+        WHERE estacao = {p}
+        ORDER BY variavel, inicio
+        """, conn, params=(nome_estacao,))
+    except Exception:
+        conn.rollback()
+        lacunas = pd.DataFrame(columns=['estacao', 'variavel', 'inicio', 'fim', 'duracao', 'preenchida'])
+    lacunas['inicio'] = pd.to_datetime(lacunas['inicio'])
+    lacunas['fim'] = pd.to_datetime(lacunas['fim'])
+    lacunas['preenchida'] = lacunas['preenchida'].astype(bool)
+    return lacunas
@@ -1,9 +1,11 @@
 import os
 import psycopg2
-from psycopg2.extras import execute_values
-import pandas as pd
-from datetime import datetime, timedelta
-import numpy as np
+
+from database import bump_data_watermark
+from generate_sample_data import copy_to_database, generate_synthetic_weather, to_frame
+from model_registry import train_and_register
+from online_model import update_online_models
+from stations import upsert_stations
 
 def setup_database(database_url):
     """
@@ -22,13 +24,13 @@ def setup_database(database_url):
             id SERIAL PRIMARY KEY,
             data DATE NOT NULL,
             hora TIME DEFAULT '12:00:00',
-            estacao VARCHAR(10) DEFAULT 'A740',
-            nome_estacao VARCHAR(100) DEFAULT 'SAO LUIZ DO PARAITINGA',
-            uf VARCHAR(2) DEFAULT 'SP',
-            regiao VARCHAR(2) DEFAULT 'SE',
-            latitude DECIMAL(10, 6) DEFAULT -23.2283,
-            longitude DECIMAL(10, 6) DEFAULT -45.4169,
-            altitude DECIMAL(8, 2) DEFAULT 874.0,
+            estacao VARCHAR(10),
+            nome_estacao VARCHAR(100),
+            uf VARCHAR(2),
+            regiao VARCHAR(2),
+            latitude DECIMAL(10, 6),
+            longitude DECIMAL(10, 6),
+            altitude DECIMAL(8, 2),
             temperatura_maxima DECIMAL(5, 2),
             temperatura_minima DECIMAL(5, 2),
             temperatura_media DECIMAL(5, 2),
@@ -52,72 +54,18 @@ def setup_database(database_url):
         if count == 0:
             print("Inserindo dados de exemplo...")
             
-            # Gerar dados de exemplo de 2000 até o ano atual
-            start_date = datetime(2000, 1, 1)
-            end_date = datetime.now()
-            
-            records = []
-            current_date = start_date
+            # Gerar dados de exemplo de 2000 até o ano atual (uma passada vetorizada)
+            dados = generate_synthetic_weather(n_estacoes=1, inicio='2000-01-01', semente=42)
+            records = to_frame(dados)
             
-            while current_date <= end_date:
-                # Simular dados meteorológicos realistas para São Luiz do Paraitinga
-                day_of_year = current_date.timetuple().tm_yday
-                
-                # Temperatura com sazonalidade
-                temp_base = 20 + 8 * np.sin(2 * np.pi * day_of_year / 365.25 - np.pi/2)
-                temp_variation = np.random.normal(0, 3)
-                temp_media = round(temp_base + temp_variation, 1)
-                temp_maxima = round(temp_media + np.random.uniform(3, 8), 1)
-                temp_minima = round(temp_media - np.random.uniform(2, 6), 1)
-                
-                # Umidade relativa
-                umidade = round(np.random.normal(65, 15), 1)
-                umidade = max(30, min(95, umidade))
-                
-                # Precipitação (mais chuva no verão)
-                precip_prob = 0.3 + 0.2 * np.sin(2 * np.pi * day_of_year / 365.25)
-                precipitacao = round(np.random.exponential(5) if np.random.random() < precip_prob else 0, 1)
-                
-                # Velocidade do vento
-                vento = round(np.random.gamma(2, 2), 1)
-                
-                # Pressão atmosférica
-                pressao = round(np.random.normal(1013, 10), 1)
-                
-                record = (
-                    current_date.date(),
-                    '12:00:00',
-                    'A740',
-                    'SAO LUIZ DO PARAITINGA',
-                    'SP',
-                    'SE',
-                    -23.2283,
-                    -45.4169,
-                    874.0,
-                    temp_maxima,
-                    temp_minima,
-                    temp_media,
-                    umidade,
-                    precipitacao,
-                    vento,
-                    pressao
-                )
-                
-                records.append(record)
-                current_date += timedelta(days=1)
+            # Inserir dados via COPY e cadastrar a estação
+            copy_to_database(conn, records)
+            upsert_stations(conn, dados['estacoes'].rename(columns=str.lower).rename(
+                columns={'nome_da_estacao': 'nome_estacao'}))
             
-            # Inserir dados
-            insert_query = """
-            INSERT INTO dados_meteorologicos (
-                data, hora, estacao, nome_estacao, uf, regiao,
-                latitude, longitude, altitude, temperatura_maxima,
-                temperatura_minima, temperatura_media, umidade_relativa,
-                precipitacao, velocidade_vento, pressao_atmosferica
-            ) VALUES %s
-            """
-            
-            execute_values(cur, insert_query, records)
-            conn.commit()
+            # Carga inicial do modelo incremental (previsão exibida no dashboard)
+            update_online_models(conn, records, nome_estacao=records['NOME_DA_ESTACAO'].iloc[0])
+            bump_data_watermark(conn)
             
             print(f"Inseridos {len(records)} registros de dados de exemplo!")
         else:
@@ -127,6 +75,7 @@ def setup_database(database_url):
         indices = [
             "CREATE INDEX IF NOT EXISTS idx_dados_data ON dados_meteorologicos(data);",
             "CREATE INDEX IF NOT EXISTS idx_dados_estacao ON dados_meteorologicos(estacao);",
+            "CREATE INDEX IF NOT EXISTS idx_dados_nome_estacao_data ON dados_meteorologicos(nome_estacao, data);",
             "CREATE INDEX IF NOT EXISTS idx_dados_data_estacao ON dados_meteorologicos(data, estacao);"
         ]
         
@@ -136,6 +85,10 @@ def setup_database(database_url):
         conn.commit()
         print("Índices criados com sucesso!")
         
+        # Registrar o modelo de ML para os dados atuais
+        train_and_register(conn)
+        print("Modelo de machine learning registrado!")
+        
         # Fechar conexão
         cur.close()
         conn.close()
@@ -0,0 +1,221 @@
+import os
+import glob
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from database import ESTACAO_PADRAO, connect, placeholder
+
+# Raio médio da Terra (km), para converter a distância haversine
+RAIO_TERRA_KM = 6371.0088
+
+# Número de linhas de cabeçalho dos CSVs anuais do INMET
+LINHAS_CABECALHO = 8
+
+# Rótulos do cabeçalho do INMET -> colunas da tabela de estações
+CAMPOS_CABECALHO = {
+    'REGIAO': 'regiao',
+    'UF': 'uf',
+    'ESTACAO': 'nome_estacao',
+    'CODIGO (WMO)': 'estacao',
+    'LATITUDE': 'latitude',
+    'LONGITUDE': 'longitude',
+    'ALTITUDE': 'altitude',
+    'DATA DE FUNDACAO': 'data_fundacao'
+}
+
+# Colunas dos DataFrames de dados preenchidas a partir do cabeçalho
+COLUNAS_DADOS = {
+    'ESTACAO': 'estacao',
+    'NOME_DA_ESTACAO': 'nome_estacao',
+    'UF': 'uf',
+    'REGIAO': 'regiao',
+    'LATITUDE': 'latitude',
+    'LONGITUDE': 'longitude',
+    'ALTITUDE': 'altitude'
+}
+
+COLUNAS_ESTACAO = ['estacao', 'nome_estacao', 'uf', 'regiao', 'latitude', 'longitude', 'altitude', 'data_fundacao']
+
+
+def configured_stations():
+    """
+    Estações a coletar, da variável ESTACOES_COLETA (códigos WMO ou nomes,
+    separados por vírgula). Sem a variável, apenas a estação padrão.
+    """
+    valor = os.environ.get('ESTACOES_COLETA', ESTACAO_PADRAO)
+    return {parte.strip().upper() for parte in valor.split(',') if parte.strip()}
+
+
+def _numero(texto):
+    try:
+        return float(texto.replace(',', '.'))
+    except (AttributeError, ValueError):
+        return None
+
+
+def read_station_header(caminho):
+    """Lê os metadados da estação nas linhas de cabeçalho de um CSV do INMET"""
+    with open(caminho, encoding='latin1') as f:
+        return parse_station_header(f)
+
+
+def parse_station_header(f):
+    """
+    Lê as linhas de cabeçalho de um arquivo já aberto (CSV ou membro de um
+    ZIP), deixando-o posicionado na linha de nomes das colunas
+    """
+    estacao = {}
+    for _ in range(LINHAS_CABECALHO):
+        linha = f.readline()
+        if ':' not in linha:
+            continue
+        rotulo, _, valor = linha.partition(':')
+        rotulo = rotulo.strip().upper()
+        if rotulo.startswith('DATA DE FUNDACAO'):  # alguns anos trazem o formato no rótulo
+            rotulo = 'DATA DE FUNDACAO'
+        campo = CAMPOS_CABECALHO.get(rotulo)
+        if campo:
+            estacao[campo] = valor.strip().strip(';').strip()
+
+    for campo in ('latitude', 'longitude', 'altitude'):
+        estacao[campo] = _numero(estacao.get(campo))
+    fundacao = estacao.get('data_fundacao') or ''
+    fundacao = pd.to_datetime(fundacao, dayfirst='/' in fundacao, errors='coerce')
+    estacao['data_fundacao'] = None if pd.isna(fundacao) else fundacao.date().isoformat()
+    if estacao.get('nome_estacao'):
+        estacao['nome_estacao'] = estacao['nome_estacao'].upper()
+    return estacao
+
+
+def read_headers(diretorio):
+    """Metadados de todas as estações presentes nos CSVs de um diretório"""
+    estacoes = [read_station_header(c) for c in sorted(glob.glob(os.path.join(diretorio, '**', '*.CSV'), recursive=True))]
+    estacoes = [e for e in estacoes if e.get('estacao')]
+    df = pd.DataFrame(estacoes, columns=COLUNAS_ESTACAO)
+    return df.drop_duplicates('estacao', keep='last').reset_index(drop=True)
+
+
+def attach_station(df, estacao):
+    """Completa as colunas de identificação da estação que o CSV não traz nas linhas"""
+    for coluna, campo in COLUNAS_DADOS.items():
+        if coluna not in df.columns:
+            df[coluna] = estacao.get(campo)
+    return df
+
+
+def is_configured(estacao, selecionadas):
+    """Indica se a estação (pelo código ou pelo nome) está entre as configuradas"""
+    return (str(estacao.get('estacao', '')).upper() in selecionadas
+            or str(estacao.get('nome_estacao', '')).upper() in selecionadas)
+
+
+def create_stations_table(cur):
+    """Cria a tabela de estações (uma linha por código WMO)"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS estacoes (
+        estacao VARCHAR(10) PRIMARY KEY,
+        nome_estacao VARCHAR(100) NOT NULL,
+        uf VARCHAR(2),
+        regiao VARCHAR(2),
+        latitude DECIMAL(10, 6),
+        longitude DECIMAL(10, 6),
+        altitude DECIMAL(8, 2),
+        data_fundacao DATE,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+
+
+def upsert_stations(conn, estacoes):
+    """Insere ou atualiza os metadados das estações (DataFrame ou lista de dicionários)"""
+    estacoes = pd.DataFrame(estacoes, columns=COLUNAS_ESTACAO)
+    if estacoes.empty:
+        return 0
+    estacoes = estacoes.astype(object).where(estacoes.notna(), None)
+
+    p = placeholder(conn)
+    cur = conn.cursor()
+    create_stations_table(cur)
+    cur.executemany(f"""
+    INSERT INTO estacoes ({', '.join(COLUNAS_ESTACAO)})
+    VALUES ({', '.join([p] * len(COLUNAS_ESTACAO))})
+    ON CONFLICT (estacao) DO UPDATE SET
+        nome_estacao = EXCLUDED.nome_estacao,
+        uf = EXCLUDED.uf,
+        regiao = EXCLUDED.regiao,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude,
+        altitude = EXCLUDED.altitude,
+        data_fundacao = EXCLUDED.data_fundacao,
+        atualizado_em = CURRENT_TIMESTAMP
+    """, list(estacoes.itertuples(index=False, name=None)))
+    conn.commit()
+    cur.close()
+    return len(estacoes)
+
+
+def load_stations(conn, somente_com_dados=False):
+    """
+    Estações cadastradas, ordenadas pelo nome. Sem a tabela 'estacoes',
+    usa as estações distintas de 'dados_meteorologicos'.
+    """
+    consulta = f"SELECT {', '.join(COLUNAS_ESTACAO[:-1])} FROM estacoes"
+    if somente_com_dados:
+        consulta += " WHERE nome_estacao IN (SELECT DISTINCT nome_estacao FROM dados_meteorologicos)"
+    try:
+        df = pd.read_sql_query(consulta, conn)
+    except Exception:
+        conn.rollback()
+        df = pd.read_sql_query("""
+        SELECT estacao, nome_estacao, MAX(uf) AS uf, MAX(regiao) AS regiao,
+               MAX(latitude) AS latitude, MAX(longitude) AS longitude, MAX(altitude) AS altitude
+        FROM dados_meteorologicos
+        GROUP BY estacao, nome_estacao
+        """, conn)
+
+    for col in ('latitude', 'longitude', 'altitude'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df.sort_values('nome_estacao', ignore_index=True)
+
+
+def build_station_index(estacoes):
+    """BallTree com métrica haversine sobre (lat, lon) em radianos"""
+    estacoes = estacoes.dropna(subset=['latitude', 'longitude']).reset_index(drop=True)
+    arvore = BallTree(np.radians(estacoes[['latitude', 'longitude']].to_numpy()), metric='haversine')
+    return arvore, estacoes
+
+
+def nearest_stations(indice, latitude, longitude, n=5):
+    """As n estações mais próximas de um ponto, com a distância em km"""
+    arvore, estacoes = indice
+    n = min(n, len(estacoes))
+    distancias, posicoes = arvore.query(np.radians([[latitude, longitude]]), k=n)
+    vizinhas = estacoes.iloc[posicoes[0]].copy()
+    vizinhas['distancia_km'] = distancias[0] * RAIO_TERRA_KM
+    return vizinhas.reset_index(drop=True)
+
+
+def neighbors_of(indice, nome_estacao, n=5):
+    """As n estações mais próximas de uma estação cadastrada (excluindo ela própria)"""
+    estacoes = indice[1]
+    linha = estacoes[estacoes['nome_estacao'] == nome_estacao]
+    if linha.empty:
+        return estacoes.iloc[:0].assign(distancia_km=[])
+    vizinhas = nearest_stations(indice, linha['latitude'].iloc[0], linha['longitude'].iloc[0], n + 1)
+    return vizinhas[vizinhas['nome_estacao'] != nome_estacao].head(n).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    import sys
+
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url or len(sys.argv) < 2:
+        print("Uso: DATABASE_URL=... python stations.py <diretório com CSVs do INMET>")
+        sys.exit(1)
+
+    estacoes = read_headers(sys.argv[1])
+    conn = connect(database_url)
+    print(f"{upsert_stations(conn, estacoes)} estações cadastradas")
+    conn.close()
@@ -0,0 +1,318 @@
+import glob
+import io
+import os
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from database import VARIAVEIS
+from stations import parse_station_header
+
+# Linhas lidas por vez de cada CSV (limita a memória por processo)
+LINHAS_POR_BLOCO = 50_000
+
+# Compressão do t-digest: ~COMPRESSAO_DIGEST / 2 centróides por acumulador
+COMPRESSAO_DIGEST = 200
+
+# Valor usado pelo INMET para leitura ausente
+VALOR_AUSENTE = -9999
+
+# Prefixo (sem acentos, em maiúsculas) das colunas horárias do INMET -> variável
+COLUNAS_INMET = {
+    'TEMPERATURA DO AR - BULBO SECO': 'TEMPERATURA_MEDIA',
+    'TEMPERATURA MAXIMA NA HORA ANT': 'TEMPERATURA_MAXIMA',
+    'TEMPERATURA MINIMA NA HORA ANT': 'TEMPERATURA_MINIMA',
+    'UMIDADE RELATIVA DO AR, HORARIA': 'UMIDADE_RELATIVA',
+    'PRECIPITACAO TOTAL': 'PRECIPITACAO',
+    'VENTO, VELOCIDADE HORARIA': 'VELOCIDADE_VENTO',
+    'PRESSAO ATMOSFERICA AO NIVEL DA ESTACAO': 'PRESSAO_ATMOSFERICA'
+}
+
+# Faixa (mínimo, máximo, largura da classe) dos histogramas fixos de cada variável;
+# valores fora da faixa entram na primeira ou na última classe
+FAIXAS_HISTOGRAMA = {
+    'TEMPERATURA_MEDIA': (-10.0, 45.0, 0.5),
+    'TEMPERATURA_MAXIMA': (-10.0, 45.0, 0.5),
+    'TEMPERATURA_MINIMA': (-10.0, 45.0, 0.5),
+    'UMIDADE_RELATIVA': (0.0, 100.0, 1.0),
+    'PRECIPITACAO': (0.0, 100.0, 0.5),
+    'VELOCIDADE_VENTO': (0.0, 30.0, 0.25),
+    'PRESSAO_ATMOSFERICA': (750.0, 1050.0, 1.0)
+}
+
+# Quantis do resumo
+QUANTIS = (0.01, 0.05, 0.5, 0.95, 0.99)
+
+
+def new_accumulator(variavel):
+    """Acumulador de uma passada: Welford, extremos, histograma fixo e t-digest"""
+    inicio, fim, largura = FAIXAS_HISTOGRAMA[variavel]
+    return {
+        'variavel': variavel,
+        'n': 0,
+        'media': 0.0,
+        'm2': 0.0,
+        'minimo': np.inf,
+        'maximo': -np.inf,
+        'histograma': np.zeros(int(round((fim - inicio) / largura)), dtype='int64'),
+        'centroides': (np.empty(0), np.empty(0))
+    }
+
+
+def _k(q, compressao):
+    """Função de escala k1 do t-digest (classes menores nas caudas)"""
+    return compressao / (2 * np.pi) * np.arcsin(2 * q - 1)
+
+
+def digest_compress(medias, pesos, compressao=COMPRESSAO_DIGEST):
+    """
+    Funde centróides ordenados cuja posição na escala k cai na mesma
+    unidade: cada centróide resultante cobre no máximo 1 em k. Vetorizado
+    (ordenação + reduceat), sem laço por ponto.
+    """
+    if len(medias) <= 1:
+        return medias, pesos
+    ordem = np.argsort(medias, kind='mergesort')
+    medias, pesos = medias[ordem], pesos[ordem]
+    q = (np.cumsum(pesos) - pesos / 2) / pesos.sum()
+    classe = np.floor(_k(q, compressao) - _k(0.0, compressao)).astype('int64')
+    inicios = np.flatnonzero(np.diff(np.concatenate([[-1], classe])))
+    soma_pesos = np.add.reduceat(pesos, inicios)
+    return np.add.reduceat(medias * pesos, inicios) / soma_pesos, soma_pesos
+
+
+def merge_accumulators(a, b):
+    """
+    Combina dois acumuladores da mesma variável (fórmula de Chan para média
+    e variância). O resultado é o mesmo que teria uma única passada sobre
+    os dois conjuntos, exceto pela aproximação do t-digest.
+    """
+    if b['n'] == 0:
+        return a
+    if a['n'] == 0:
+        return b
+    n = a['n'] + b['n']
+    delta = b['media'] - a['media']
+    return {
+        'variavel': a['variavel'],
+        'n': n,
+        'media': a['media'] + delta * b['n'] / n,
+        'm2': a['m2'] + b['m2'] + delta ** 2 * a['n'] * b['n'] / n,
+        'minimo': min(a['minimo'], b['minimo']),
+        'maximo': max(a['maximo'], b['maximo']),
+        'histograma': a['histograma'] + b['histograma'],
+        'centroides': digest_compress(
+            np.concatenate([a['centroides'][0], b['centroides'][0]]),
+            np.concatenate([a['centroides'][1], b['centroides'][1]])
+        )
+    }
+
+
+def update_accumulator(acc, valores):
+    """Incorpora um bloco de valores (NaN ignorados) ao acumulador"""
+    valores = np.asarray(valores, dtype='float64')
+    valores = valores[np.isfinite(valores)]
+    if len(valores) == 0:
+        return acc
+
+    inicio, fim, largura = FAIXAS_HISTOGRAMA[acc['variavel']]
+    classes = len(acc['histograma'])
+    posicao = np.clip(((valores - inicio) // largura).astype('int64'), 0, classes - 1)
+    media = valores.mean()
+    bloco = {
+        'variavel': acc['variavel'],
+        'n': len(valores),
+        'media': media,
+        'm2': float(((valores - media) ** 2).sum()),
+        'minimo': valores.min(),
+        'maximo': valores.max(),
+        'histograma': np.bincount(posicao, minlength=classes),
+        'centroides': digest_compress(valores, np.ones(len(valores)))
+    }
+    return merge_accumulators(acc, bloco)
+
+
+def digest_quantile(acc, q):
+    """Quantis aproximados interpolando entre os centros dos centróides"""
+    if acc['n'] == 0:
+        return np.full(np.shape(q), np.nan)
+    medias, pesos = acc['centroides']
+    centros = np.cumsum(pesos) - pesos / 2
+    return np.interp(np.asarray(q) * acc['n'],
+                     np.concatenate([[0.0], centros, [acc['n']]]),
+                     np.concatenate([[acc['minimo']], medias, [acc['maximo']]]))
+
+
+def merge_results(a, b):
+    """Combina resultados parciais (de blocos, arquivos ou processos)"""
+    acumuladores = dict(a['acumuladores'])
+    for chave, acc in b['acumuladores'].items():
+        acumuladores[chave] = merge_accumulators(acumuladores[chave], acc) if chave in acumuladores else acc
+    return {
+        'estacoes': {**a['estacoes'], **b['estacoes']},
+        'acumuladores': acumuladores,
+        'linhas': a['linhas'] + b['linhas'],
+        'arquivos': a['arquivos'] + b['arquivos']
+    }
+
+
+def empty_result():
+    return {'estacoes': {}, 'acumuladores': {}, 'linhas': 0, 'arquivos': 0}
+
+
+def _normalizar(coluna):
+    texto = unicodedata.normalize('NFKD', str(coluna)).encode('ascii', 'ignore').decode()
+    return texto.upper().replace('_', ' ').strip()
+
+
+def column_variable(coluna):
+    """Variável correspondente a uma coluna do CSV (nome original do INMET ou já limpo)"""
+    nome = _normalizar(coluna)
+    if nome.replace(' ', '_') in VARIAVEIS:
+        return nome.replace(' ', '_')
+    for prefixo, variavel in COLUNAS_INMET.items():
+        if nome.startswith(prefixo):
+            return variavel
+    return None
+
+
+def _stream_file(f, linhas_por_bloco):
+    """Acumuladores de um CSV do INMET aberto, lido em blocos de tamanho fixo"""
+    estacao = parse_station_header(f)
+    codigo = estacao.get('estacao') or estacao.get('nome_estacao') or ''
+    resultado = empty_result()
+    resultado['estacoes'][codigo] = estacao.get('nome_estacao')
+    resultado['arquivos'] = 1
+
+    leitor = pd.read_csv(f, sep=';', decimal=',', chunksize=linhas_por_bloco,
+                         usecols=lambda c: column_variable(c) is not None)
+    for bloco in leitor:
+        resultado['linhas'] += len(bloco)
+        for coluna in bloco.columns:
+            variavel = column_variable(coluna)
+            valores = pd.to_numeric(bloco[coluna], errors='coerce').to_numpy(dtype='float64')
+            valores[valores == VALOR_AUSENTE] = np.nan
+            chave = (codigo, variavel)
+            acc = resultado['acumuladores'].get(chave) or new_accumulator(variavel)
+            resultado['acumuladores'][chave] = update_accumulator(acc, valores)
+    return resultado
+
+
+def stream_member(caminho, membro=None, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Acumuladores de um CSV avulso ou de um membro de um ZIP anual do INMET"""
+    if membro is None:
+        with open(caminho, encoding='latin1') as f:
+            return _stream_file(f, linhas_por_bloco)
+    with zipfile.ZipFile(caminho) as arquivo, arquivo.open(membro) as bruto:
+        return _stream_file(io.TextIOWrapper(bruto, encoding='latin1'), linhas_por_bloco)
+
+
+def archive_members(caminhos):
+    """(arquivo, membro) de cada CSV: ZIPs anuais, CSVs avulsos ou diretórios extraídos"""
+    membros = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            arquivos = glob.glob(os.path.join(caminho, '**', '*.CSV'), recursive=True)
+            arquivos += glob.glob(os.path.join(caminho, '**', '*.zip'), recursive=True)
+            membros += archive_members(sorted(arquivos))
+        elif zipfile.is_zipfile(caminho):
+            with zipfile.ZipFile(caminho) as arquivo:
+                membros += [(caminho, nome) for nome in arquivo.namelist() if nome.upper().endswith('.CSV')]
+        else:
+            membros.append((caminho, None))
+    return membros
+
+
+def stream_statistics(caminhos, max_workers=None, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Estatísticas de todas as estações e variáveis dos arquivos do INMET em
+    uma passada e memória fixa: cada processo lê um CSV por vez em blocos
+    e devolve acumuladores parciais, combinados à medida que chegam.
+    """
+    membros = archive_members(caminhos)
+    resultado = empty_result()
+    falhas = {}
+
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(membros), 1))
+    if max_workers == 1:
+        for caminho, membro in membros:
+            try:
+                resultado = merge_results(resultado, stream_member(caminho, membro, linhas_por_bloco))
+            except Exception as e:
+                falhas[f"{caminho}:{membro or ''}"] = str(e)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futuros = {executor.submit(stream_member, caminho, membro, linhas_por_bloco): (caminho, membro)
+                       for caminho, membro in membros}
+            for futuro in as_completed(futuros):
+                caminho, membro = futuros[futuro]
+                try:
+                    resultado = merge_results(resultado, futuro.result())
+                except Exception as e:
+                    falhas[f"{caminho}:{membro or ''}"] = str(e)
+
+    resultado['falhas'] = falhas
+    return resultado
+
+
+def summarize(acumuladores, estacoes=None, quantis=QUANTIS):
+    """Uma linha por chave (estação, variável) com n, média, desvio, extremos e quantis"""
+    linhas = []
+    for (codigo, variavel), acc in sorted(acumuladores.items(), key=lambda item: (str(item[0][0]), item[0][1])):
+        linha = {
+            'estacao': codigo,
+            'nome_estacao': (estacoes or {}).get(codigo),
+            'variavel': variavel,
+            'n': acc['n'],
+            'media': acc['media'] if acc['n'] else np.nan,
+            'desvio': np.sqrt(acc['m2'] / (acc['n'] - 1)) if acc['n'] > 1 else np.nan,
+            'minimo': acc['minimo'] if acc['n'] else np.nan,
+            'maximo': acc['maximo'] if acc['n'] else np.nan
+        }
+        for q, valor in zip(quantis, digest_quantile(acc, quantis)):
+            linha[f'p{int(round(q * 100)):02d}'] = valor
+        linhas.append(linha)
+    return pd.DataFrame(linhas)
+
+
+def national_accumulators(acumuladores):
+    """Acumuladores por variável combinando todas as estações"""
+    nacionais = {}
+    for (_, variavel), acc in acumuladores.items():
+        chave = ('BRASIL', variavel)
+        nacionais[chave] = merge_accumulators(nacionais[chave], acc) if chave in nacionais else acc
+    return nacionais
+
+
+def histogram_frame(acc):
+    """Histograma fixo de um acumulador como DataFrame (limite inferior, contagem)"""
+    inicio, _, largura = FAIXAS_HISTOGRAMA[acc['variavel']]
+    return pd.DataFrame({
+        'inicio': inicio + largura * np.arange(len(acc['histograma'])),
+        'contagem': acc['histograma']
+    })
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Estatísticas em streaming sobre os arquivos do INMET")
+    parser.add_argument('caminhos', nargs='+', help="ZIPs anuais, CSVs ou diretórios extraídos")
+    parser.add_argument('--processos', type=int, help="processos de leitura (padrão: núcleos)")
+    parser.add_argument('--bloco', type=int, default=LINHAS_POR_BLOCO, help="linhas lidas por vez")
+    parser.add_argument('--saida', help="CSV com o resumo por estação e variável")
+    args = parser.parse_args()
+
+    resultado = stream_statistics(args.caminhos, args.processos, args.bloco)
+    print(f"{resultado['arquivos']} arquivos, {resultado['linhas']} linhas, "
+          f"{len(resultado['estacoes'])} estações")
+    for arquivo, erro in resultado['falhas'].items():
+        print(f"Erro em {arquivo}: {erro}")
+
+    print(summarize(national_accumulators(resultado['acumuladores'])).drop(columns='nome_estacao').to_string(index=False))
+    if args.saida:
+        summarize(resultado['acumuladores'], resultado['estacoes']).to_csv(args.saida, index=False)
+        print(f"Resumo por estação salvo em {args.saida}")
@@ -0,0 +1,176 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory, util
+
+import numpy as np
+import pandas as pd
+
+from database import connect, get_data_watermark, load_weather_data
+from forecasting import fit_series_classifier, fit_series_forecaster
+from model_registry import save_artifact
+
+# Alvos treinados para cada estação. OCORRENCIA_PRECIPITACAO é derivado
+# de PRECIPITACAO (1 se choveu ao menos LIMIAR_CHUVA mm no dia) e é
+# treinado como classificação.
+ALVOS = [
+    'TEMPERATURA_MEDIA',
+    'UMIDADE_RELATIVA',
+    'OCORRENCIA_PRECIPITACAO',
+    'VELOCIDADE_VENTO',
+    'PRESSAO_ATMOSFERICA'
+]
+LIMIAR_CHUVA = 1.0
+ALVOS_BINARIOS = ('OCORRENCIA_PRECIPITACAO',)
+
+# Estado de cada worker: o cubo compartilhado é anexado uma única vez
+_SHM = None
+_CUBO = None
+
+
+def build_cube(df, alvos=ALVOS):
+    """
+    Monta o cubo denso data × estação × alvo (float64, NaN onde falta dado)
+    sobre um calendário diário contínuo comum a todas as estações.
+    """
+    df = df.dropna(subset=['DATA'])
+    if 'OCORRENCIA_PRECIPITACAO' in alvos:
+        chuva = df['PRECIPITACAO']
+        df = df.assign(OCORRENCIA_PRECIPITACAO=(chuva >= LIMIAR_CHUVA).astype('float64').where(chuva.notna()))
+
+    estacoes = sorted(df['NOME_DA_ESTACAO'].dropna().unique())
+    calendario = pd.date_range(df['DATA'].min(), df['DATA'].max(), freq='D')
+
+    agrupado = df.groupby(['DATA', 'NOME_DA_ESTACAO'])[list(alvos)].mean()
+    indice = pd.MultiIndex.from_product([calendario, estacoes], names=['DATA', 'NOME_DA_ESTACAO'])
+    valores = agrupado.reindex(indice).to_numpy(dtype='float64')
+    cubo = valores.reshape(len(calendario), len(estacoes), len(alvos))
+    return cubo, calendario, estacoes
+
+
+def _anexar_cubo(nome, shape):
+    """Inicializador do worker: mapeia o cubo da memória compartilhada (sem cópia)"""
+    global _SHM, _CUBO
+    _SHM = shared_memory.SharedMemory(name=nome)
+    _CUBO = np.ndarray(shape, dtype='float64', buffer=_SHM.buf)
+    # Fecha o mapeamento quando o worker termina (o processo principal faz o unlink)
+    util.Finalize(None, _desanexar_cubo, exitpriority=10)
+
+
+def _desanexar_cubo():
+    """Solta a visão do cubo e fecha a memória compartilhada do worker"""
+    global _SHM, _CUBO
+    _CUBO = None
+    if _SHM is not None:
+        _SHM.close()
+        _SHM = None
+
+
+def _treinar_tarefa(i_estacao, j_alvo, inicio, alvo):
+    """Treina o previsor de um par (estação, alvo) lendo direto do cubo"""
+    calendario = pd.date_range(inicio, periods=_CUBO.shape[0], freq='D')
+    serie = pd.Series(_CUBO[:, i_estacao, j_alvo], index=calendario, name=alvo)
+
+    # Recorta o período em que a estação tem dados
+    observados = np.flatnonzero(np.isfinite(serie.to_numpy()))
+    if len(observados) == 0:
+        return i_estacao, j_alvo, None
+    serie = serie.iloc[observados[0]:observados[-1] + 1]
+
+    try:
+        if alvo in ALVOS_BINARIOS:
+            model, brier, acuracia, X_test, y_test, y_pred = fit_series_classifier(serie)
+            metricas = {'brier': float(brier), 'acuracia': float(acuracia)}
+        else:
+            model, mse, r2, X_test, y_test, y_pred = fit_series_forecaster(serie)
+            metricas = {'mse': float(mse), 'r2': float(r2)}
+    except ValueError:
+        return i_estacao, j_alvo, None
+
+    metricas['n_teste'] = int(len(y_test))
+    metricas['n_total'] = int(len(observados))
+    resultado = {
+        'modelo': pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL),
+        'metricas': metricas,
+        'y_test': y_test,
+        'y_pred': y_pred
+    }
+    return i_estacao, j_alvo, resultado
+
+
+def train_fleet(df, alvos=ALVOS, max_workers=None):
+    """
+    Treina um modelo por (estação, alvo) em um pool de processos. Os dados
+    ficam em um único bloco de memória compartilhada que os workers anexam;
+    cada tarefa envia apenas índices, não DataFrames.
+
+    Retorna {(estacao, alvo): resultado}.
+    """
+    cubo, calendario, estacoes = build_cube(df, alvos)
+    tarefas = [(i, j) for i in range(len(estacoes)) for j in range(len(alvos))]
+    max_workers = min(max_workers or os.cpu_count() or 1, max(len(tarefas), 1))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(cubo.nbytes, 1))
+    try:
+        compartilhado = np.ndarray(cubo.shape, dtype='float64', buffer=shm.buf)
+        compartilhado[:] = cubo
+        del cubo
+
+        resultados = {}
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_anexar_cubo,
+                                 initargs=(shm.name, compartilhado.shape)) as executor:
+            futuros = [
+                executor.submit(_treinar_tarefa, i, j, calendario[0], alvos[j])
+                for i, j in tarefas
+            ]
+            for futuro in as_completed(futuros):
+                i, j, resultado = futuro.result()
+                if resultado is not None:
+                    resultados[(estacoes[i], alvos[j])] = resultado
+        del compartilhado
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return resultados
+
+
+def train_and_register_fleet(conn, alvos=ALVOS, max_workers=None):
+    """Treina toda a frota de modelos e registra os artefatos na marca d'água atual"""
+    watermark = get_data_watermark(conn)
+    colunas = ['NOME_DA_ESTACAO'] + [a for a in alvos if a != 'OCORRENCIA_PRECIPITACAO']
+    if 'OCORRENCIA_PRECIPITACAO' in alvos and 'PRECIPITACAO' not in colunas:
+        colunas.append('PRECIPITACAO')
+    df = load_weather_data(conn, nome_estacao=None, colunas=colunas)
+
+    resultados = train_fleet(df, alvos, max_workers)
+    for (estacao, alvo), resultado in resultados.items():
+        save_artifact(
+            conn,
+            watermark,
+            pickle.loads(resultado['modelo']),
+            resultado['metricas'],
+            resultado['y_test'],
+            resultado['y_pred'],
+            nome_estacao=estacao,
+            target=alvo
+        )
+    return resultados
+
+
+if __name__ == "__main__":
+    database_url = os.environ.get('DATABASE_URL')
+
+    if not database_url:
+        print("Por favor, defina a variável de ambiente DATABASE_URL")
+    else:
+        conn = connect(database_url)
+        resultados = train_and_register_fleet(conn)
+        conn.close()
+        for (estacao, alvo), resultado in sorted(resultados.items()):
+            metricas = resultado['metricas']
+            if alvo in ALVOS_BINARIOS:
+                print(f"{estacao} / {alvo}: Brier = {metricas['brier']:.3f}, acurácia = {metricas['acuracia']:.3f}")
+            else:
+                print(f"{estacao} / {alvo}: R² = {metricas['r2']:.3f}")
+        print(f"{len(resultados)} modelos registrados")
@@ -0,0 +1,232 @@
+import io
+import json
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from anomalies import day_of_year_365
+from database import VARIAVEIS, load_weather_data, placeholder, station_coverage
+
+# Dias por linha da matriz (29/02 fica à parte, em 'bissexto')
+DIAS_ANO = 365
+
+# Percentis do envelope climatológico
+PERCENTIS_ENVELOPE = (5, 25, 50, 75, 95)
+
+
+def empty_matrix():
+    """Matriz sem nenhum ano"""
+    return {'anos': np.empty(0, dtype='int64'), 'valores': np.empty((0, DIAS_ANO)),
+            'mascara': np.empty((0, DIAS_ANO), bool), 'bissexto': np.empty(0)}
+
+
+def year_day_matrix(df, variavel):
+    """
+    Reorganiza a série em uma matriz densa ano × dia do ano (365 colunas).
+    Leituras do mesmo dia são promediadas; dias sem dado ficam NaN e
+    'mascara' marca as células observadas. O 29 de fevereiro não ocupa
+    coluna: fica em 'bissexto' (um valor por ano, NaN nos demais).
+    """
+    df = df.dropna(subset=['DATA', variavel])
+    if df.empty:
+        return empty_matrix()
+
+    datas = pd.DatetimeIndex(df['DATA'])
+    x = df[variavel].to_numpy(dtype='float64')
+    anos = np.arange(datas.year.min(), datas.year.max() + 1)
+    linha = datas.year.to_numpy() - anos[0]
+    fevereiro_29 = (datas.month == 2) & (datas.day == 29)
+    coluna = day_of_year_365(datas)
+
+    soma = np.zeros((len(anos), DIAS_ANO))
+    contagem = np.zeros((len(anos), DIAS_ANO))
+    np.add.at(soma, (linha[~fevereiro_29], coluna[~fevereiro_29]), x[~fevereiro_29])
+    np.add.at(contagem, (linha[~fevereiro_29], coluna[~fevereiro_29]), 1)
+
+    soma_29 = np.bincount(linha[fevereiro_29], weights=x[fevereiro_29], minlength=len(anos))
+    contagem_29 = np.bincount(linha[fevereiro_29], minlength=len(anos))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        valores = soma / contagem
+        bissexto = soma_29 / contagem_29
+
+    return {'anos': anos, 'valores': valores, 'mascara': contagem > 0, 'bissexto': bissexto}
+
+
+def set_year_row(matriz, ano, linha):
+    """Substitui (ou acrescenta) a linha de um ano, mantendo os anos contíguos"""
+    anos = matriz['anos']
+    novos = np.arange(anos.min(initial=ano), anos.max(initial=ano) + 1)
+    valores = np.full((len(novos), DIAS_ANO), np.nan)
+    bissexto = np.full(len(novos), np.nan)
+    valores[anos - novos[0]] = matriz['valores']
+    bissexto[anos - novos[0]] = matriz['bissexto']
+
+    # 'linha' é a matriz de um único ano (vazia se o ano ficou sem dado)
+    observado = len(linha['anos']) > 0
+    valores[ano - novos[0]] = linha['valores'][0] if observado else np.nan
+    bissexto[ano - novos[0]] = linha['bissexto'][0] if observado else np.nan
+    return {'anos': novos, 'valores': valores, 'mascara': np.isfinite(valores), 'bissexto': bissexto}
+
+
+def _matrix_matches(matriz, ano, observados):
+    """A matriz gravada tem, antes de 'ano', tantos dias com valor quanto o banco?"""
+    anteriores = matriz['anos'] < ano
+    dias = np.isfinite(matriz['valores'][anteriores]).sum() + np.isfinite(matriz['bissexto'][anteriores]).sum()
+    return int(dias) == observados
+
+
+def refresh_year_matrices(conn, nome_estacao, desde, variaveis=VARIAVEIS):
+    """
+    Atualiza as matrizes da estação recalculando só os anos a partir do
+    ano de 'desde', lendo um ano de dados por vez. Variáveis sem matriz
+    gravada, ou cuja matriz não bate com as contagens do banco nos anos
+    anteriores (carga feita fora do coletor), são refeitas desde o primeiro
+    ano, também ano a ano. Retorna as matrizes gravadas.
+    """
+    desde = pd.Timestamp(pd.Timestamp(desde).year, 1, 1)
+    cobertura = station_coverage(conn, nome_estacao, antes=desde, variaveis=variaveis)
+    ultimo = station_coverage(conn, nome_estacao, variaveis=variaveis)['ultimo']
+    if ultimo is None:
+        return {}
+
+    matrizes, refazer = {}, set()
+    for var in variaveis:
+        matriz = load_year_matrix(conn, nome_estacao, var)
+        if matriz is None or not _matrix_matches(matriz, desde.year, cobertura['observados'][var]):
+            matriz = empty_matrix()
+            refazer.add(var)
+        matrizes[var] = matriz
+
+    primeiro_ano = cobertura['primeiro'].year if refazer and cobertura['primeiro'] is not None else desde.year
+    for ano in range(primeiro_ano, ultimo.year + 1):
+        atualizar = variaveis if ano >= desde.year else [var for var in variaveis if var in refazer]
+        janela = load_weather_data(conn, nome_estacao=nome_estacao, inicio=f'{ano}-01-01',
+                                   fim=f'{ano}-12-31', colunas=atualizar)
+        for var in atualizar:
+            matrizes[var] = set_year_row(matrizes[var], ano, year_day_matrix(janela, var))
+
+    save_year_matrices(conn, nome_estacao, matrizes)
+    return matrizes
+
+
+def day_dates(ano):
+    """Datas do ano correspondentes às 365 colunas (sem 29/02)"""
+    datas = pd.date_range(f'{ano}-01-01', f'{ano}-12-31', freq='D')
+    return datas[~((datas.month == 2) & (datas.day == 29))]
+
+
+def climatology_envelope(matriz, ano, percentis=PERCENTIS_ENVELOPE):
+    """
+    Envelope climatológico dos outros anos e posição do ano escolhido, por
+    dia do ano. Percentis, recordes e posição saem de reduções ao longo do
+    eixo dos anos, sem filtrar a série ano a ano.
+    """
+    anos = matriz['anos']
+    valores = matriz['valores']
+    atual = valores[anos == ano][0] if ano in anos else np.full(DIAS_ANO, np.nan)
+    anos_referencia = anos[anos != ano]
+    referencia = valores[anos != ano]
+    if len(referencia) == 0:
+        anos_referencia, referencia = np.zeros(1, dtype='int64'), np.full((1, DIAS_ANO), np.nan)
+
+    finito = np.isfinite(referencia)
+    validos = finito.sum(axis=0)
+    tem_dado = validos > 0
+
+    envelope = pd.DataFrame({'DATA': day_dates(ano), 'DIA': np.arange(DIAS_ANO)})
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # dias sem nenhum ano observado
+        for p, valor in zip(percentis, np.nanpercentile(referencia, percentis, axis=0)):
+            envelope[f'P{p:02d}'] = valor
+        envelope['MEDIA'] = np.nanmean(referencia, axis=0)
+        envelope['RECORDE_MAXIMO'] = np.nanmax(referencia, axis=0)
+        envelope['RECORDE_MINIMO'] = np.nanmin(referencia, axis=0)
+
+    # Ano de cada recorde (anos sem dado no dia não concorrem)
+    maximo = np.argmax(np.where(finito, referencia, -np.inf), axis=0)
+    minimo = np.argmin(np.where(finito, referencia, np.inf), axis=0)
+    envelope['ANO_RECORDE_MAXIMO'] = pd.Series(anos_referencia[maximo]).where(tem_dado).astype('Int64')
+    envelope['ANO_RECORDE_MINIMO'] = pd.Series(anos_referencia[minimo]).where(tem_dado).astype('Int64')
+
+    envelope['ATUAL'] = atual
+    with np.errstate(invalid='ignore', divide='ignore'):
+        envelope['PERCENTIL_ATUAL'] = np.where(
+            np.isfinite(atual) & tem_dado,
+            100 * (referencia < atual[None, :]).sum(axis=0) / validos,
+            np.nan
+        )
+    envelope['ANOS_NA_REFERENCIA'] = validos
+    return envelope
+
+
+def _to_bytes(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def _from_bytes(dados):
+    return np.load(io.BytesIO(bytes(dados)), allow_pickle=False)
+
+
+def create_year_matrix_table(cur):
+    """Cria a tabela com as matrizes ano × dia do ano geradas na ingestão"""
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS matrizes_anuais (
+        estacao VARCHAR(100) NOT NULL,
+        variavel VARCHAR(50) NOT NULL,
+        anos TEXT NOT NULL,
+        valores BYTEA NOT NULL,
+        bissexto BYTEA NOT NULL,
+        atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (estacao, variavel)
+    );
+    """)
+
+
+def save_year_matrices(conn, nome_estacao, matrizes):
+    """Substitui as matrizes da estação (uma linha por variável)"""
+    p = placeholder(conn)
+    linhas = [
+        (nome_estacao, var, json.dumps(m['anos'].tolist()), _to_bytes(m['valores']), _to_bytes(m['bissexto']))
+        for var, m in matrizes.items()
+    ]
+    cur = conn.cursor()
+    create_year_matrix_table(cur)
+    cur.execute(f"DELETE FROM matrizes_anuais WHERE estacao = {p}", (nome_estacao,))
+    cur.executemany(f"""
+    INSERT INTO matrizes_anuais (estacao, variavel, anos, valores, bissexto)
+    VALUES ({p}, {p}, {p}, {p}, {p})
+    """, linhas)
+    conn.commit()
+    cur.close()
+    return len(linhas)
+
+
+def load_year_matrix(conn, nome_estacao, variavel):
+    """Matriz gravada na última ingestão da estação (None se não houver)"""
+    p = placeholder(conn)
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+        SELECT anos, valores, bissexto FROM matrizes_anuais
+        WHERE estacao = {p} AND variavel = {p}
+        """, (nome_estacao, variavel))
+        row = cur.fetchone()
+    except Exception:
+        conn.rollback()
+        row = None
+    finally:
+        cur.close()
+
+    if row is None:
+        return None
+    anos, valores, bissexto = row
+    valores = _from_bytes(valores)
+    return {
+        'anos': np.asarray(json.loads(anos), dtype='int64'),
+        'valores': valores,
+        'mascara': np.isfinite(valores),
+        'bissexto': _from_bytes(bissexto)
+    }